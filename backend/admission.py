@@ -0,0 +1,267 @@
+"""Admission control: per-class concurrency limits, reserved checkout capacity
+and fast 503s when the worker is saturated"""
+
+from typing import List, Optional, Dict, Any, Deque, Tuple
+from collections import deque
+import os
+import re
+import math
+import asyncio
+import logging
+import orjson
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Requests in flight per worker, of which CHECKOUT_RESERVED_CONCURRENCY slots
+# only checkout may use, so a flood of other traffic can't take the last slot
+ADMISSION_CAPACITY = int(os.environ.get('ADMISSION_CAPACITY', '64'))
+CHECKOUT_RESERVED_CONCURRENCY = int(os.environ.get('CHECKOUT_RESERVED_CONCURRENCY', '16'))
+STANDARD_CONCURRENCY = int(os.environ.get('STANDARD_CONCURRENCY', '48'))
+STANDARD_QUEUE_SIZE = int(os.environ.get('STANDARD_QUEUE_SIZE', '128'))
+STANDARD_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('STANDARD_QUEUE_TIMEOUT_SECONDS', '5'))
+BACKOFFICE_CONCURRENCY = int(os.environ.get('BACKOFFICE_CONCURRENCY', '4'))
+BACKOFFICE_QUEUE_SIZE = int(os.environ.get('BACKOFFICE_QUEUE_SIZE', '32'))
+BACKOFFICE_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('BACKOFFICE_QUEUE_TIMEOUT_SECONDS', '10'))
+CHECKOUT_QUEUE_SIZE = int(os.environ.get('CHECKOUT_QUEUE_SIZE', '256'))
+CHECKOUT_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('CHECKOUT_QUEUE_TIMEOUT_SECONDS', '3'))
+# Logins get a small class of their own: a password-guessing burst can't crowd
+# out other traffic, and other traffic can't starve logins. Attempts the login
+# throttle slows down wait before admission (LoginPacingMiddleware), not in a slot.
+LOGIN_CONCURRENCY = int(os.environ.get('LOGIN_CONCURRENCY', '8'))
+LOGIN_QUEUE_SIZE = int(os.environ.get('LOGIN_QUEUE_SIZE', '64'))
+LOGIN_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LOGIN_QUEUE_TIMEOUT_SECONDS', '5'))
+
+# Load signals: the event loop running late and operations waiting for a pooled
+# connection. Above either target the shed classes' limits back off by half per
+# sample and grow back a step at a time once both are under target again.
+ADMISSION_SAMPLE_SECONDS = float(os.environ.get('ADMISSION_SAMPLE_SECONDS', '0.25'))
+LOOP_LAG_TARGET_MS = float(os.environ.get('LOOP_LAG_TARGET_MS', '50'))
+POOL_WAIT_TARGET_MS = float(os.environ.get('POOL_WAIT_TARGET_MS', '50'))
+ADMISSION_MIN_SCALE = 0.1
+ADMISSION_RECOVERY_STEP = 0.05
+
+CHECKOUT = "checkout"
+LOGIN = "login"
+STANDARD = "standard"
+BACKOFFICE = "backoffice"
+
+# First match wins; None matches any method. Unmatched /api routes are standard.
+ROUTE_CLASS_RULES: List[Tuple[Optional[set], re.Pattern, Optional[str]]] = [
+    # Never queued: probes, metrics and long-lived streams
+    (None, re.compile(r"/api/(health|metrics/.*|alerts/low-stock/stream)"), None),
+    ({"POST"}, re.compile(r"/api/sales(/enhanced)?"), CHECKOUT),
+    ({"POST"}, re.compile(r"/api/auth/login"), LOGIN),
+    (None, re.compile(r"/api/(analytics|expenses|reports|audit)(/.*)?"), BACKOFFICE),
+    ({"GET"}, re.compile(r"/api/sales/exhibition/[^/]+"), BACKOFFICE),
+    ({"GET"}, re.compile(r"/api/products/export"), BACKOFFICE),
+    ({"POST"}, re.compile(r"/api/products/import"), BACKOFFICE),
+]
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if not path.startswith("/api/"):
+        return None
+    for methods, pattern, name in ROUTE_CLASS_RULES:
+        if (methods is None or method in methods) and pattern.fullmatch(path):
+            return name
+    return STANDARD
+
+class RouteClass:
+    """Concurrency limit, bounded FIFO queue and queue deadline for one class"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float,
+                 reserved: bool = False, shed: bool = True):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.reserved = reserved  # May use the slots held back for checkout
+        self.shed = shed          # Limits shrink under load
+        self.running = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+class AdmissionController:
+    """Decides per request whether it runs now, waits its turn or gets a 503.
+
+    A request runs when its class is under its limit and the worker has a free
+    slot outside the checkout reserve (checkout may use the reserve). Otherwise
+    it waits in its class queue until a slot frees up or the queue deadline
+    passes; a full queue is turned away at once. Freed slots go to waiting
+    checkout requests first.
+    """
+
+    def __init__(self, capacity: int, reserved: int, classes: List[RouteClass]):
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self.classes = {route.name: route for route in classes}
+        self.running = 0
+        self.scale = 1.0
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def limit(self, route: RouteClass) -> int:
+        return max(1, int(route.limit * self.scale)) if route.shed else route.limit
+
+    def queue_limit(self, route: RouteClass) -> int:
+        return max(1, int(route.queue_size * self.scale)) if route.shed else route.queue_size
+
+    def can_run(self, route: RouteClass) -> bool:
+        if route.running >= self.limit(route):
+            return False
+        free = self.capacity - self.running
+        return free > (0 if route.reserved else self.reserved)
+
+    def start_running(self, route: RouteClass):
+        route.running += 1
+        route.stats["admitted"] += 1
+        self.running += 1
+
+    async def admit(self, route: RouteClass) -> bool:
+        if not route.waiters and self.can_run(route):
+            self.start_running(route)
+            return True
+        if len(route.waiters) >= self.queue_limit(route):
+            route.stats["rejected"] += 1
+            return False
+        route.stats["queued"] += 1
+        turn = asyncio.get_running_loop().create_future()
+        route.waiters.append(turn)
+        try:
+            await asyncio.wait_for(turn, route.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            route.stats["timed_out"] += 1
+            return False
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot granted as it was leaving
+            if turn.done() and not turn.cancelled():
+                self.release(route)
+            raise
+        finally:
+            if not turn.done():
+                turn.cancel()
+            if turn in route.waiters:
+                route.waiters.remove(turn)
+                # Whoever was queued behind it may be able to run now
+                self.wake()
+
+    def release(self, route: RouteClass):
+        route.running -= 1
+        self.running -= 1
+        self.wake()
+
+    def wake(self):
+        for route in sorted(self.classes.values(), key=lambda route: not route.reserved):
+            while route.waiters and self.can_run(route):
+                turn = route.waiters.popleft()
+                if turn.done():  # Timed out or cancelled while queued
+                    continue
+                self.start_running(route)
+                turn.set_result(True)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.sample_load())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def sample_load(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(ADMISSION_SAMPLE_SECONDS)
+            lag = max(0.0, loop.time() - started - ADMISSION_SAMPLE_SECONDS)
+            self.loop_lag = 0.7 * self.loop_lag + 0.3 * lag
+            self.pool_wait = 0.7 * self.pool_wait + 0.3 * db.pool_wait.take_max()
+            self.adjust()
+
+    def adjust(self):
+        overloaded = (self.loop_lag * 1000 > LOOP_LAG_TARGET_MS
+                      or self.pool_wait * 1000 > POOL_WAIT_TARGET_MS)
+        previous = self.scale
+        if overloaded:
+            self.scale = max(ADMISSION_MIN_SCALE, self.scale * 0.5)
+        else:
+            self.scale = min(1.0, self.scale + ADMISSION_RECOVERY_STEP)
+        if self.scale < previous and previous == 1.0:
+            logger.warning(
+                "Shedding load: loop lag %.0fms, pool wait %.0fms",
+                self.loop_lag * 1000, self.pool_wait * 1000
+            )
+        elif self.scale > previous:
+            self.wake()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "reserved_for_checkout": self.reserved,
+            "running": self.running,
+            "scale": round(self.scale, 3),
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "pool_wait_ms": round(self.pool_wait * 1000, 1),
+            "classes": {
+                name: {
+                    "limit": self.limit(route),
+                    "running": route.running,
+                    "waiting": len(route.waiters),
+                    **route.stats
+                }
+                for name, route in self.classes.items()
+            }
+        }
+
+admission = AdmissionController(ADMISSION_CAPACITY, CHECKOUT_RESERVED_CONCURRENCY, [
+    RouteClass(CHECKOUT, ADMISSION_CAPACITY, CHECKOUT_QUEUE_SIZE, CHECKOUT_QUEUE_TIMEOUT_SECONDS, reserved=True, shed=False),
+    RouteClass(LOGIN, LOGIN_CONCURRENCY, LOGIN_QUEUE_SIZE, LOGIN_QUEUE_TIMEOUT_SECONDS),
+    RouteClass(STANDARD, STANDARD_CONCURRENCY, STANDARD_QUEUE_SIZE, STANDARD_QUEUE_TIMEOUT_SECONDS),
+    RouteClass(BACKOFFICE, BACKOFFICE_CONCURRENCY, BACKOFFICE_QUEUE_SIZE, BACKOFFICE_QUEUE_TIMEOUT_SECONDS),
+])
+
+class AdmissionMiddleware:
+    """ASGI middleware that holds an admission slot until the response is
+    fully sent, so streamed exports count for as long as they stream."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+        route = self.controller.classes[name]
+        if not await self.controller.admit(route):
+            return await self.reject(route, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route)
+
+    async def reject(self, route: RouteClass, send):
+        body = orjson.dumps({"detail": f"Server busy ({route.name}), try again shortly"})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(route.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,148 @@
+"""Append-only audit trail, written in batches off the request path"""
+
+from fastapi import Request
+from pymongo.errors import BulkWriteError
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+import uuid
+import os
+import logging
+import asyncio
+import orjson
+
+from config import TRUSTED_PROXY_HOPS
+from database import db
+from models import AuditAction, CurrentUser
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 1.0
+AUDIT_ENQUEUE_TIMEOUT_SECONDS = 2.0
+AUDIT_WRITE_ATTEMPTS = 3
+
+class AuditLog:
+    """Buffers audit events in memory and writes them to audit_log in batches.
+
+    When the buffer is full, record() waits for the writer (backpressure) and,
+    past a timeout, writes the event itself so it is never dropped.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_seconds: float):
+        self.queue_size = queue_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        # The queue binds to the loop that first waits on it; start on a fresh
+        # one for this loop, carrying over anything recorded before startup
+        buffered = self._drain_all()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        for event in buffered:
+            self.queue.put_nowait(event)
+        self.task = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        """Flush everything still buffered, then stop the writer"""
+        if self.task:
+            await self.queue.put(None)  # Wakes the writer, which flushes its batch and exits
+            await self.task
+            self.task = None
+        while not self.queue.empty():
+            await self._write(self._drain())
+
+    async def record(self, action: AuditAction, actor: Optional[CurrentUser] = None, target_id: Optional[str] = None,
+                     details: Optional[Dict[str, Any]] = None, actor_name: Optional[str] = None,
+                     ip: Optional[str] = None):
+        event = {
+            "id": str(uuid.uuid4()),
+            "action": action.value,
+            "actor_id": actor.id if actor else None,
+            "actor_name": actor.username if actor else actor_name,
+            "target_id": target_id,
+            "details": details or {},
+            "ip": ip,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            self.queue.put_nowait(event)
+            return
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self.queue.put(event), AUDIT_ENQUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Audit buffer full, writing %s event inline", action.value)
+            await self._write([event])
+
+    def _drain_all(self) -> List[Dict[str, Any]]:
+        events = []
+        while not self.queue.empty():
+            event = self.queue.get_nowait()
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            event = await self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        for attempt in range(1, AUDIT_WRITE_ATTEMPTS + 1):
+            try:
+                await db.audit_log.insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Duplicate ids are events a failed attempt already stored
+                if all(error["code"] == 11000 for error in e.details.get("writeErrors", [])):
+                    return
+                logger.warning("Audit batch write failed (attempt %d): %s", attempt, e)
+            except Exception as e:
+                logger.warning("Audit batch write failed (attempt %d): %s", attempt, e)
+            await asyncio.sleep(attempt)
+        for event in batch:
+            logger.error("Audit event lost: %s", orjson.dumps(event, default=str).decode())
+
+audit_log = AuditLog(AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS)
+
+def client_ip(request: Request) -> Optional[str]:
+    """The caller's address as seen by the outermost trusted proxy.
+
+    Entries left of that one in X-Forwarded-For are client-supplied and
+    could be anything, so they are never used.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else None
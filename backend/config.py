@@ -0,0 +1,38 @@
+"""Environment-driven settings shared by the backend modules"""
+
+from dotenv import load_dotenv
+import os
+from pathlib import Path
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Security configuration
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    raise ValueError("SECRET_KEY environment variable must be set for production security")
+
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 hours for POS system
+# "stateless" authorizes from the token claims; "lookup" reads the user on every request
+AUTH_MODE = os.environ.get('AUTH_MODE', 'stateless')
+AUTH_REVOCATION_REFRESH_SECONDS = float(os.environ.get('AUTH_REVOCATION_REFRESH_SECONDS', '15'))
+# Login throttling: failures per sliding window before a key is locked out
+LOGIN_WINDOW_SECONDS = float(os.environ.get('LOGIN_WINDOW_SECONDS', '300'))
+LOGIN_USER_MAX_FAILURES = int(os.environ.get('LOGIN_USER_MAX_FAILURES', '5'))
+LOGIN_IP_MAX_FAILURES = int(os.environ.get('LOGIN_IP_MAX_FAILURES', '20'))
+LOGIN_LOCKOUT_SECONDS = float(os.environ.get('LOGIN_LOCKOUT_SECONDS', '30'))
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.environ.get('LOGIN_LOCKOUT_MAX_SECONDS', '3600'))
+# A client address past its failure limit is slowed down, never locked out: many
+# legitimate users can share one (NAT, venue Wi-Fi). The delay doubles per lockout.
+LOGIN_IP_DELAY_SECONDS = float(os.environ.get('LOGIN_IP_DELAY_SECONDS', '0.5'))
+LOGIN_IP_MAX_DELAY_SECONDS = float(os.environ.get('LOGIN_IP_MAX_DELAY_SECONDS', '4'))
+# Attempts from one slowed-down address allowed to wait out their delay at once;
+# further ones are answered 429 with Retry-After
+LOGIN_IP_MAX_WAITING = int(os.environ.get('LOGIN_IP_MAX_WAITING', '2'))
+# Reverse proxies in front of the app, each appending the address it saw to
+# X-Forwarded-For; 0 ignores the header and uses the socket peer
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+# "memory" throttles per worker; "mongo" shares failure counts and lockouts across workers
+LOGIN_THROTTLE_BACKEND = os.environ.get('LOGIN_THROTTLE_BACKEND', 'memory')
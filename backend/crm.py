@@ -0,0 +1,230 @@
+"""Customer profiles and exhibition leads"""
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+import uuid
+import re
+
+from database import db
+from models import EnhancedSale, LeadCreate, LeadStatus
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Canonical phone key: '+' and digits only, with a 00 prefix read as '+'"""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", phone)
+    if not digits:
+        return None
+    if phone.strip().startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    return digits
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email or not email.strip():
+        return None
+    return email.strip().lower()
+
+def lead_keys(exhibition_id: str, phone: Optional[str], email: Optional[str]) -> List[Dict[str, Any]]:
+    """Filters for an exhibition's lead by normalized key, phone before email"""
+    keys = []
+    if phone:
+        keys.append({"exhibition_id": exhibition_id, "phone_normalized": phone})
+    if email:
+        keys.append({"exhibition_id": exhibition_id, "email_normalized": email})
+    return keys
+
+async def find_lead(exhibition_id: str, phone: Optional[str], email: Optional[str],
+                    projection: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The lead a contact belongs to: the one with its phone, else the one with its email"""
+    for key in lead_keys(exhibition_id, phone, email):
+        lead = await db.leads.find_one(key, projection)
+        if lead:
+            return lead
+    return None
+
+async def existing_lead_ids(leads: List[LeadCreate]) -> Dict[tuple, str]:
+    """Lead id per (exhibition_id, key field, value) already taken, for a batch in one read"""
+    keys = [
+        key for lead in leads
+        for key in lead_keys(lead.exhibition_id, normalize_phone(lead.phone), normalize_email(lead.email))
+    ]
+    if not keys:
+        return {}
+    taken = {}
+    async for lead in db.leads.find(
+        {"$or": keys}, {"_id": 0, "id": 1, "exhibition_id": 1, "phone_normalized": 1, "email_normalized": 1}
+    ):
+        for field in ("phone_normalized", "email_normalized"):
+            if lead.get(field):
+                taken[(lead["exhibition_id"], field, lead[field])] = lead["id"]
+    return taken
+
+def lead_upsert(lead: LeadCreate, user_id: str, now: datetime, taken: Dict[tuple, str]) -> tuple:
+    """The capture's write and, when its email belongs to a different lead, that lead's id.
+
+    A repeat capture updates the lead holding its phone, else the one holding
+    its email. When the phone and the email point at two different leads the
+    phone wins and the email stays where it is; the clash is reported rather
+    than hitting the unique email index.
+    """
+    phone, email = normalize_phone(lead.phone), normalize_email(lead.email)
+    if not phone and not email:
+        raise ValueError("A lead needs a phone number or an email")
+    phone_lead = taken.get((lead.exhibition_id, "phone_normalized", phone)) if phone else None
+    email_lead = taken.get((lead.exhibition_id, "email_normalized", email)) if email else None
+    conflict = email_lead if phone_lead and email_lead and email_lead != phone_lead else None
+    # Repeat captures refresh the details they carry and bump capture_count
+    fields = {
+        key: value for key, value in lead.model_dump(exclude={"exhibition_id", "status"}).items()
+        if value is not None
+    }
+    if phone:
+        fields["phone_normalized"] = phone
+    if email and not conflict:
+        fields["email_normalized"] = email
+    elif conflict:
+        fields.pop("email")
+    target = phone_lead or email_lead
+    identity = {"id": target} if target else lead_keys(lead.exhibition_id, phone, email)[0]
+    return UpdateOne(
+        identity,
+        {
+            "$set": {**fields, "updated_at": now},
+            "$inc": {"capture_count": 1},
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "exhibition_id": lead.exhibition_id,
+                "status": lead.status,
+                "converted": False,
+                "converted_sale_id": None,
+                "created_by": user_id,
+                "created_at": now
+            }
+        },
+        upsert=target is None
+    ), conflict
+
+async def capture_leads(leads: List[LeadCreate], user_id: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    taken = await existing_lead_ids(leads)
+    operations, rows, errors, conflicts = [], [], [], []
+    for row, lead in enumerate(leads):
+        try:
+            operation, conflict = lead_upsert(lead, user_id, now, taken)
+        except ValueError as e:
+            errors.append({"row": row, "error": str(e)})
+            continue
+        operations.append(operation)
+        rows.append(row)
+        if conflict:
+            conflicts.append({"row": row, "email_lead_id": conflict})
+    if not operations:
+        return {"captured": 0, "new": 0, "duplicates": 0, "errors": errors, "conflicts": conflicts}
+
+    try:
+        result = await db.leads.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for write_error in details.get("writeErrors", []):
+            errors.append({"row": rows[write_error["index"]], "error": write_error["errmsg"]})
+    upserted = details.get("upserted", [])
+    new_by_exhibition: Dict[str, int] = {}
+    captures_by_exhibition: Dict[str, int] = {}
+    failed_rows = {error["row"] for error in errors}
+    for row in rows:
+        if row not in failed_rows:
+            exhibition_id = leads[row].exhibition_id
+            captures_by_exhibition[exhibition_id] = captures_by_exhibition.get(exhibition_id, 0) + 1
+    for upsert in upserted:
+        exhibition_id = leads[rows[upsert["index"]]].exhibition_id
+        new_by_exhibition[exhibition_id] = new_by_exhibition.get(exhibition_id, 0) + 1
+
+    if captures_by_exhibition:
+        await db.lead_stats.bulk_write([
+            UpdateOne(
+                {"exhibition_id": exhibition_id},
+                {"$inc": {
+                    "captures": captures,
+                    "leads": new_by_exhibition.get(exhibition_id, 0),
+                    "converted": 0
+                }},
+                upsert=True
+            )
+            for exhibition_id, captures in captures_by_exhibition.items()
+        ], ordered=False)
+
+    captured = sum(captures_by_exhibition.values())
+    return {
+        "captured": captured,
+        "new": len(upserted),
+        "duplicates": captured - len(upserted),
+        "errors": errors,
+        "conflicts": conflicts
+    }
+
+async def convert_lead(exhibition_id: str, phone: Optional[str], email: Optional[str], sale_id: str):
+    """Mark the exhibition's matching lead converted by a sale, counting it once"""
+    lead = await find_lead(exhibition_id, normalize_phone(phone), normalize_email(email), {"_id": 0, "id": 1})
+    if lead is None:
+        return
+    result = await db.leads.update_one(
+        {"id": lead["id"], "converted": False},
+        {"$set": {
+            "converted": True,
+            "converted_sale_id": sale_id,
+            "status": LeadStatus.CONVERTED,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    if result.modified_count:
+        await db.lead_stats.update_one(
+            {"exhibition_id": exhibition_id},
+            {"$inc": {"converted": 1, "leads": 0, "captures": 0}},
+            upsert=True
+        )
+
+def customer_purchase_update(sale: EnhancedSale) -> Dict[str, Any]:
+    """Fold one sale into the customer's contact details and running aggregates"""
+    details: Dict[str, Any] = {"phone": sale.customer_phone, "last_exhibition_id": sale.exhibition_id}
+    if sale.customer_name:
+        details["name"] = sale.customer_name
+        details["name_lower"] = sale.customer_name.strip().lower()
+    email = normalize_email(sale.customer_email)
+    if email:
+        details["email"] = email
+    return {
+        "$set": details,
+        "$inc": {"lifetime_value": sale.total_amount, "purchase_count": 1},
+        "$max": {"last_purchase_at": sale.created_at},
+        "$min": {"first_purchase_at": sale.created_at},
+        "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": sale.created_at}
+    }
+
+async def record_customer_purchase(sale: EnhancedSale):
+    """Upsert the customer keyed by normalized phone; anonymous sales are skipped"""
+    if not sale.customer_phone_normalized:
+        return
+    update = customer_purchase_update(sale)
+    try:
+        await db.customers.update_one({"phone_normalized": sale.customer_phone_normalized}, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent checkout inserted the customer first; the retry matches it
+        await db.customers.update_one({"phone_normalized": sale.customer_phone_normalized}, update)
+
+def customer_search_filter(q: str) -> Dict[str, Any]:
+    """Anchored prefix match on the phone or name index, chosen by the query shape"""
+    q = q.strip()
+    if re.fullmatch(r"[\d\s+()-]+", q):
+        phone = normalize_phone(q)
+        if phone:
+            digits = phone.lstrip("+")
+            return {"phone_normalized": {"$in": [
+                re.compile("^" + re.escape(digits)),
+                re.compile("^" + re.escape("+" + digits))
+            ]}}
+    return {"name_lower": {"$regex": "^" + re.escape(q.lower())}}
@@ -0,0 +1,165 @@
+"""MongoDB handle, request coalescing and transactions"""
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from typing import List, Optional, Dict, Any
+import os
+import time
+import asyncio
+import threading
+
+from tracing import TRACING, mongo_tracer
+
+class PoolWaitMonitor(monitoring.ConnectionPoolListener):
+    """Tracks how long operations wait to check a connection out of the pool.
+
+    Check-outs happen on Motor's executor threads; the start of each wait is
+    kept per thread and the longest wait is held until take_max() reads it.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.max_wait = 0.0
+        self.checkouts = 0
+
+    def take_max(self) -> float:
+        """Longest wait in seconds since the previous call"""
+        longest, self.max_wait = self.max_wait, 0.0
+        return longest
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._finish()
+
+    def connection_check_out_failed(self, event):
+        self._finish()
+
+    def _finish(self):
+        started = getattr(self.local, "started", None)
+        if started is not None:
+            self.local.started = None
+            self.checkouts += 1
+            self.max_wait = max(self.max_wait, time.perf_counter() - started)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+# MongoDB connection, opened by the lifespan rather than at import
+class Database:
+    """The MongoDB database, opened on first use or by the lifespan.
+
+    Modules import the one shared instance at load time; attribute and item
+    access go through to the connected database, so the connection (or a test
+    double installed with use()) can be swapped in after they are imported.
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.pool_wait = PoolWaitMonitor()
+        self.client: Optional[AsyncIOMotorClient] = None
+        self._database = None
+
+    def connect(self):
+        if self._database is None:
+            listeners = [self.pool_wait, mongo_tracer] if TRACING else [self.pool_wait]
+            self.use(AsyncIOMotorClient(
+                os.environ['MONGO_URL'], maxPoolSize=self.max_pool_size, event_listeners=listeners
+            ))
+        return self._database
+
+    def use(self, client, name: Optional[str] = None):
+        self.client = client
+        self._database = client[name or os.environ['DB_NAME']]
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = self._database = None
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.connect(), name)
+
+    def __getitem__(self, name: str):
+        return self.connect()[name]
+
+# Checkout and back-office work get separate connection pools, so a burst of
+# dashboard aggregations or exports can't hold the connections a register needs
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+BACKOFFICE_MONGO_MAX_POOL_SIZE = int(os.environ.get('BACKOFFICE_MONGO_MAX_POOL_SIZE', '10'))
+
+db = Database(MONGO_MAX_POOL_SIZE)
+# Analytics, reports and bulk listings; only connected on nodes that serve them
+backoffice_db = Database(BACKOFFICE_MONGO_MAX_POOL_SIZE)
+
+class SingleFlight:
+    """Concurrent identical reads share one in-flight call and its result.
+
+    Callers get the same object back, so they must treat it as read-only.
+    Nothing is cached: the next call after the flight lands queries again.
+    """
+
+    def __init__(self):
+        self.flights: Dict[tuple, asyncio.Future] = {}
+        self.stats: Dict[str, List[int]] = {}  # name -> [calls, executions]
+
+    async def do(self, name: str, key: Any, fetch):
+        stats = self.stats.setdefault(name, [0, 0])
+        stats[0] += 1
+        flight_key = (name, key)
+        flight = self.flights.get(flight_key)
+        if flight is None:
+            stats[1] += 1
+            flight = asyncio.ensure_future(fetch())
+            self.flights[flight_key] = flight
+            flight.add_done_callback(lambda done: self._land(flight_key, done))
+        # A caller that disconnects must not cancel the call others are waiting on
+        return await asyncio.shield(flight)
+
+    def _land(self, flight_key: tuple, flight: asyncio.Future):
+        if self.flights.get(flight_key) is flight:
+            del self.flights[flight_key]
+        if not flight.cancelled():
+            flight.exception()  # Marks the error retrieved when every caller went away
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "calls": calls,
+                "executions": executions,
+                "coalesced": calls - executions,
+                "coalescing_ratio": round((calls - executions) / calls, 4) if calls else 0.0
+            }
+            for name, (calls, executions) in self.stats.items()
+        }
+
+single_flight = SingleFlight()
+
+async def run_transaction(callback):
+    """Run callback(session) in a multi-document transaction (needs a replica set)"""
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(callback)
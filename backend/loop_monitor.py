@@ -0,0 +1,146 @@
+"""Event-loop lag sampling and a watchdog that catches callbacks blocking the loop"""
+
+from typing import List, Optional, Dict, Any
+from collections import deque
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Instrumentation mode: off by default, the watchdog thread and heartbeat are
+# cheap but not free. A stall longer than the threshold has its stack captured.
+LOOP_MONITOR = os.environ.get('LOOP_MONITOR', 'off') == 'on'
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', '100'))
+LOOP_HEARTBEAT_SECONDS = float(os.environ.get('LOOP_HEARTBEAT_SECONDS', '0.05'))
+LOOP_STACK_DEPTH = int(os.environ.get('LOOP_STACK_DEPTH', '25'))
+LOOP_LAG_SAMPLES = 2000
+LOOP_TOP_OFFENDERS = 20
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def blame_frame(stack: traceback.StackSummary) -> traceback.FrameSummary:
+    """Innermost frame in our own code, else the innermost frame overall"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(BACKEND_DIR) and frame.filename != __file__:
+            return frame
+    return stack[-1]
+
+class LoopMonitor:
+    """Samples how late the event loop wakes up and names whatever blocked it.
+
+    A heartbeat task sleeps for a fixed interval and records how much later
+    than asked it woke. A watchdog thread checks that heartbeat; once it has
+    been silent past the threshold, the thread snapshots the loop thread's
+    stack. When the loop comes back the stall is logged with that stack and
+    counted against the blamed frame.
+    """
+
+    def __init__(self, threshold: float, heartbeat: float):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self.lags: deque = deque(maxlen=LOOP_LAG_SAMPLES)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.offenders: Dict[str, Dict[str, Any]] = {}
+        self.last_beat = 0.0
+        self.pending: Optional[traceback.StackSummary] = None
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self.beat())
+        self.thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.stopping.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.thread.join(timeout=1)
+        self.task = self.thread = None
+
+    async def beat(self):
+        while True:
+            started = time.monotonic()
+            self.last_beat = started
+            await asyncio.sleep(self.heartbeat)
+            lag = max(0.0, time.monotonic() - started - self.heartbeat)
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            stack, self.pending = self.pending, None
+            if stack is not None:
+                self.record_stall(lag, stack)
+
+    def watch(self):
+        captured_beat = None
+        while not self.stopping.wait(self.threshold / 4):
+            beat = self.last_beat
+            silent = time.monotonic() - beat - self.heartbeat
+            if silent < self.threshold or beat == captured_beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            captured_beat = beat
+            self.pending = traceback.extract_stack(frame, limit=LOOP_STACK_DEPTH)
+            del frame
+
+    def record_stall(self, lag: float, stack: traceback.StackSummary):
+        self.stalls += 1
+        culprit = blame_frame(stack)
+        key = f"{os.path.relpath(culprit.filename, BACKEND_DIR)}:{culprit.lineno} {culprit.name}"
+        offender = self.offenders.get(key)
+        if offender is None:
+            if len(self.offenders) >= LOOP_TOP_OFFENDERS * 5:
+                # Keep the table bounded; the rarest offenders make way
+                del self.offenders[min(self.offenders, key=lambda k: self.offenders[k]["total_ms"])]
+            offender = self.offenders[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "stack": []}
+        offender["count"] += 1
+        offender["total_ms"] += lag * 1000
+        if lag * 1000 >= offender["max_ms"]:
+            offender["max_ms"] = lag * 1000
+            offender["stack"] = [line.rstrip() for line in stack.format()]
+        logger.warning(
+            "Event loop blocked for %.0fms in %s\n%s",
+            lag * 1000, key, "".join(stack.format())
+        )
+
+    def percentile(self, samples: List[float], fraction: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000 if samples else 0.0
+
+    def metrics(self) -> Dict[str, Any]:
+        samples = sorted(self.lags)
+        top = sorted(self.offenders.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        return {
+            "enabled": self.task is not None,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "p50": round(self.percentile(samples, 0.5), 2),
+                "p99": round(self.percentile(samples, 0.99), 2),
+                "max": round(self.max_lag * 1000, 2)
+            },
+            "stalls": self.stalls,
+            "offenders": [
+                {"frame": key, **{name: round(value, 1) if isinstance(value, float) else value
+                                  for name, value in offender.items()}}
+                for key, offender in top[:LOOP_TOP_OFFENDERS]
+            ]
+        }
+
+loop_monitor = LoopMonitor(LOOP_BLOCK_THRESHOLD_MS / 1000, LOOP_HEARTBEAT_SECONDS)
@@ -0,0 +1,234 @@
+"""Startup migrations and the index table they keep in sync"""
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List
+from datetime import datetime, timedelta
+import os
+import uuid
+import socket
+import logging
+import asyncio
+
+from config import ACCESS_TOKEN_EXPIRE_MINUTES
+from database import db
+from models import Permission, ProductVariantCreate, User, UserRole
+from serialization import EXISTS_PROJECTION, VARIANT_PRODUCT_PROJECTION, content_hash
+from security import get_password_hash
+from stock import (
+    EXHIBITION_MIN_STOCK_LEVEL, INVENTORY_LOW_STOCK_STAGE, PRODUCT_LOW_STOCK_STAGE,
+    variant_upsert
+)
+
+logger = logging.getLogger(__name__)
+
+# A worker running a migration holds a lease on its ledger entry and renews it
+# while it works; a lease left to expire (the worker died) may be taken over.
+# Workers that find a migration held elsewhere wait for it before going ready.
+MIGRATION_LEASE_SECONDS = float(os.environ.get('MIGRATION_LEASE_SECONDS', '30'))
+MIGRATION_WAIT_SECONDS = float(os.environ.get('MIGRATION_WAIT_SECONDS', '300'))
+MIGRATION_POLL_SECONDS = 0.5
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Migrations: one-time seed, cleanup and backfill work, recorded in the
+# migrations ledger so a boot only pays for the ones not yet applied
+async def seed_super_admin():
+    # Check if Murtaza Taher (Super Admin) exists
+    existing_admin = await db.users.find_one({"username": "Murtaza Taher"}, EXISTS_PROJECTION)
+    if existing_admin:
+        logger.info("Super Admin user 'Murtaza Taher' already exists")
+        return
+    
+    # Get admin password from environment
+    admin_password = os.environ.get('SUPER_ADMIN_PASSWORD')
+    if not admin_password:
+        raise ValueError("SUPER_ADMIN_PASSWORD environment variable must be set for initial setup")
+    
+    # Create the main super admin user
+    password_hash = get_password_hash(admin_password)
+    
+    super_admin = User(
+        username="Murtaza Taher",
+        full_name="Murtaza Taher - Super Administrator",
+        role=UserRole.SUPER_ADMIN,
+        phone="+971-ADMIN-MAIN",
+        permissions=[permission.value for permission in Permission],  # All permissions
+        password_hash=password_hash
+    )
+    
+    await db.users.insert_one(super_admin.model_dump())
+    logger.info("Super Admin user 'Murtaza Taher' created successfully")
+
+async def remove_legacy_default_users():
+    await db.users.delete_many({"username": {"$in": ["admin", "cashier", "inventory"]}})
+    logger.info("Cleaned up old default users")
+
+# Indexes backing the hot lookups: (collection, keys, options)
+INDEXES = [
+    ("products", "sku", {"unique": True}),
+    ("inventory", [("exhibition_id", 1), ("product_id", 1)], {"unique": True}),
+    ("stock_movements", [("exhibition_id", 1), ("created_at", 1)], {}),
+    ("stock_snapshots", "exhibition_id", {"unique": True}),
+    ("products", "is_low_stock", {"partialFilterExpression": {"is_low_stock": True}}),
+    ("product_sales", [("exhibition_id", 1), ("day", 1), ("product_id", 1)], {"unique": True}),
+    ("product_sales", [("day", 1)], {}),
+    ("sales", [("created_at", 1)], {}),
+    ("enhanced_sales", [("created_at", 1)], {}),
+    ("enhanced_sales", [("exhibition_id", 1), ("created_at", 1)], {}),
+    ("expenses", [("exhibition_id", 1), ("date", 1)], {}),
+    ("expenses", [("date", 1)], {}),
+    ("expenses", [("created_at", 1)], {}),
+    ("pnl_daily", [("exhibition_id", 1), ("day", 1)], {"unique": True}),
+    ("leads", "id", {"unique": True}),
+    ("leads", [("exhibition_id", 1), ("updated_at", -1)], {}),
+    ("leads", [("exhibition_id", 1), ("phone_normalized", 1)],
+     {"unique": True, "partialFilterExpression": {"phone_normalized": {"$type": "string"}}}),
+    ("leads", [("exhibition_id", 1), ("email_normalized", 1)],
+     {"unique": True, "partialFilterExpression": {"email_normalized": {"$type": "string"}}}),
+    ("lead_stats", "exhibition_id", {"unique": True}),
+    ("customers", "phone_normalized", {"unique": True}),
+    ("customers", [("name_lower", 1), ("last_purchase_at", -1)], {}),
+    ("enhanced_sales", [("customer_phone_normalized", 1), ("created_at", -1)],
+     {"partialFilterExpression": {"customer_phone_normalized": {"$type": "string"}}}),
+    ("product_variants", "id", {"unique": True}),
+    ("product_variants", "sku", {"unique": True}),
+    ("product_variants", [("product_id", 1), ("attributes_key", 1)], {"unique": True}),
+    ("product_variants", [("sku", 1), ("category", 1)], {"partialFilterExpression": {"stock_quantity": {"$gt": 0}}}),
+    ("audit_log", "id", {"unique": True}),
+    ("audit_log", [("created_at", -1)], {}),
+    ("audit_log", [("action", 1), ("created_at", -1)], {}),
+    ("audit_log", [("actor_id", 1), ("created_at", -1)], {}),
+    ("audit_log", [("target_id", 1), ("created_at", -1)], {}),
+    ("token_revocations", "user_id", {"unique": True}),
+    ("token_revocations", "updated_at", {"expireAfterSeconds": ACCESS_TOKEN_EXPIRE_MINUTES * 60}),
+    ("login_failures", [("key", 1), ("window", 1)], {"unique": True}),
+    ("login_failures", "expires_at", {"expireAfterSeconds": 0}),
+    ("login_lockouts", "key", {"unique": True}),
+    ("login_lockouts", "updated_at", {}),
+    ("login_lockouts", "expires_at", {"expireAfterSeconds": 0}),
+    ("report_jobs", "id", {"unique": True}),
+    ("report_jobs", [("params_hash", 1), ("data_fingerprint", 1), ("created_at", -1)], {}),
+    ("report_jobs", [("status", 1), ("heartbeat_at", 1)], {}),
+    ("inventory", [("exhibition_id", 1), ("is_low_stock", 1)], {"partialFilterExpression": {"is_low_stock": True}}),
+]
+
+async def create_indexes():
+    await asyncio.gather(*[
+        db[collection].create_index(keys, **options) for collection, keys, options in INDEXES
+    ])
+
+async def backfill_product_variants():
+    # Embedded ProductVariation entries become one variant SKU each
+    now = datetime.utcnow()
+    operations = []
+    async for product in db.products.find(
+        {"variations.0": {"$exists": True}}, {**VARIANT_PRODUCT_PROJECTION, "variations": 1}
+    ):
+        for variation in product["variations"]:
+            operations.append(variant_upsert(product, ProductVariantCreate(
+                attributes={variation["name"]: variation["value"]},
+                price_adjustment=variation.get("price_adjustment", 0.0),
+                stock_quantity=variation.get("stock_quantity", 0)
+            ), now))
+    if operations:
+        try:
+            await db.product_variants.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            logger.warning("Skipped %d embedded variations with clashing SKUs", len(e.details.get("writeErrors", [])))
+
+async def backfill_low_stock_flags():
+    # Documents written before the flag existed get it computed once
+    await db.products.update_many({"is_low_stock": {"$exists": False}}, [PRODUCT_LOW_STOCK_STAGE])
+    await db.inventory.update_many(
+        {"is_low_stock": {"$exists": False}},
+        [{"$set": {"min_stock_level": {"$ifNull": ["$min_stock_level", EXHIBITION_MIN_STOCK_LEVEL]}}}, INVENTORY_LOW_STOCK_STAGE]
+    )
+
+async def seed_stock_snapshots():
+    # Inventory from before the movement log has no movements behind it, so each
+    # exhibition's levels restart from its remaining quantities; later movements add on
+    as_of = datetime.utcnow()
+    levels: dict = {}
+    async for row in db.inventory.find({}, {"_id": 0, "exhibition_id": 1, "product_id": 1, "remaining_quantity": 1}):
+        levels.setdefault(row["exhibition_id"], {})[row["product_id"]] = row.get("remaining_quantity", 0)
+    if levels:
+        await db.stock_snapshots.bulk_write([
+            UpdateOne({"exhibition_id": exhibition_id}, {"$set": {"as_of": as_of, "levels": products}}, upsert=True)
+            for exhibition_id, products in levels.items()
+        ], ordered=False)
+
+def migrations() -> List[tuple]:
+    """Applied in order, each at most once. The index migration is named after
+    the index list, so it runs again only when that list changes."""
+    return [
+        (f"indexes-{content_hash(INDEXES)[:12]}", create_indexes),
+        ("0001_seed_super_admin", seed_super_admin),
+        ("0002_remove_legacy_default_users", remove_legacy_default_users),
+        ("0003_backfill_low_stock_flags", backfill_low_stock_flags),
+        ("0004_backfill_product_variants", backfill_product_variants),
+        ("0005_seed_stock_snapshots", seed_stock_snapshots),
+    ]
+
+def lease() -> dict:
+    return {"owner": WORKER_ID, "lease_until": datetime.utcnow() + timedelta(seconds=MIGRATION_LEASE_SECONDS)}
+
+async def claim(name: str) -> bool:
+    """Take the ledger entry for a migration, or a running one whose lease expired"""
+    try:
+        await db.migrations.insert_one({"_id": name, "status": "running", "started_at": datetime.utcnow(), **lease()})
+        return True
+    except DuplicateKeyError:
+        pass
+    result = await db.migrations.update_one(
+        {"_id": name, "status": "running", "lease_until": {"$not": {"$gte": datetime.utcnow()}}},
+        {"$set": {"started_at": datetime.utcnow(), **lease()}}
+    )
+    if result.modified_count:
+        logger.warning("Took over migration %s from a worker that stopped renewing it", name)
+    return bool(result.modified_count)
+
+async def claim_or_wait(name: str) -> bool:
+    """True once this worker holds the migration; False when another worker applied it"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MIGRATION_WAIT_SECONDS
+    while True:
+        if await claim(name):
+            return True
+        entry = await db.migrations.find_one({"_id": name}, {"_id": 0, "status": 1})
+        if entry and entry["status"] == "applied":
+            return False
+        # Still running elsewhere, or released after a failure (claimed on the next pass)
+        if loop.time() >= deadline:
+            raise RuntimeError(f"Timed out after {MIGRATION_WAIT_SECONDS:g}s waiting for migration {name}")
+        await asyncio.sleep(MIGRATION_POLL_SECONDS)
+
+async def renew_lease(name: str):
+    while True:
+        await asyncio.sleep(MIGRATION_LEASE_SECONDS / 3)
+        result = await db.migrations.update_one({"_id": name, "owner": WORKER_ID}, {"$set": lease()})
+        if not result.matched_count:
+            logger.warning("Lost the lease on migration %s to another worker", name)
+
+async def run_migrations() -> List[str]:
+    applied = {entry["_id"] async for entry in db.migrations.find({"status": "applied"}, {"_id": 1})}
+    ran = []
+    for name, migrate in migrations():
+        if name in applied:
+            continue
+        # In order: a later migration may rely on an earlier one held elsewhere
+        if not await claim_or_wait(name):
+            continue
+        renewal = asyncio.create_task(renew_lease(name))
+        try:
+            await migrate()
+        except Exception:
+            await db.migrations.delete_one({"_id": name, "owner": WORKER_ID})
+            raise
+        finally:
+            renewal.cancel()
+        await db.migrations.update_one(
+            {"_id": name},
+            {"$set": {"status": "applied", "applied_at": datetime.utcnow()}, "$unset": {"lease_until": ""}}
+        )
+        ran.append(name)
+    return ran
@@ -0,0 +1,443 @@
+"""Pydantic models and enums for the API and the stored documents"""
+
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+import uuid
+from enum import Enum
+
+# Permission system
+class Permission(str, Enum):
+    DASHBOARD = "dashboard"
+    PRODUCTS = "products"
+    CATEGORIES = "categories"
+    EXHIBITIONS = "exhibitions"
+    POS = "pos"
+    EXPENSES = "expenses"
+    LEADS = "leads"
+    REPORTS = "reports"
+    DAY_END_CLOSE = "day_end_close"
+    EXHIBITION_CLOSURE = "exhibition_closure"
+    USER_MANAGEMENT = "user_management"
+
+# User roles and enums
+class UserRole(str, Enum):
+    SUPER_ADMIN = "super_admin"
+    ADMIN = "admin"
+    CASHIER = "cashier"
+    INVENTORY = "inventory"
+
+class OrderStatus(str, Enum):
+    PENDING = "pending"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
+class ProductStatus(str, Enum):
+    ACTIVE = "active"
+    INACTIVE = "inactive"
+    OUT_OF_STOCK = "out_of_stock"
+
+# Pydantic Models
+class UserBase(BaseModel):
+    username: str
+    full_name: str
+    role: UserRole = UserRole.CASHIER
+    phone: Optional[str] = None
+    permissions: List[Permission] = []
+
+class UserCreate(UserBase):
+    password: str
+
+class UserResponse(UserBase):
+    id: str
+    created_at: datetime
+    is_active: bool = True
+
+class User(UserBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    password_hash: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+    last_login: Optional[datetime] = None
+    token_version: int = 0  # Bumped to invalidate tokens issued before a permission change
+
+class CurrentUser(BaseModel):
+    """Authenticated principal carrying only what authorization needs"""
+    id: str
+    username: str
+    full_name: str
+    role: UserRole
+    permissions: List[Permission] = []
+    permission_mask: int = 0
+    is_active: bool = True
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserResponse
+
+class LoginData(BaseModel):
+    username: str
+    password: str
+
+# Product Models
+class ProductVariation(BaseModel):
+    name: str  # e.g., "Size", "Color"
+    value: str  # e.g., "Large", "Red"
+    price_adjustment: float = 0.0
+    stock_quantity: int = 0
+
+class Product(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    category: str
+    price: float
+    cost_price: Optional[float] = None
+    barcode: Optional[str] = None
+    sku: str
+    images: List[str] = []
+    variations: List[ProductVariation] = []
+    stock_quantity: int = 0
+    min_stock_level: int = 10
+    is_low_stock: bool = False
+    status: ProductStatus = ProductStatus.ACTIVE
+    tags: List[str] = []
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ProductCreate(BaseModel):
+    name: str
+    description: str
+    category: str
+    price: float
+    cost_price: Optional[float] = None
+    barcode: Optional[str] = None
+    sku: str
+    stock_quantity: int = 0
+    min_stock_level: int = 10
+    tags: List[str] = []
+
+class ProductResponse(BaseModel):
+    id: str
+    name: str
+    description: str
+    category: str
+    price: float
+    cost_price: Optional[float]
+    barcode: Optional[str]
+    sku: str
+    stock_quantity: int
+    min_stock_level: int
+    status: ProductStatus
+    tags: List[str]
+    created_by: str
+    created_at: datetime
+    updated_at: datetime
+
+class ProductVariantCreate(BaseModel):
+    attributes: Dict[str, str] = Field(min_length=1)  # e.g. {"Size": "Large", "Color": "Red"}
+    sku: Optional[str] = None
+    barcode: Optional[str] = None
+    price_adjustment: float = 0.0
+    stock_quantity: int = Field(default=0, ge=0)
+
+class ProductVariant(BaseModel):
+    """A sellable variant SKU with its own stock, one document per variant"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    product_id: str
+    product_name: str
+    category: str
+    sku: str
+    barcode: Optional[str] = None
+    attributes: Dict[str, str]
+    attributes_key: str
+    price_adjustment: float = 0.0
+    stock_quantity: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# POS Sale Models
+class SaleItem(BaseModel):
+    product_id: str
+    variant_id: Optional[str] = None
+    product_name: str
+    quantity: int
+    unit_price: float
+    total_price: float
+    variation_selection: Dict[str, str] = {}
+
+class Sale(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    sale_number: str
+    cashier_id: str
+    cashier_name: str
+    items: List[SaleItem]
+    subtotal: float
+    tax_amount: float = 0.0
+    discount_amount: float = 0.0
+    total_amount: float
+    payment_method: str  # "cash", "card", "mobile"
+    payment_received: float
+    change_given: float = 0.0
+    status: OrderStatus = OrderStatus.COMPLETED
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SaleCreate(BaseModel):
+    items: List[Dict[str, Any]]  # [{"product_id": "", "quantity": 1}]
+    payment_method: str
+    payment_received: float
+    discount_amount: float = 0.0
+
+class SaleResponse(BaseModel):
+    id: str
+    sale_number: str
+    cashier_id: str
+    cashier_name: str
+    items: List[SaleItem]
+    subtotal: float
+    tax_amount: float
+    discount_amount: float
+    total_amount: float
+    payment_method: str
+    payment_received: float
+    change_given: float
+    status: OrderStatus
+    created_at: datetime
+
+# Category Models
+class Category(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+
+class CategoryResponse(BaseModel):
+    id: str
+    name: str
+    description: Optional[str]
+    is_active: bool
+
+# Exhibition Models  
+class ExhibitionStatus(str, Enum):
+    DRAFT = "draft"
+    ACTIVE = "active"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
+class Exhibition(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    location: str
+    start_date: datetime
+    end_date: datetime
+    status: ExhibitionStatus = ExhibitionStatus.DRAFT
+    description: Optional[str] = None
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ExhibitionCreate(BaseModel):
+    name: str
+    location: str
+    start_date: datetime
+    end_date: datetime
+    description: Optional[str] = None
+
+class ExhibitionResponse(BaseModel):
+    id: str
+    name: str
+    location: str
+    start_date: datetime
+    end_date: datetime
+    status: ExhibitionStatus
+    description: Optional[str]
+
+# Inventory Models
+class InventoryItem(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    exhibition_id: str
+    product_id: str
+    product_name: str
+    product_price: float
+    allocated_quantity: int
+    sold_quantity: int = 0
+    remaining_quantity: int
+    min_stock_level: int = 5
+    is_low_stock: bool = False
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class InventoryResponse(BaseModel):
+    id: str
+    exhibition_id: str
+    product_id: str
+    product_name: str
+    product_price: float
+    allocated_quantity: int
+    sold_quantity: int
+    remaining_quantity: int
+
+class AllocationLine(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+
+class InventoryAllocationCreate(BaseModel):
+    items: List[AllocationLine] = Field(min_length=1)
+
+class StockTransferCreate(BaseModel):
+    from_exhibition_id: str
+    to_exhibition_id: str
+    items: List[AllocationLine] = Field(min_length=1)
+
+class MovementReason(str, Enum):
+    ALLOCATION = "allocation"
+    TRANSFER_OUT = "transfer_out"
+    TRANSFER_IN = "transfer_in"
+    SALE = "sale"
+
+class StockMovement(BaseModel):
+    """Append-only change to an exhibition's remaining quantity"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    exhibition_id: str
+    product_id: str
+    quantity_delta: int
+    reason: MovementReason
+    reference_id: str
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Enhanced Sale Models with Multi-Payment Support
+class PaymentDetail(BaseModel):
+    type: str  # "cash", "card", "bank_transfer", "digital_wallet"
+    amount: float
+
+class EnhancedSaleCreate(BaseModel):
+    exhibition_id: str
+    customer_name: Optional[str] = None
+    customer_phone: Optional[str] = None
+    customer_email: Optional[str] = None
+    items: List[Dict[str, Any]]  # [{"product_id": "", "quantity": 1, "price": 0.0}]
+    payments: List[PaymentDetail]
+
+class EnhancedSale(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    exhibition_id: str
+    sale_number: str
+    cashier_id: str
+    cashier_name: str
+    customer_name: Optional[str] = None
+    customer_phone: Optional[str] = None
+    customer_email: Optional[str] = None
+    customer_phone_normalized: Optional[str] = None
+    items: List[SaleItem]
+    subtotal: float
+    tax_amount: float = 0.0
+    discount_amount: float = 0.0
+    total_amount: float
+    payments: List[PaymentDetail]
+    change_given: float = 0.0
+    status: OrderStatus = OrderStatus.COMPLETED
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Analytics Models
+class DashboardStats(BaseModel):
+    total_sales: float
+    total_transactions: int
+    total_products: int
+    total_users: int
+    low_stock_products: int
+    recent_sales: List[Dict[str, Any]]
+    top_selling_products: List[Dict[str, Any]]
+    sales_chart_data: List[Dict[str, Any]]
+    # Exhibition specific stats
+    total_exhibitions: int = 0
+    active_exhibitions: int = 0
+
+# Expense Models
+class ExpenseCreate(BaseModel):
+    exhibition_id: Optional[str] = None
+    category: str
+    amount: float = Field(gt=0)
+    note: Optional[str] = None
+    date: str = Field(pattern=r"^\d{4}-\d{2}-\d{2}$")  # Venue-local day, YYYY-MM-DD
+
+class Expense(ExpenseCreate):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ExpenseBulkCreate(BaseModel):
+    expenses: List[ExpenseCreate] = Field(min_length=1)
+
+# Lead Models
+class LeadStatus(str, Enum):
+    NEW = "new"
+    HOT = "hot"
+    WARM = "warm"
+    COLD = "cold"
+    CONVERTED = "converted"
+
+class LeadCreate(BaseModel):
+    exhibition_id: str
+    name: str
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    interest: Optional[str] = None
+    notes: Optional[str] = None
+    status: LeadStatus = LeadStatus.NEW
+
+class LeadBatchCreate(BaseModel):
+    leads: List[LeadCreate] = Field(min_length=1)
+
+class LeadStatusUpdate(BaseModel):
+    status: LeadStatus
+
+# Audit Models
+class AuditAction(str, Enum):
+    LOGIN = "login"
+    LOGIN_FAILED = "login_failed"
+    LOGIN_LOCKED = "login_locked"
+    USER_CREATED = "user_created"
+    PERMISSIONS_UPDATED = "permissions_updated"
+    USER_DELETED = "user_deleted"
+    SALE_CREATED = "sale_created"
+    PRICE_OVERRIDE = "price_override"
+
+# Report Models
+class ReportType(str, Enum):
+    SEASON_PNL = "season_pnl"
+    PRODUCT_MARGIN = "product_margin"
+    CASHIER_PERFORMANCE = "cashier_performance"
+
+class ReportStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class ReportCreate(BaseModel):
+    report_type: ReportType
+    exhibition_id: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+class ReportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    report_type: ReportType
+    params: Dict[str, Any]
+    params_hash: str
+    data_fingerprint: str
+    status: ReportStatus = ReportStatus.QUEUED
+    result: Optional[Any] = None
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Renewed while a worker holds the job queued or running; a job whose
+    # heartbeat stopped belongs to a worker that died
+    heartbeat_at: datetime = Field(default_factory=datetime.utcnow)
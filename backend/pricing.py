@@ -0,0 +1,199 @@
+"""Per-exhibition price books and discount limits"""
+
+from fastapi import HTTPException
+from typing import Optional, Dict, Any, Awaitable, Callable
+from collections import OrderedDict
+import os
+import asyncio
+import logging
+
+from database import db
+from models import UserRole
+from serialization import (
+    PRICE_BOOK_INVENTORY_PROJECTION, PRICE_BOOK_PRODUCT_PROJECTION,
+    PRICE_BOOK_VARIANT_PROJECTION
+)
+from stock import variant_key
+
+logger = logging.getLogger(__name__)
+
+PRICE_BOOK_TTL_SECONDS = float(os.environ.get('PRICE_BOOK_TTL_SECONDS', '60'))
+PRICE_BOOK_MISS_RELOAD_SECONDS = 5.0
+# Booth snapshots kept per worker, least recently used dropped first; any
+# exhibition id a client sends gets one, so the count must stay bounded
+PRICE_BOOK_MAX_BOOTHS = int(os.environ.get('PRICE_BOOK_MAX_BOOTHS', '256'))
+# Largest discount off the list price each role may give on a sale line
+MAX_DISCOUNT_PERCENT = {
+    UserRole.CASHIER: float(os.environ.get('CASHIER_MAX_DISCOUNT_PERCENT', '10')),
+    UserRole.INVENTORY: float(os.environ.get('INVENTORY_MAX_DISCOUNT_PERCENT', '10')),
+    UserRole.ADMIN: float(os.environ.get('ADMIN_MAX_DISCOUNT_PERCENT', '30')),
+    UserRole.SUPER_ADMIN: 100.0
+}
+
+class Snapshot:
+    """A value loaded from Mongo and kept fresh with stale-while-revalidate.
+
+    Past its TTL the current value is still served while one background task
+    reloads it. Callers only wait when there is nothing loaded yet, after
+    invalidate(), or when they ask for a fresher value than is held.
+    """
+
+    def __init__(self, name: str, load: Callable[[], Awaitable[Any]], ttl_seconds: float):
+        self.name = name
+        self.load = load
+        self.ttl_seconds = ttl_seconds
+        self.value: Any = None
+        self.loaded_at: Optional[float] = None  # None: nothing usable, wait for a load
+        self.generation = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def invalidate(self):
+        self.generation += 1
+        self.loaded_at = None
+
+    async def get(self, max_age: Optional[float] = None) -> Any:
+        max_age = self.ttl_seconds if max_age is None else max_age
+        if self.loaded_at is not None:
+            if asyncio.get_running_loop().time() - self.loaded_at < max_age:
+                return self.value
+            if max_age >= self.ttl_seconds:
+                self.refresh()
+                return self.value
+        while True:
+            await self.refresh()
+            if self.loaded_at is not None:  # Else invalidated while loading: go again
+                return self.value
+
+    def refresh(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._reload())
+            # Background refreshes are not awaited; their errors are logged in _reload
+            self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self.task
+
+    async def _reload(self):
+        generation = self.generation
+        started = asyncio.get_running_loop().time()
+        try:
+            value = await self.load()
+        except Exception:
+            logger.exception("Reloading %s failed", self.name)
+            raise
+        self.value = value
+        if generation == self.generation:
+            # Reads that began before an invalidation don't count as fresh
+            self.loaded_at = started
+
+class ExhibitionPrices:
+    """One exhibition's price book: the shared catalog with the booth's
+    inventory names and prices laid over it"""
+
+    __slots__ = ("catalog", "booth")
+
+    def __init__(self, catalog: Dict[str, Dict[str, Any]], booth: Dict[str, Dict[str, Any]]):
+        self.catalog = catalog
+        self.booth = booth
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self.booth or product_id in self.catalog
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.catalog.get(product_id)
+        booth = self.booth.get(product_id)
+        if booth is None:
+            return entry
+        return {**(entry or {"adjustments": {}}), **booth}
+
+class PriceBook:
+    """List prices held in memory (per worker process).
+
+    The catalog part (products.price, variation adjustments and variant SKUs)
+    is one snapshot shared by every exhibition. Each exhibition adds a small
+    snapshot of its inventory rows, whose product_price overrides the list
+    price at that booth. Writes that change prices invalidate the affected
+    snapshot; the TTL bounds how long another worker's change can go unseen.
+    """
+
+    def __init__(self, ttl_seconds: float, max_booths: int = PRICE_BOOK_MAX_BOOTHS):
+        self.ttl_seconds = ttl_seconds
+        self.max_booths = max_booths
+        self.catalog = Snapshot("price book catalog", self._load_catalog, ttl_seconds)
+        self.booths: "OrderedDict[str, Snapshot]" = OrderedDict()
+
+    def invalidate(self, exhibition_id: Optional[str] = None):
+        """Catalog changes invalidate the shared part; inventory changes one exhibition's"""
+        if exhibition_id is None:
+            self.catalog.invalidate()
+        elif exhibition_id in self.booths:
+            self.booths[exhibition_id].invalidate()
+
+    async def get(self, exhibition_id: str, max_age: Optional[float] = None) -> ExhibitionPrices:
+        booth = self.booths.get(exhibition_id)
+        if booth is None:
+            booth = self.booths[exhibition_id] = Snapshot(
+                f"price book for {exhibition_id}", lambda: self._load_booth(exhibition_id), self.ttl_seconds
+            )
+            if len(self.booths) > self.max_booths:
+                self.booths.popitem(last=False)
+        else:
+            self.booths.move_to_end(exhibition_id)
+        return ExhibitionPrices(await self.catalog.get(max_age), await booth.get(max_age))
+
+    async def _load_catalog(self) -> Dict[str, Dict[str, Any]]:
+        catalog = {}
+        async for product in db.products.find({}, PRICE_BOOK_PRODUCT_PROJECTION):
+            catalog[product["id"]] = {
+                "name": product["name"],
+                "price": product["price"],
+                "adjustments": {
+                    (variation["name"], variation["value"]): variation.get("price_adjustment", 0.0)
+                    for variation in product.get("variations", [])
+                }
+            }
+        async for variant in db.product_variants.find({}, PRICE_BOOK_VARIANT_PROJECTION):
+            entry = catalog.get(variant["product_id"])
+            if entry is not None:
+                entry.setdefault("variants", {})[variant["attributes_key"]] = variant
+        return catalog
+
+    async def _load_booth(self, exhibition_id: str) -> Dict[str, Dict[str, Any]]:
+        return {
+            row["product_id"]: {"name": row["product_name"], "price": row["product_price"]}
+            async for row in db.inventory.find({"exhibition_id": exhibition_id}, PRICE_BOOK_INVENTORY_PROJECTION)
+        }
+
+price_book = PriceBook(PRICE_BOOK_TTL_SECONDS)
+
+def find_variant(entry: Dict[str, Any], variant_id: Optional[str], selection: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """The variant SKU a sale line refers to, by id or by its full attribute selection"""
+    variants = entry.get("variants", {})
+    if variant_id:
+        for variant in variants.values():
+            if variant["id"] == variant_id:
+                return variant
+        raise HTTPException(status_code=404, detail=f"Variant not found for {entry['name']}: {variant_id}")
+    if selection:
+        return variants.get(variant_key(selection))
+    return None
+
+def list_price(entry: Dict[str, Any], selection: Dict[str, str], variant: Optional[Dict[str, Any]] = None) -> float:
+    if variant is not None:
+        return entry["price"] + variant["price_adjustment"]
+    price = entry["price"]
+    for name, value in selection.items():
+        if (name, value) not in entry["adjustments"]:
+            raise HTTPException(status_code=400, detail=f"Unknown variation {name}={value} for {entry['name']}")
+        price += entry["adjustments"][(name, value)]
+    return price
+
+def check_discount(entry: Dict[str, Any], list_unit_price: float, price: float, role: UserRole):
+    if price < 0:
+        raise HTTPException(status_code=400, detail=f"Invalid price for {entry['name']}")
+    if price >= list_unit_price or list_unit_price <= 0:
+        return
+    discount = (list_unit_price - price) / list_unit_price * 100
+    if discount > MAX_DISCOUNT_PERCENT.get(role, 0.0) + 1e-9:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Discount of {discount:.1f}% on {entry['name']} exceeds the {MAX_DISCOUNT_PERCENT.get(role, 0.0):g}% allowed"
+        )
@@ -0,0 +1,70 @@
+"""Day buckets and the pre-aggregated sales and P&L rollups"""
+
+from pymongo import UpdateOne
+from typing import List, Optional, Dict, Any
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import os
+
+from database import db
+from models import SaleItem
+
+# Sales analytics settings; days are bucketed in the venues' local time
+ANALYTICS_TIMEZONE = ZoneInfo(os.environ.get('ANALYTICS_TIMEZONE', 'Asia/Dubai'))
+SEASON_START_MONTH = int(os.environ.get('SEASON_START_MONTH', '9'))
+
+def local_day(moment: datetime) -> str:
+    """Venue-local calendar day for a naive UTC timestamp"""
+    return moment.replace(tzinfo=timezone.utc).astimezone(ANALYTICS_TIMEZONE).strftime("%Y-%m-%d")
+
+def season_start_day(today: datetime) -> str:
+    year = today.year if today.month >= SEASON_START_MONTH else today.year - 1
+    return f"{year}-{SEASON_START_MONTH:02d}-01"
+
+async def record_product_sales(exhibition_id: Optional[str], items: List[SaleItem], sold_at: datetime):
+    """Bump the per exhibition/day/product counters behind top seller queries"""
+    day = local_day(sold_at)
+    totals: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        total = totals.setdefault(item.product_id, {"name": item.product_name, "quantity": 0, "revenue": 0.0})
+        total["quantity"] += item.quantity
+        total["revenue"] += item.total_price
+    if not totals:
+        return
+    await db.product_sales.bulk_write([
+        UpdateOne(
+            {"exhibition_id": exhibition_id, "day": day, "product_id": product_id},
+            {
+                "$inc": {"quantity": total["quantity"], "revenue": total["revenue"]},
+                "$set": {"product_name": total["name"]}
+            },
+            upsert=True
+        )
+        for product_id, total in totals.items()
+    ], ordered=False)
+
+def to_utc_naive(moment: datetime) -> datetime:
+    """Stored datetimes are naive UTC; naive inputs are taken as UTC already"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def local_day_start(day: str, days_after: int = 0) -> datetime:
+    """Naive UTC instant at which a venue-local YYYY-MM-DD day (plus days_after) begins"""
+    start = datetime.combine(date.fromisoformat(day) + timedelta(days=days_after), datetime.min.time())
+    return to_utc_naive(start.replace(tzinfo=ANALYTICS_TIMEZONE))
+
+async def bump_pnl_rollup(exhibition_id: Optional[str], day: str, revenue: float = 0.0, expenses: float = 0.0, sales: int = 0):
+    """Maintain the per exhibition/day P&L rollup read by the closure screen"""
+    await db.pnl_daily.update_one(
+        {"exhibition_id": exhibition_id, "day": day},
+        pnl_bump(revenue, expenses, sales),
+        upsert=True
+    )
+
+def pnl_bump(revenue: float, expenses: float, sales: int) -> Dict[str, Any]:
+    # updated_at tells a running rebuild which days moved underneath it
+    return {
+        "$inc": {"revenue": revenue, "expenses": expenses, "sales_count": sales},
+        "$set": {"updated_at": datetime.utcnow()}
+    }
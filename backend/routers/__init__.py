@@ -0,0 +1,32 @@
+"""API routers, loaded per deployment profile so a node imports only what it serves"""
+
+import importlib
+import os
+from types import ModuleType
+from typing import Dict, List
+
+# Routers each profile serves; SERVER_ROUTERS (comma-separated) overrides the profile.
+# Running "checkout" and "backoffice" as separate worker pools behind the proxy
+# keeps registers on processes, event loops and Mongo pools no dashboard touches.
+PROFILES: Dict[str, List[str]] = {
+    "full": ["auth", "catalog", "pos", "inventory", "analytics", "users"],
+    "checkout": ["auth", "catalog", "pos", "inventory"],
+    "backoffice": ["auth", "catalog", "inventory", "analytics", "users"],
+}
+
+def selected_routers() -> List[str]:
+    names = os.environ.get('SERVER_ROUTERS')
+    if names:
+        selected = [name.strip() for name in names.split(',') if name.strip()]
+        unknown = [name for name in selected if name not in PROFILES["full"]]
+        if unknown:
+            raise ValueError(f"Unknown routers in SERVER_ROUTERS: {', '.join(unknown)}")
+        return selected
+    profile = os.environ.get('SERVER_PROFILE', 'full')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SERVER_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
+    return PROFILES[profile]
+
+def load_routers(names: List[str]) -> List[ModuleType]:
+    """Import the named router modules; the ones left out are never loaded"""
+    return [importlib.import_module(f"{__name__}.{name}") for name in names]
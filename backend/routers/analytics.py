@@ -0,0 +1,881 @@
+"""Dashboard, sales analytics, expenses and P&L, and report jobs"""
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from pymongo import UpdateOne, ReplaceOne, DeleteOne
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import os
+import uuid
+import logging
+from enum import Enum
+import asyncio
+import orjson
+
+from database import backoffice_db, single_flight
+from models import (
+    CurrentUser, DashboardStats, Expense, ExpenseBulkCreate, ExpenseCreate, Permission,
+    ReportCreate, ReportJob, ReportStatus, ReportType
+)
+from serialization import RECENT_SALE_PROJECTION, content_hash, fast_response
+from rollups import (
+    ANALYTICS_TIMEZONE, bump_pnl_rollup, local_day, local_day_start, pnl_bump, season_start_day,
+    to_utc_naive
+)
+from security import ADMIN_ROLES, require
+
+logger = logging.getLogger(__name__)
+
+# Everything here is back-office work: it is admitted in the back-office class
+# and reads through its own connection pool, so checkout on the same worker is not slowed
+router = APIRouter(prefix="/api")
+
+async def top_products(match: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    return await backoffice_db.product_sales.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$product_id",
+            "total_quantity": {"$sum": "$quantity"},
+            "total_revenue": {"$sum": "$revenue"},
+            "product_name": {"$last": "$product_name"}
+        }},
+        {"$sort": {"total_quantity": -1}},
+        {"$limit": limit}
+    ]).to_list(limit)
+
+async def recompute_product_sales() -> Dict[tuple, Dict[str, Any]]:
+    """Rebuild the counters from the raw sales collections (verification only)"""
+    pipeline = [
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {
+                "exhibition_id": {"$ifNull": ["$exhibition_id", None]},
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": ANALYTICS_TIMEZONE.key}},
+                "product_id": "$items.product_id"
+            },
+            "quantity": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.total_price"},
+            "product_name": {"$last": "$items.product_name"}
+        }}
+    ]
+    expected = {}
+    for collection in (backoffice_db.sales, backoffice_db.enhanced_sales):
+        async for row in collection.aggregate(pipeline, allowDiskUse=True):
+            key = (row["_id"]["exhibition_id"], row["_id"]["day"], row["_id"]["product_id"])
+            current = expected.setdefault(key, {"quantity": 0, "revenue": 0.0, "product_name": row["product_name"]})
+            current["quantity"] += row["quantity"]
+            current["revenue"] += row["revenue"]
+    return expected
+
+class Granularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+
+MAX_TIMESERIES_BUCKETS = 5000
+
+def truncate_local(moment: datetime, granularity: Granularity) -> datetime:
+    """Start of the bucket containing an aware local datetime (weeks start Monday)"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == Granularity.HOUR:
+        return moment
+    moment = moment.replace(hour=0)
+    if granularity == Granularity.WEEK:
+        moment = moment - timedelta(days=moment.weekday())
+    return moment
+
+def bucket_starts(start: datetime, end: datetime, granularity: Granularity) -> List[datetime]:
+    """Every bucket start in [start, end), stepping in wall-clock time for days/weeks"""
+    tz = start.tzinfo
+    current = truncate_local(start, granularity)
+    buckets = []
+    while current < end:
+        buckets.append(current)
+        if len(buckets) > MAX_TIMESERIES_BUCKETS:
+            raise HTTPException(status_code=400, detail="Range too large for this granularity")
+        if granularity == Granularity.HOUR:
+            current = (current.astimezone(timezone.utc) + timedelta(hours=1)).astimezone(tz)
+        else:
+            step = timedelta(days=7 if granularity == Granularity.WEEK else 1)
+            current = (current.replace(tzinfo=None) + step).replace(tzinfo=tz)
+    return buckets
+
+async def sales_timeseries(
+    granularity: Granularity,
+    start: datetime,
+    end: datetime,
+    tz: ZoneInfo,
+    exhibition_id: Optional[str] = None,
+    cashier_id: Optional[str] = None,
+    payment_type: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Dense sales series over both sales collections in one $dateTrunc aggregation"""
+    buckets = bucket_starts(start, end, granularity)
+    created_at = {"$gte": to_utc_naive(buckets[0]) if buckets else to_utc_naive(start), "$lt": to_utc_naive(end)}
+
+    enhanced_match: Dict[str, Any] = {"created_at": created_at}
+    if exhibition_id:
+        enhanced_match["exhibition_id"] = exhibition_id
+    if cashier_id:
+        enhanced_match["cashier_id"] = cashier_id
+    if payment_type:
+        enhanced_match["payments.type"] = payment_type
+        # Split-tender sales only count the part paid with the requested type
+        enhanced_amount = {"$sum": {"$map": {
+            "input": {"$filter": {"input": "$payments", "cond": {"$eq": ["$$this.type", payment_type]}}},
+            "in": "$$this.amount"
+        }}}
+    else:
+        enhanced_amount = "$total_amount"
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": enhanced_match},
+        {"$project": {"_id": 0, "created_at": 1, "amount": enhanced_amount}}
+    ]
+    # Legacy POS sales carry no exhibition, so they only count in unscoped series
+    if not exhibition_id:
+        sales_match: Dict[str, Any] = {"created_at": created_at}
+        if cashier_id:
+            sales_match["cashier_id"] = cashier_id
+        if payment_type:
+            sales_match["payment_method"] = payment_type
+        pipeline.append({"$unionWith": {"coll": "sales", "pipeline": [
+            {"$match": sales_match},
+            {"$project": {"_id": 0, "created_at": 1, "amount": "$total_amount"}}
+        ]}})
+    pipeline.append({"$group": {
+        "_id": {"$dateTrunc": {
+            "date": "$created_at", "unit": granularity.value, "timezone": tz.key, "startOfWeek": "monday"
+        }},
+        "sales": {"$sum": "$amount"},
+        "transactions": {"$sum": 1}
+    }})
+
+    totals = {row["_id"]: row async for row in backoffice_db.enhanced_sales.aggregate(pipeline)}
+    series = []
+    for bucket in buckets:
+        row = totals.get(to_utc_naive(bucket))
+        series.append({
+            "bucket": bucket.isoformat(),
+            "sales": row["sales"] if row else 0.0,
+            "transactions": row["transactions"] if row else 0
+        })
+    return series
+
+# Analytics Routes
+@router.get("/analytics/dashboard", response_model=DashboardStats)
+async def get_dashboard_stats(current_user: CurrentUser = Depends(require(Permission.DASHBOARD, roles=ADMIN_ROLES))):
+    return await single_flight.do("dashboard", None, dashboard_stats)
+
+async def dashboard_stats() -> DashboardStats:
+    # Calculate stats
+    total_sales = await backoffice_db.sales.aggregate([
+        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
+    ]).to_list(1)
+    total_sales = total_sales[0]["total"] if total_sales else 0.0
+    
+    # Add enhanced sales
+    enhanced_sales = await backoffice_db.enhanced_sales.aggregate([
+        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
+    ]).to_list(1)
+    total_sales += enhanced_sales[0]["total"] if enhanced_sales else 0.0
+    
+    total_transactions = await backoffice_db.sales.count_documents({}) + await backoffice_db.enhanced_sales.count_documents({})
+    total_products = await backoffice_db.products.count_documents({"status": "active"})
+    total_users = await backoffice_db.users.count_documents({})
+    low_stock_products = await backoffice_db.products.count_documents({"is_low_stock": True})
+    
+    # Exhibition stats
+    total_exhibitions = await backoffice_db.exhibitions.count_documents({})
+    active_exhibitions = await backoffice_db.exhibitions.count_documents({"status": "active"})
+    
+    # Get recent sales (both regular and enhanced)
+    recent_sales = await backoffice_db.enhanced_sales.find({}, RECENT_SALE_PROJECTION).sort("created_at", -1).limit(5).to_list(5)
+    if len(recent_sales) < 5:
+        regular_sales = await backoffice_db.sales.find({}, RECENT_SALE_PROJECTION).sort("created_at", -1).limit(5 - len(recent_sales)).to_list(5 - len(recent_sales))
+        recent_sales.extend(regular_sales)
+    
+    # Get top selling products from the maintained counters
+    top_selling = await top_products({}, 5)
+    
+    # Sales chart data (last 7 venue-local days)
+    today = truncate_local(datetime.now(ANALYTICS_TIMEZONE), Granularity.DAY)
+    sales_chart = [
+        {"date": point["bucket"][:10], "sales": point["sales"]}
+        for point in await sales_timeseries(
+            Granularity.DAY, today - timedelta(days=6), today + timedelta(days=1), ANALYTICS_TIMEZONE
+        )
+    ]
+    
+    return DashboardStats(
+        total_sales=total_sales,
+        total_transactions=total_transactions,
+        total_products=total_products,
+        total_users=total_users,
+        low_stock_products=low_stock_products,
+        recent_sales=recent_sales,
+        top_selling_products=top_selling,
+        sales_chart_data=sales_chart,
+        total_exhibitions=total_exhibitions,
+        active_exhibitions=active_exhibitions
+    )
+
+@router.get("/analytics/sales/timeseries")
+async def get_sales_timeseries(
+    request: Request,
+    granularity: Granularity = Granularity.DAY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tz: Optional[str] = None,
+    exhibition_id: Optional[str] = None,
+    cashier_id: Optional[str] = None,
+    payment_type: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.DASHBOARD, roles=ADMIN_ROLES))
+):
+    """Sales per hour/day/week with empty buckets zero-filled.
+
+    Naive start/end values are read in `tz` (default ANALYTICS_TIMEZONE);
+    the range defaults to the last 7 days.
+    """
+    try:
+        zone = ZoneInfo(tz) if tz else ANALYTICS_TIMEZONE
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone {tz}")
+    end = end.astimezone(zone) if end and end.tzinfo else (end.replace(tzinfo=zone) if end else datetime.now(zone))
+    start = start.astimezone(zone) if start and start.tzinfo else (start.replace(tzinfo=zone) if start else end - timedelta(days=7))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    series = await sales_timeseries(granularity, start, end, zone, exhibition_id, cashier_id, payment_type)
+    return fast_response(request, {
+        "granularity": granularity.value,
+        "timezone": zone.key,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": series
+    })
+
+class TopProductsWindow(str, Enum):
+    TODAY = "today"
+    EXHIBITION = "exhibition"
+    SEASON = "season"
+    CUSTOM = "custom"
+
+@router.get("/analytics/top-products")
+async def get_top_products(
+    request: Request,
+    window: TopProductsWindow = TopProductsWindow.TODAY,
+    exhibition_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 10,
+    current_user: CurrentUser = Depends(require(Permission.DASHBOARD, roles=ADMIN_ROLES))
+):
+    """Top sellers over a window; days are YYYY-MM-DD in ANALYTICS_TIMEZONE"""
+    match: Dict[str, Any] = {}
+    if exhibition_id:
+        match["exhibition_id"] = exhibition_id
+    if window == TopProductsWindow.TODAY:
+        match["day"] = local_day(datetime.utcnow())
+    elif window == TopProductsWindow.EXHIBITION:
+        if not exhibition_id:
+            raise HTTPException(status_code=400, detail="exhibition_id is required for the exhibition window")
+    elif window == TopProductsWindow.SEASON:
+        today = datetime.now(ANALYTICS_TIMEZONE)
+        match["day"] = {"$gte": season_start_day(today)}
+    else:
+        if not start and not end:
+            raise HTTPException(status_code=400, detail="start or end is required for a custom window")
+        match["day"] = {}
+        if start:
+            match["day"]["$gte"] = start
+        if end:
+            match["day"]["$lte"] = end
+    return fast_response(request, await top_products(match, limit))
+
+@router.post("/analytics/top-products/verify")
+async def verify_top_products(
+    repair: bool = False,
+    current_user: CurrentUser = Depends(require(Permission.DASHBOARD, roles=ADMIN_ROLES))
+):
+    """Compare the counters with a full recompute from sales; optionally fix them"""
+    expected = await recompute_product_sales()
+    actual = {}
+    async for row in backoffice_db.product_sales.find({}, {"_id": 0}):
+        actual[(row["exhibition_id"], row["day"], row["product_id"])] = row
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want, have = expected.get(key), actual.get(key)
+        if (
+            want is None or have is None
+            or want["quantity"] != have["quantity"]
+            or abs(want["revenue"] - have["revenue"]) > 0.005
+        ):
+            mismatches.append((key, want, have))
+
+    if repair and mismatches:
+        operations = []
+        for (exhibition_id, day, product_id), want, _ in mismatches:
+            key_filter = {"exhibition_id": exhibition_id, "day": day, "product_id": product_id}
+            if want is None:
+                operations.append(DeleteOne(key_filter))
+            else:
+                operations.append(ReplaceOne(key_filter, {**key_filter, **want}, upsert=True))
+        await backoffice_db.product_sales.bulk_write(operations, ordered=False)
+
+    return {
+        "checked": len(expected.keys() | actual.keys()),
+        "mismatches": len(mismatches),
+        "repaired": repair,
+        "sample": [
+            {"exhibition_id": key[0], "day": key[1], "product_id": key[2], "expected": want, "actual": have}
+            for key, want, have in mismatches[:20]
+        ]
+    }
+
+# Expense Routes
+EXPENSE_PROJECTION = {"_id": 0}
+
+def pnl_pipeline(exhibition_id: Optional[str], start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+    """Revenue (net of tax) and expenses per exhibition/day from one aggregation.
+
+    start/end are venue-local days; sales are bounded on created_at by the
+    instants those days begin and end, so the created_at index does the work.
+    """
+    day_range: Dict[str, str] = {}
+    created_at: Dict[str, datetime] = {}
+    if start:
+        day_range["$gte"] = start
+        created_at["$gte"] = local_day_start(start)
+    if end:
+        day_range["$lte"] = end
+        created_at["$lt"] = local_day_start(end, days_after=1)
+    sales_match: Dict[str, Any] = {}
+    expense_match: Dict[str, Any] = {}
+    if exhibition_id:
+        sales_match["exhibition_id"] = exhibition_id
+        expense_match["exhibition_id"] = exhibition_id
+    if created_at:
+        sales_match["created_at"] = created_at
+    if day_range:
+        expense_match["date"] = day_range
+    pipeline = [
+        {"$match": sales_match},
+        {"$project": {
+            "_id": 0,
+            "exhibition_id": 1,
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": ANALYTICS_TIMEZONE.key}},
+            "revenue": {"$subtract": ["$total_amount", "$tax_amount"]},
+            "expenses": {"$literal": 0},
+            "sales_count": {"$literal": 1}
+        }}
+    ]
+    pipeline += [
+        {"$unionWith": {"coll": "expenses", "pipeline": [
+            {"$match": expense_match},
+            {"$project": {
+                "_id": 0, "exhibition_id": 1, "day": "$date",
+                "revenue": {"$literal": 0}, "expenses": "$amount", "sales_count": {"$literal": 0}
+            }}
+        ]}},
+        {"$group": {
+            "_id": {"exhibition_id": "$exhibition_id", "day": "$day"},
+            "revenue": {"$sum": "$revenue"},
+            "expenses": {"$sum": "$expenses"},
+            "sales_count": {"$sum": "$sales_count"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "exhibition_id": "$_id.exhibition_id",
+            "day": "$_id.day",
+            "revenue": 1,
+            "expenses": 1,
+            "sales_count": 1
+        }},
+        {"$sort": {"exhibition_id": 1, "day": 1}}
+    ]
+    return pipeline
+
+def with_net_profit(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for row in rows:
+        row["net_profit"] = row["revenue"] - row["expenses"]
+    return rows
+
+@router.post("/expenses")
+async def create_expense(
+    expense_data: ExpenseCreate,
+    current_user: CurrentUser = Depends(require(Permission.EXPENSES))
+):
+    expense = Expense(**expense_data.model_dump(), created_by=current_user.id)
+    await backoffice_db.expenses.insert_one(expense.model_dump())
+    await bump_pnl_rollup(expense.exhibition_id, expense.date, expenses=expense.amount)
+    return expense.model_dump()
+
+@router.post("/expenses/bulk")
+async def create_expenses_bulk(
+    bulk: ExpenseBulkCreate,
+    current_user: CurrentUser = Depends(require(Permission.EXPENSES))
+):
+    expenses = [Expense(**item.model_dump(), created_by=current_user.id) for item in bulk.expenses]
+    await backoffice_db.expenses.insert_many([expense.model_dump() for expense in expenses], ordered=False)
+
+    totals: Dict[tuple, float] = {}
+    for expense in expenses:
+        key = (expense.exhibition_id, expense.date)
+        totals[key] = totals.get(key, 0.0) + expense.amount
+    await backoffice_db.pnl_daily.bulk_write([
+        UpdateOne({"exhibition_id": exhibition_id, "day": day}, pnl_bump(0.0, amount, 0), upsert=True)
+        for (exhibition_id, day), amount in totals.items()
+    ], ordered=False)
+    return {"success": True, "created": len(expenses), "total_amount": sum(totals.values())}
+
+@router.get("/expenses")
+async def get_expenses(
+    request: Request,
+    exhibition_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 500,
+    current_user: CurrentUser = Depends(require(Permission.EXPENSES))
+):
+    query: Dict[str, Any] = {}
+    if exhibition_id:
+        query["exhibition_id"] = exhibition_id
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    expenses = await backoffice_db.expenses.find(query, EXPENSE_PROJECTION).sort("date", -1).limit(limit).to_list(limit)
+    return fast_response(request, expenses)
+
+@router.get("/expenses/pnl")
+async def get_profit_and_loss(
+    request: Request,
+    exhibition_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.EXPENSES, roles=ADMIN_ROLES))
+):
+    """Authoritative net profit per exhibition/day, computed from the raw data"""
+    try:
+        pipeline = pnl_pipeline(exhibition_id, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    rows = await backoffice_db.enhanced_sales.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    return fast_response(request, with_net_profit(rows))
+
+@router.get("/expenses/pnl/{exhibition_id}/closure")
+async def get_closure_pnl(
+    request: Request,
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITION_CLOSURE))
+):
+    """Closure screen totals from the maintained rollup (one small indexed read)"""
+    days = await backoffice_db.pnl_daily.find({"exhibition_id": exhibition_id}, {"_id": 0}).sort("day", 1).to_list(None)
+    with_net_profit(days)
+    totals = {
+        key: sum(day[key] for day in days)
+        for key in ("revenue", "expenses", "sales_count", "net_profit")
+    }
+    return fast_response(request, {"exhibition_id": exhibition_id, "days": days, "totals": totals})
+
+@router.post("/expenses/pnl/rebuild")
+async def rebuild_pnl_rollup(
+    exhibition_id: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.EXPENSES, roles=ADMIN_ROLES))
+):
+    """Recompute the rollup from the raw data with $merge.
+
+    Checkouts keep bumping the rollup while this runs. Days bumped after the
+    rebuild started are left as they are (neither lost nor counted twice) and
+    reported, so a later rebuild can settle them.
+    """
+    started = datetime.utcnow()
+    scope = {"exhibition_id": exhibition_id} if exhibition_id else {}
+    untouched = {"$not": {"$gte": started}}
+    rebuilt = f"pnl_daily_rebuild_{uuid.uuid4().hex[:12]}"
+    try:
+        pipeline = pnl_pipeline(exhibition_id, None, None)
+        pipeline.append({"$out": rebuilt})
+        await backoffice_db.enhanced_sales.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        await backoffice_db[rebuilt].aggregate([{"$unset": "_id"}, {"$merge": {
+            "into": "pnl_daily", "on": ["exhibition_id", "day"], "whenNotMatched": "insert",
+            "whenMatched": [{"$replaceWith": {"$cond": [
+                {"$lt": [{"$ifNull": ["$updated_at", datetime.min]}, started]}, "$$new", "$$ROOT"
+            ]}}]
+        }}]).to_list(None)
+        # Days with no data left: remove them, unless a bump just gave them some
+        days = {
+            (row["exhibition_id"], row["day"])
+            async for row in backoffice_db[rebuilt].find({}, {"_id": 0, "exhibition_id": 1, "day": 1})
+        }
+        stale = [
+            row["_id"] async for row in backoffice_db.pnl_daily.find(
+                {**scope, "updated_at": untouched}, {"_id": 1, "exhibition_id": 1, "day": 1}
+            )
+            if (row.get("exhibition_id"), row["day"]) not in days
+        ]
+        if stale:
+            await backoffice_db.pnl_daily.delete_many({"_id": {"$in": stale}, "updated_at": untouched})
+    finally:
+        await backoffice_db[rebuilt].drop()
+    moved = await backoffice_db.pnl_daily.count_documents({**scope, "updated_at": {"$gte": started}})
+    return {"success": True, "days_bumped_during_rebuild": moved}
+
+# Reports
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '2'))
+REPORT_QUEUE_SIZE = int(os.environ.get('REPORT_QUEUE_SIZE', '100'))
+# Workers renew the heartbeat of every job they hold; one silent for
+# REPORT_STALE_SECONDS is orphaned, no longer served as a cached result and
+# picked up again by the next sweep
+REPORT_HEARTBEAT_SECONDS = float(os.environ.get('REPORT_HEARTBEAT_SECONDS', '30'))
+REPORT_STALE_SECONDS = float(os.environ.get('REPORT_STALE_SECONDS', '120'))
+REPORT_JOB_PROJECTION = {"_id": 0, "result": 0}
+
+async def report_data_fingerprint() -> str:
+    """Cheap marker that changes whenever data a report reads changes.
+
+    Sales and expenses are append-only, so collection size plus newest created_at identifies
+    their state; both come from metadata or an indexed read.
+    """
+    parts = []
+    for collection in (backoffice_db.sales, backoffice_db.enhanced_sales, backoffice_db.expenses):
+        newest = await collection.find_one({}, {"_id": 0, "created_at": 1}, sort=[("created_at", -1)])
+        parts.append([await collection.estimated_document_count(), newest["created_at"] if newest else None])
+    newest_product = await backoffice_db.products.find_one({}, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)])
+    parts.append([await backoffice_db.products.estimated_document_count(), newest_product["updated_at"] if newest_product else None])
+    return content_hash(parts)
+
+def report_sales_pipeline(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Sale line items from both collections within the report range"""
+    match: Dict[str, Any] = {}
+    if params.get("start") or params.get("end"):
+        match["created_at"] = {}
+        if params.get("start"):
+            match["created_at"]["$gte"] = datetime.fromisoformat(params["start"])
+        if params.get("end"):
+            match["created_at"]["$lt"] = datetime.fromisoformat(params["end"])
+    enhanced_match = dict(match)
+    if params.get("exhibition_id"):
+        enhanced_match["exhibition_id"] = params["exhibition_id"]
+    line = {
+        "_id": 0, "sale_id": "$id", "exhibition_id": 1, "cashier_id": 1, "cashier_name": 1,
+        "total_amount": 1, "items": 1
+    }
+    pipeline = [{"$match": enhanced_match}, {"$project": line}]
+    if not params.get("exhibition_id"):
+        pipeline.append({"$unionWith": {"coll": "sales", "pipeline": [
+            {"$match": match},
+            {"$project": {**line, "exhibition_id": {"$literal": None}}}
+        ]}})
+    return pipeline
+
+# Cost of goods uses the product's current cost_price; products without one count as zero cost
+COST_LOOKUP = [
+    {"$lookup": {
+        "from": "products", "localField": "_id.product_id", "foreignField": "id",
+        "pipeline": [{"$project": {"_id": 0, "cost_price": 1}}], "as": "product"
+    }},
+    {"$set": {"cogs": {"$multiply": ["$quantity", {"$ifNull": [{"$first": "$product.cost_price"}, 0]}]}}}
+]
+
+async def build_report(report_type: ReportType, params: Dict[str, Any]) -> Any:
+    pipeline = report_sales_pipeline(params)
+    if report_type == ReportType.CASHIER_PERFORMANCE:
+        pipeline += [
+            {"$group": {
+                "_id": "$cashier_id",
+                "cashier_name": {"$last": "$cashier_name"},
+                "transactions": {"$sum": 1},
+                "revenue": {"$sum": "$total_amount"},
+                "items_sold": {"$sum": {"$sum": "$items.quantity"}}
+            }},
+            {"$set": {"average_ticket": {"$divide": ["$revenue", "$transactions"]}}},
+            {"$sort": {"revenue": -1}}
+        ]
+        rows = await backoffice_db.enhanced_sales.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        return [{"cashier_id": row.pop("_id"), **row} for row in rows]
+
+    # Group line items per product (and exhibition) first so $lookup runs once per group
+    pipeline += [
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"exhibition_id": "$exhibition_id", "product_id": "$items.product_id"},
+            "product_name": {"$last": "$items.product_name"},
+            "quantity": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.total_price"}
+        }},
+        *COST_LOOKUP
+    ]
+    if report_type == ReportType.PRODUCT_MARGIN:
+        pipeline += [
+            {"$group": {
+                "_id": "$_id.product_id",
+                "product_name": {"$last": "$product_name"},
+                "quantity": {"$sum": "$quantity"},
+                "revenue": {"$sum": "$revenue"},
+                "cogs": {"$sum": "$cogs"}
+            }},
+            {"$sort": {"revenue": -1}}
+        ]
+        group_key = "product_id"
+    else:
+        expense_match: List[Dict[str, Any]] = [{"$eq": ["$exhibition_id", "$$exhibition_id"]}]
+        if params.get("start"):
+            expense_match.append({"$gte": ["$date", local_day(datetime.fromisoformat(params["start"]))]})
+        if params.get("end"):
+            expense_match.append({"$lt": ["$date", local_day(datetime.fromisoformat(params["end"]))]})
+        pipeline += [
+            {"$group": {
+                "_id": "$_id.exhibition_id",
+                "quantity": {"$sum": "$quantity"},
+                "revenue": {"$sum": "$revenue"},
+                "cogs": {"$sum": "$cogs"}
+            }},
+            {"$lookup": {
+                "from": "expenses",
+                "let": {"exhibition_id": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": expense_match}}},
+                    {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+                ],
+                "as": "expense_total"
+            }},
+            {"$set": {"expenses": {"$ifNull": [{"$first": "$expense_total.total"}, 0]}}},
+            {"$unset": "expense_total"},
+            {"$sort": {"revenue": -1}}
+        ]
+        group_key = "exhibition_id"
+    rows = await backoffice_db.enhanced_sales.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    report = []
+    for row in rows:
+        row[group_key] = row.pop("_id")
+        row["gross_profit"] = row["revenue"] - row["cogs"]
+        row["margin_pct"] = round(row["gross_profit"] / row["revenue"] * 100, 2) if row["revenue"] else 0.0
+        if report_type == ReportType.SEASON_PNL:
+            row["net_profit"] = row["gross_profit"] - row["expenses"]
+        report.append(row)
+    return report
+
+class ReportWorkerPool:
+    """Fixed number of asyncio workers draining a bounded queue of report job ids.
+
+    A housekeeping task renews the heartbeat of the jobs this pool holds and
+    sweeps up jobs orphaned by workers that stopped renewing theirs.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.held: set = set()
+        self.tasks: List[asyncio.Task] = []
+
+    def start(self):
+        # A fresh queue for the running loop; the sweep requeues anything unfinished
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.held = set()
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._housekeeping()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # Hand unfinished jobs to the next sweep at once rather than after they go stale
+        if self.held:
+            await backoffice_db.report_jobs.update_many(
+                {"id": {"$in": list(self.held)}, "status": {"$in": [ReportStatus.QUEUED, ReportStatus.RUNNING]}},
+                {"$unset": {"heartbeat_at": ""}}
+            )
+            self.held = set()
+
+    def check_capacity(self):
+        if self.queue.full():
+            raise HTTPException(status_code=503, detail="Report queue is full, try again later")
+
+    def submit(self, job_id: str):
+        try:
+            self.queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Report queue is full, try again later")
+        self.held.add(job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Report job %s crashed", job_id)
+            finally:
+                self.held.discard(job_id)
+                self.queue.task_done()
+
+    async def _housekeeping(self):
+        while True:
+            await asyncio.sleep(REPORT_HEARTBEAT_SECONDS)
+            try:
+                await self.heartbeat()
+                await self.sweep()
+            except Exception:
+                logger.exception("Report job housekeeping failed")
+
+    async def heartbeat(self):
+        if self.held:
+            await backoffice_db.report_jobs.update_many(
+                {"id": {"$in": list(self.held)}, "status": {"$in": [ReportStatus.QUEUED, ReportStatus.RUNNING]}},
+                {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+
+    async def sweep(self) -> int:
+        """Take over orphaned queued or running jobs, as many as the queue has room for"""
+        taken = 0
+        while not self.queue.full():
+            job = await backoffice_db.report_jobs.find_one_and_update(
+                {"status": {"$in": [ReportStatus.QUEUED, ReportStatus.RUNNING]}, "heartbeat_at": stale_heartbeat()},
+                {"$set": {"status": ReportStatus.QUEUED, "heartbeat_at": datetime.utcnow()}},
+                projection={"_id": 0, "id": 1}
+            )
+            if not job:
+                break
+            self.submit(job["id"])
+            taken += 1
+        return taken
+
+    async def _run(self, job_id: str):
+        job = await backoffice_db.report_jobs.find_one_and_update(
+            {"id": job_id, "status": ReportStatus.QUEUED},
+            {"$set": {"status": ReportStatus.RUNNING, "started_at": datetime.utcnow(), "heartbeat_at": datetime.utcnow()}},
+            projection={"_id": 0, "report_type": 1, "params": 1}
+        )
+        if not job:
+            return
+        try:
+            result = await build_report(ReportType(job["report_type"]), job["params"])
+        except Exception as e:
+            await backoffice_db.report_jobs.update_one(
+                {"id": job_id},
+                {"$set": {"status": ReportStatus.FAILED, "error": str(e), "finished_at": datetime.utcnow()}}
+            )
+            raise
+        await backoffice_db.report_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                "status": ReportStatus.COMPLETED,
+                "result": result,
+                "content_hash": content_hash(result),
+                "finished_at": datetime.utcnow()
+            }}
+        )
+
+def stale_heartbeat() -> Dict[str, Any]:
+    # Jobs written before heartbeats existed count as stale too
+    return {"$not": {"$gte": datetime.utcnow() - timedelta(seconds=REPORT_STALE_SECONDS)}}
+
+report_workers = ReportWorkerPool(REPORT_WORKERS, REPORT_QUEUE_SIZE)
+
+@router.post("/reports")
+async def submit_report(
+    report: ReportCreate,
+    current_user: CurrentUser = Depends(require(Permission.REPORTS, roles=ADMIN_ROLES))
+):
+    """Queue a report, or return the stored one if nothing it reads has changed"""
+    params = {
+        "exhibition_id": report.exhibition_id,
+        "start": report.start.isoformat() if report.start else None,
+        "end": report.end.isoformat() if report.end else None
+    }
+    params_hash = content_hash({"report_type": report.report_type.value, **params})
+    fingerprint = await report_data_fingerprint()
+
+    # A finished report, or one a live worker is still on; orphans don't count
+    existing = await backoffice_db.report_jobs.find_one(
+        {
+            "params_hash": params_hash,
+            "data_fingerprint": fingerprint,
+            "$or": [
+                {"status": ReportStatus.COMPLETED},
+                {
+                    "status": {"$in": [ReportStatus.QUEUED, ReportStatus.RUNNING]},
+                    "heartbeat_at": {"$gte": datetime.utcnow() - timedelta(seconds=REPORT_STALE_SECONDS)}
+                }
+            ]
+        },
+        REPORT_JOB_PROJECTION,
+        sort=[("created_at", -1)]
+    )
+    if existing:
+        return {**existing, "cached": True}
+    report_workers.check_capacity()
+
+    job = ReportJob(
+        report_type=report.report_type,
+        params=params,
+        params_hash=params_hash,
+        data_fingerprint=fingerprint,
+        created_by=current_user.id
+    )
+    await backoffice_db.report_jobs.insert_one(job.model_dump())
+    try:
+        report_workers.submit(job.id)
+    except HTTPException:
+        # The queue filled up meanwhile. A queued job no worker will run would
+        # be served from the cache above forever, so it must not stay behind.
+        await backoffice_db.report_jobs.delete_one({"id": job.id})
+        raise
+    return {**job.model_dump(exclude={"result"}), "cached": False}
+
+@router.get("/reports")
+async def list_reports(
+    request: Request,
+    limit: int = 50,
+    current_user: CurrentUser = Depends(require(Permission.REPORTS, roles=ADMIN_ROLES))
+):
+    jobs = await backoffice_db.report_jobs.find({}, REPORT_JOB_PROJECTION).sort("created_at", -1).limit(limit).to_list(limit)
+    return fast_response(request, jobs)
+
+@router.get("/reports/{job_id}")
+async def get_report(
+    request: Request,
+    job_id: str,
+    current_user: CurrentUser = Depends(require(Permission.REPORTS, roles=ADMIN_ROLES))
+):
+    job = await backoffice_db.report_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return fast_response(request, job)
+
+@router.get("/reports/{job_id}/download")
+async def download_report(
+    job_id: str,
+    current_user: CurrentUser = Depends(require(Permission.REPORTS, roles=ADMIN_ROLES))
+):
+    job = await backoffice_db.report_jobs.find_one(
+        {"id": job_id}, {"_id": 0, "status": 1, "report_type": 1, "result": 1, "content_hash": 1}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if job["status"] != ReportStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Report is {ReportStatus(job['status']).value}")
+    return Response(
+        content=orjson.dumps(job["result"]),
+        media_type="application/json",
+        headers={
+            "Content-Disposition": f'attachment; filename="{ReportType(job["report_type"]).value}-{job_id[:8]}.json"',
+            "ETag": f'"{job["content_hash"]}"'
+        }
+    )
+
+async def startup():
+    report_workers.start()
+    # Jobs queued or interrupted by a worker that is gone are picked up again
+    await report_workers.sweep()
+
+async def shutdown():
+    await report_workers.stop()
@@ -0,0 +1,94 @@
+"""Registration, login and the current user"""
+
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from datetime import datetime, timedelta
+
+from config import ACCESS_TOKEN_EXPIRE_MINUTES
+from database import db
+from models import AuditAction, CurrentUser, LoginData, Token, User, UserCreate, UserResponse
+from serialization import EXISTS_PROJECTION, LOGIN_USER_PROJECTION, USER_PROFILE_PROJECTION
+from audit import audit_log, client_ip
+from security import (
+    create_access_token, get_password_hash, login_throttle, require, user_token_claims,
+    verify_password
+)
+from tracing import span
+
+router = APIRouter(prefix="/api")
+
+# Authentication Routes
+@router.post("/auth/register", response_model=UserResponse)
+async def register_user(user_data: UserCreate):
+    # Check if user already exists
+    existing_user = await db.users.find_one({"username": user_data.username}, EXISTS_PROJECTION)
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already exists"
+        )
+    
+    # Create new user
+    user_dict = user_data.dict()
+    user_dict["password_hash"] = get_password_hash(user_data.password)
+    del user_dict["password"]
+    
+    user = User(**user_dict)
+    await db.users.insert_one(user.dict())
+    
+    return UserResponse(**user.dict())
+
+@router.post("/auth/login", response_model=Token)
+async def login_user(login_data: LoginData, request: Request):
+    ip = client_ip(request)
+    retry_after = login_throttle.retry_after(login_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+    # A noisy address was already slowed down by LoginPacingMiddleware
+    
+    user = await db.users.find_one({"username": login_data.username}, LOGIN_USER_PROJECTION)
+    with span("auth.verify_password"):
+        valid = bool(user) and verify_password(login_data.password, user["password_hash"])
+    if not valid:
+        await audit_log.record(AuditAction.LOGIN_FAILED, actor_name=login_data.username, ip=ip)
+        for key in await login_throttle.record_failure(login_data.username, ip):
+            await audit_log.record(AuditAction.LOGIN_LOCKED, actor_name=login_data.username, target_id=key, ip=ip)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    await login_throttle.record_success(login_data.username, ip)
+    
+    # Update last login
+    await db.users.update_one(
+        {"id": user["id"]},
+        {"$set": {"last_login": datetime.utcnow()}}
+    )
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=user_token_claims(user), expires_delta=access_token_expires
+    )
+    
+    user_response = UserResponse(**user)
+    await audit_log.record(
+        AuditAction.LOGIN, actor_name=user["username"], target_id=user["id"], ip=ip
+    )
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": user_response
+    }
+
+@router.get("/auth/me", response_model=UserResponse)
+async def get_current_user_profile(current_user: CurrentUser = Depends(require())):
+    user = await db.users.find_one({"id": current_user.id}, USER_PROFILE_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return UserResponse(**user)
@@ -0,0 +1,377 @@
+"""Products, variants, categories and bulk import/export"""
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+from pathlib import Path
+import io
+import codecs
+import orjson
+
+from database import db, backoffice_db, single_flight
+from models import (
+    Category, CategoryResponse, CurrentUser, Permission, Product, ProductCreate,
+    ProductResponse, ProductStatus, ProductVariantCreate
+)
+from serialization import (
+    CATEGORY_PROJECTION, EXISTS_PROJECTION, PRODUCT_PROJECTION, VARIANT_PRODUCT_PROJECTION,
+    VARIANT_PROJECTION, fast_response
+)
+from security import ADMIN_ROLES, STOCK_ROLES, require
+from stock import variant_upsert
+from pricing import price_book
+
+router = APIRouter(prefix="/api")
+
+# Bulk product import/export
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 1000
+PRODUCT_EXPORT_FIELDS = list(ProductCreate.model_fields)
+PRODUCT_EXPORT_PROJECTION = {"_id": 0, **{name: 1 for name in PRODUCT_EXPORT_FIELDS}}
+
+def _import_row_to_product(row: Dict[str, Any]) -> ProductCreate:
+    """Validate one CSV/JSONL row; CSV cells arrive as strings"""
+    data = {key.strip(): value for key, value in row.items() if key}
+    for key, value in list(data.items()):
+        if isinstance(value, str):
+            value = value.strip()
+            data[key] = value if value != "" else None
+    if isinstance(data.get("tags"), str):
+        data["tags"] = [tag.strip() for tag in data["tags"].split("|") if tag.strip()]
+    return ProductCreate(**{key: value for key, value in data.items() if value is not None})
+
+def _read_import_chunk(rows, start_row: int):
+    """Parse and validate up to IMPORT_CHUNK_SIZE rows (runs in a worker thread).
+
+    Anything wrong with a single row is reported against that row; the
+    import carries on with the rest of the file.
+    """
+    import csv
+    valid, errors = [], []
+    row_number = start_row
+    while row_number - start_row < IMPORT_CHUNK_SIZE:
+        try:
+            raw = next(rows)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            row_number += 1
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+        row_number += 1
+        try:
+            if isinstance(raw, str):
+                if not raw.strip():
+                    continue
+                raw = orjson.loads(raw)
+            if not isinstance(raw, dict):
+                raise TypeError(f"Row must be an object, got {type(raw).__name__}")
+            valid.append((row_number, _import_row_to_product(raw)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"row": row_number, "error": message})
+        except (orjson.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+            errors.append({"row": row_number, "error": str(e)})
+    return valid, errors, row_number
+
+def _is_utf8(source) -> bool:
+    """Check an upload decodes as UTF-8 before streaming starts (worker thread)"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            block = source.read(1 << 20)
+            decoder.decode(block, final=not block)
+            if not block:
+                return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        source.seek(0)
+
+def _import_row_reader(source, file_format: str):
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        import csv
+        return csv.DictReader(text)
+    return iter(text)
+
+def _export_line(product: Dict[str, Any], file_format: str) -> str:
+    if file_format == "csv":
+        import csv
+        buffer = io.StringIO()
+        row = dict(product)
+        row["tags"] = "|".join(row.get("tags") or [])
+        csv.DictWriter(buffer, fieldnames=PRODUCT_EXPORT_FIELDS, extrasaction="ignore").writerow(row)
+        return buffer.getvalue()
+    return orjson.dumps(product).decode() + "\n"
+
+# Product Routes
+@router.post("/products", response_model=ProductResponse)
+async def create_product(
+    product_data: ProductCreate,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    # Check if SKU already exists
+    existing_product = await db.products.find_one({"sku": product_data.sku}, EXISTS_PROJECTION)
+    if existing_product:
+        raise HTTPException(status_code=400, detail="SKU already exists")
+    
+    product_dict = product_data.dict()
+    product_dict["created_by"] = current_user.id
+    product_dict["is_low_stock"] = product_data.stock_quantity <= product_data.min_stock_level
+    
+    product = Product(**product_dict)
+    await db.products.insert_one(product.dict())
+    price_book.invalidate()
+    
+    return ProductResponse(**product.dict())
+
+@router.post("/products/import")
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Bulk-create products from a CSV or JSONL upload.
+
+    Streams NDJSON: one progress line per chunk, then a summary with per-row errors.
+    Existing SKUs (and repeats inside the file) are skipped, not updated.
+    """
+    file_format = (format or Path(file.filename or "").suffix.lstrip(".") or "csv").lower()
+    if file_format in ("ndjson", "json"):
+        file_format = "jsonl"
+    if file_format not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Unsupported import format, use csv or jsonl")
+
+    # The request closes its uploads once this handler returns, before the
+    # response body streams, so hand the spooled file over to the generator
+    source, file.file = file.file, io.BytesIO()
+    # A bad byte found mid-stream could only abort the response, so reject it up front
+    if not await run_in_threadpool(_is_utf8, source):
+        source.close()
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8 encoded")
+
+    async def run_import():
+        reader = _import_row_reader(source, file_format)
+        try:
+            async for line in _import_chunks(reader):
+                yield line
+        finally:
+            source.close()
+
+    async def _import_chunks(reader):
+        seen_skus = set()
+        totals = {"rows": 0, "inserted": 0, "duplicates": 0, "failed": 0}
+        errors = []
+        while True:
+            valid, chunk_errors, last_row = await run_in_threadpool(_read_import_chunk, reader, totals["rows"])
+            if last_row == totals["rows"]:
+                break
+            totals["rows"] = last_row
+            totals["failed"] += len(chunk_errors)
+
+            chunk_skus = [product.sku for _, product in valid]
+            existing = await db.products.find({"sku": {"$in": chunk_skus}}, {"_id": 0, "sku": 1}).to_list(None)
+            seen_skus.update(doc["sku"] for doc in existing)
+
+            documents, rows_by_index = [], []
+            for row_number, product_data in valid:
+                if product_data.sku in seen_skus:
+                    totals["duplicates"] += 1
+                    chunk_errors.append({"row": row_number, "error": f"SKU {product_data.sku} already exists"})
+                    continue
+                seen_skus.add(product_data.sku)
+                product = Product(
+                    **product_data.model_dump(),
+                    created_by=current_user.id,
+                    is_low_stock=product_data.stock_quantity <= product_data.min_stock_level
+                )
+                documents.append(product.model_dump())
+                rows_by_index.append(row_number)
+
+            if documents:
+                try:
+                    result = await db.products.insert_many(documents, ordered=False)
+                    totals["inserted"] += len(result.inserted_ids)
+                except BulkWriteError as e:
+                    totals["inserted"] += e.details.get("nInserted", 0)
+                    for write_error in e.details.get("writeErrors", []):
+                        totals["failed"] += 1
+                        chunk_errors.append({"row": rows_by_index[write_error["index"]], "error": write_error["errmsg"]})
+
+            errors.extend(chunk_errors[:IMPORT_MAX_REPORTED_ERRORS - len(errors)])
+            yield orjson.dumps({"type": "progress", **totals}) + b"\n"
+
+        price_book.invalidate()
+        yield orjson.dumps({"type": "summary", **totals, "errors": errors}) + b"\n"
+
+    return StreamingResponse(run_import(), media_type="application/x-ndjson")
+
+@router.get("/products/export")
+async def export_products(
+    format: str = "csv",
+    category: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Stream the active catalog as CSV or JSONL in the import format"""
+    if format not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Unsupported export format, use csv or jsonl")
+    query = {"status": ProductStatus.ACTIVE}
+    if category:
+        query["category"] = category
+
+    async def run_export():
+        if format == "csv":
+            import csv
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(PRODUCT_EXPORT_FIELDS)
+            yield buffer.getvalue()
+        # Exports are long reads; they hold a back-office connection, not a checkout one
+        cursor = backoffice_db.products.find(query, PRODUCT_EXPORT_PROJECTION).sort("sku", 1).batch_size(IMPORT_CHUNK_SIZE)
+        batch = []
+        async for product in cursor:
+            batch.append(_export_line(product, format))
+            if len(batch) >= IMPORT_CHUNK_SIZE:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        run_export(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(
+    request: Request,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    barcode: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+):
+    query = {"status": ProductStatus.ACTIVE}
+    
+    if category:
+        query["category"] = category
+    if barcode:
+        query["barcode"] = barcode
+    if search:
+        query["$or"] = [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"description": {"$regex": search, "$options": "i"}},
+            {"sku": {"$regex": search, "$options": "i"}},
+            {"tags": {"$regex": search, "$options": "i"}}
+        ]
+    
+    products = await single_flight.do(
+        "products", (category, search, barcode, skip, limit),
+        lambda: db.products.find(query, PRODUCT_PROJECTION).skip(skip).limit(limit).to_list(limit)
+    )
+    return fast_response(request, products)
+
+@router.get("/products/{product_id}", response_model=ProductResponse)
+async def get_product(product_id: str):
+    product = await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return ProductResponse(**product)
+
+@router.post("/products/{product_id}/variants")
+async def create_product_variants(
+    product_id: str,
+    variants: List[ProductVariantCreate],
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Add variant SKUs; attribute combinations the product already has are skipped"""
+    product = await db.products.find_one({"id": product_id}, VARIANT_PRODUCT_PROJECTION)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    now = datetime.utcnow()
+    try:
+        result = await db.product_variants.bulk_write(
+            [variant_upsert(product, variant, now) for variant in variants], ordered=False
+        )
+        created, errors = result.upserted_count, []
+    except BulkWriteError as e:
+        created = e.details.get("nUpserted", 0)
+        errors = [{"index": error["index"], "error": error["errmsg"]} for error in e.details.get("writeErrors", [])]
+    price_book.invalidate()
+    return {"success": not errors, "created": created, "existing": len(variants) - created - len(errors), "errors": errors}
+
+@router.get("/products/{product_id}/variants")
+async def get_product_variants(
+    request: Request,
+    product_id: str,
+    in_stock: bool = False
+):
+    query: Dict[str, Any] = {"product_id": product_id}
+    if in_stock:
+        query["stock_quantity"] = {"$gt": 0}
+    variants = await db.product_variants.find(query, VARIANT_PROJECTION).sort("sku", 1).to_list(None)
+    return fast_response(request, variants)
+
+@router.get("/variants/in-stock")
+async def get_variants_in_stock(
+    request: Request,
+    category: Optional[str] = None,
+    limit: int = 500
+):
+    """Catalog-wide sellable variants, served from the partial in-stock index"""
+    query: Dict[str, Any] = {"stock_quantity": {"$gt": 0}}
+    if category:
+        query["category"] = category
+    variants = await db.product_variants.find(query, VARIANT_PROJECTION).sort("sku", 1).limit(limit).to_list(limit)
+    return fast_response(request, variants)
+
+@router.put("/variants/{variant_id}/stock")
+async def adjust_variant_stock(
+    variant_id: str,
+    delta: int,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Receive (+) or write off (-) variant stock; never drives it below zero"""
+    variant = await db.product_variants.find_one_and_update(
+        {"id": variant_id, "stock_quantity": {"$gte": -delta}},
+        {"$inc": {"stock_quantity": delta}, "$set": {"updated_at": datetime.utcnow()}},
+        projection=VARIANT_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not variant:
+        exists = await db.product_variants.find_one({"id": variant_id}, EXISTS_PROJECTION)
+        raise HTTPException(status_code=400 if exists else 404, detail="Insufficient variant stock" if exists else "Variant not found")
+    return variant
+
+# Categories Routes
+@router.get("/categories", response_model=List[CategoryResponse])
+async def get_categories():
+    categories = await single_flight.do(
+        "categories", None, lambda: db.categories.find({"is_active": True}, CATEGORY_PROJECTION).to_list(100)
+    )
+    if not categories:
+        # Return sample categories if none exist
+        sample_categories = [
+            {"id": "1", "name": "Perfume Oils", "description": "Premium attar and perfume oils", "is_active": True},
+            {"id": "2", "name": "Incense & Bakhoor", "description": "Traditional bakhoor and incense", "is_active": True},
+            {"id": "3", "name": "Gift Sets", "description": "Curated gift collections", "is_active": True}
+        ]
+        return [CategoryResponse(**cat) for cat in sample_categories]
+    return [CategoryResponse(**cat) for cat in categories]
+
+@router.post("/categories", response_model=CategoryResponse)
+async def create_category(
+    name: str,
+    description: Optional[str] = None,
+    current_user: CurrentUser = Depends(require(Permission.CATEGORIES, roles=ADMIN_ROLES))
+):
+    category = Category(name=name, description=description)
+    await db.categories.insert_one(category.model_dump())
+    return CategoryResponse(**category.model_dump())
@@ -0,0 +1,390 @@
+"""Exhibitions, stock allocation, transfers and low stock alerts"""
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pymongo import UpdateOne
+from typing import List, Optional
+from datetime import datetime, timedelta
+import uuid
+import asyncio
+import orjson
+
+from database import db, run_transaction, single_flight
+from models import (
+    CurrentUser, Exhibition, ExhibitionCreate, ExhibitionResponse, ExhibitionStatus,
+    InventoryAllocationCreate, InventoryResponse, MovementReason, Permission, ProductStatus,
+    StockMovement, StockTransferCreate
+)
+from serialization import (
+    ALLOCATION_PRODUCT_PROJECTION, EXHIBITION_PROJECTION, EXISTS_PROJECTION,
+    INVENTORY_LIST_PROJECTION, LOW_STOCK_INVENTORY_PROJECTION, LOW_STOCK_PRODUCT_PROJECTION,
+    STOCK_MOVEMENT_PROJECTION, TRANSFER_INVENTORY_PROJECTION, fast_response
+)
+from security import ADMIN_ROLES, STOCK_ROLES, require
+from stock import (
+    compact_stock_snapshot, derive_stock_levels, inventory_stock_update, inventory_upsert,
+    low_stock_alert, low_stock_notifier, merge_quantities, product_stock_update,
+    publish_low_stock
+)
+from pricing import price_book
+
+router = APIRouter(prefix="/api")
+
+# Exhibitions Routes
+@router.get("/exhibitions", response_model=List[ExhibitionResponse])
+async def get_exhibitions(current_user: CurrentUser = Depends(require())):
+    exhibitions = await single_flight.do(
+        "exhibitions", None, lambda: db.exhibitions.find({}, EXHIBITION_PROJECTION).sort("created_at", -1).to_list(100)
+    )
+    if not exhibitions:
+        # Return sample exhibitions if none exist
+        sample_exhibitions = [
+            {
+                "id": "1",
+                "name": "Dubai Shopping Festival 2024",
+                "location": "Dubai Mall",
+                "start_date": datetime.utcnow(),
+                "end_date": (datetime.utcnow() + timedelta(days=30)),
+                "status": "active",
+                "description": "Annual shopping festival exhibition"
+            }
+        ]
+        return [ExhibitionResponse(**ex) for ex in sample_exhibitions]
+    
+    # Clean up database exhibitions data for response
+    cleaned_exhibitions = []
+    for ex in exhibitions:
+        # Remove MongoDB ObjectId and ensure required fields
+        cleaned_ex = {
+            "id": ex.get("id", str(ex.get("_id", ""))),
+            "name": ex.get("name", ""),
+            "location": ex.get("location", ""),
+            "start_date": ex.get("start_date"),
+            "end_date": ex.get("end_date"),
+            "status": ex.get("status", "active"),
+            "description": ex.get("description")
+        }
+        cleaned_exhibitions.append(cleaned_ex)
+    
+    return [ExhibitionResponse(**ex) for ex in cleaned_exhibitions]
+
+@router.post("/exhibitions", response_model=ExhibitionResponse)
+async def create_exhibition(
+    exhibition_data: ExhibitionCreate,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITIONS, roles=ADMIN_ROLES))
+):
+    exhibition = Exhibition(
+        name=exhibition_data.name,
+        location=exhibition_data.location,
+        start_date=exhibition_data.start_date,
+        end_date=exhibition_data.end_date,
+        description=exhibition_data.description,
+        created_by=current_user.id,
+        status=ExhibitionStatus.ACTIVE  # Default to active
+    )
+    
+    # Save to database
+    await db.exhibitions.insert_one(exhibition.model_dump())
+    
+    # Return response
+    return ExhibitionResponse(
+        id=exhibition.id,
+        name=exhibition.name,
+        location=exhibition.location,
+        start_date=exhibition.start_date,
+        end_date=exhibition.end_date,
+        status=exhibition.status,
+        description=exhibition.description
+    )
+
+# Inventory Routes
+@router.get("/inventory/exhibition/{exhibition_id}", response_model=List[InventoryResponse])
+async def get_exhibition_inventory(
+    request: Request,
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require())
+):
+    inventory = await single_flight.do(
+        "inventory", exhibition_id,
+        lambda: db.inventory.find({"exhibition_id": exhibition_id}, INVENTORY_LIST_PROJECTION).to_list(1000)
+    )
+    if not inventory:
+        # Return sample inventory if none exists
+        sample_inventory = [
+            {
+                "id": "1",
+                "exhibition_id": exhibition_id,
+                "product_id": "1",
+                "product_name": "Oud Royal Attar 12ml",
+                "product_price": 150.0,
+                "allocated_quantity": 25,
+                "sold_quantity": 5,
+                "remaining_quantity": 20
+            },
+            {
+                "id": "2",
+                "exhibition_id": exhibition_id,
+                "product_id": "2",
+                "product_name": "Rose Damascus Oil 10ml",
+                "product_price": 85.0,
+                "allocated_quantity": 40,
+                "sold_quantity": 8,
+                "remaining_quantity": 32
+            },
+            {
+                "id": "3",
+                "exhibition_id": exhibition_id,
+                "product_id": "3",
+                "product_name": "Sandalwood Bakhoor 50g",
+                "product_price": 65.0,
+                "allocated_quantity": 60,
+                "sold_quantity": 12,
+                "remaining_quantity": 48
+            }
+        ]
+        return fast_response(request, sample_inventory)
+    return fast_response(request, inventory)
+
+@router.post("/inventory/exhibition/{exhibition_id}/allocate")
+async def allocate_exhibition_inventory(
+    exhibition_id: str,
+    allocation: InventoryAllocationCreate,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITIONS, roles=STOCK_ROLES))
+):
+    """Move warehouse stock into an exhibition's inventory in one transaction"""
+    exhibition = await db.exhibitions.find_one({"id": exhibition_id}, EXISTS_PROJECTION)
+    if not exhibition:
+        raise HTTPException(status_code=404, detail="Exhibition not found")
+
+    quantities = merge_quantities(allocation.items)
+
+    async def allocate(session):
+        products = await db.products.find(
+            {"id": {"$in": list(quantities)}},
+            ALLOCATION_PRODUCT_PROJECTION,
+            session=session
+        ).to_list(None)
+        products_by_id = {product["id"]: product for product in products}
+
+        missing = [product_id for product_id in quantities if product_id not in products_by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Products not found: {', '.join(missing)}")
+        short = [
+            products_by_id[product_id]["name"]
+            for product_id, quantity in quantities.items()
+            if products_by_id[product_id]["stock_quantity"] < quantity
+        ]
+        if short:
+            raise HTTPException(status_code=400, detail=f"Insufficient warehouse stock for: {', '.join(short)}")
+
+        # Guarded decrements: a concurrent sale that drained stock makes the batch fail
+        warehouse = await db.products.bulk_write([
+            UpdateOne(
+                {"id": product_id, "stock_quantity": {"$gte": quantity}},
+                product_stock_update(-quantity)
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False, session=session)
+        if warehouse.modified_count != len(quantities):
+            raise HTTPException(status_code=409, detail="Warehouse stock changed during allocation, please retry")
+
+        now = datetime.utcnow()
+        await db.inventory.bulk_write([
+            inventory_upsert(
+                exhibition_id, product_id,
+                products_by_id[product_id]["name"], products_by_id[product_id]["price"],
+                quantity, now
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False, session=session)
+        await db.stock_movements.insert_many([
+            StockMovement(
+                exhibition_id=exhibition_id,
+                product_id=product_id,
+                quantity_delta=quantity,
+                reason=MovementReason.ALLOCATION,
+                reference_id=allocation_id,
+                created_by=current_user.id,
+                created_at=now
+            ).model_dump()
+            for product_id, quantity in quantities.items()
+        ], session=session)
+
+    allocation_id = str(uuid.uuid4())
+    await run_transaction(allocate)
+    price_book.invalidate(exhibition_id)
+    await publish_low_stock("warehouse", None, list(quantities))
+
+    return {
+        "success": True,
+        "allocation_id": allocation_id,
+        "exhibition_id": exhibition_id,
+        "allocated_products": len(quantities),
+        "allocated_quantity": sum(quantities.values())
+    }
+
+@router.post("/inventory/transfers")
+async def transfer_inventory(
+    transfer: StockTransferCreate,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITIONS, roles=STOCK_ROLES))
+):
+    """Move remaining stock between two exhibitions in one transaction"""
+    if transfer.from_exhibition_id == transfer.to_exhibition_id:
+        raise HTTPException(status_code=400, detail="Source and destination exhibitions must differ")
+    found = await db.exhibitions.count_documents(
+        {"id": {"$in": [transfer.from_exhibition_id, transfer.to_exhibition_id]}}
+    )
+    if found != 2:
+        raise HTTPException(status_code=404, detail="Exhibition not found")
+
+    quantities = merge_quantities(transfer.items)
+    transfer_id = str(uuid.uuid4())
+
+    async def move(session):
+        source_rows = await db.inventory.find(
+            {"exhibition_id": transfer.from_exhibition_id, "product_id": {"$in": list(quantities)}},
+            TRANSFER_INVENTORY_PROJECTION,
+            session=session
+        ).to_list(None)
+        source_by_product = {row["product_id"]: row for row in source_rows}
+
+        missing = [product_id for product_id in quantities if product_id not in source_by_product]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Products not allocated to source exhibition: {', '.join(missing)}")
+        short = [
+            source_by_product[product_id]["product_name"]
+            for product_id, quantity in quantities.items()
+            if source_by_product[product_id]["remaining_quantity"] < quantity
+        ]
+        if short:
+            raise HTTPException(status_code=400, detail=f"Insufficient exhibition stock for: {', '.join(short)}")
+
+        source = await db.inventory.bulk_write([
+            UpdateOne(
+                {
+                    "exhibition_id": transfer.from_exhibition_id,
+                    "product_id": product_id,
+                    "remaining_quantity": {"$gte": quantity}
+                },
+                inventory_stock_update(-quantity, allocated_delta=-quantity)
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False, session=session)
+        if source.modified_count != len(quantities):
+            raise HTTPException(status_code=409, detail="Exhibition stock changed during transfer, please retry")
+
+        now = datetime.utcnow()
+        await db.inventory.bulk_write([
+            inventory_upsert(
+                transfer.to_exhibition_id, product_id,
+                source_by_product[product_id]["product_name"], source_by_product[product_id]["product_price"],
+                quantity, now
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False, session=session)
+
+        movements = []
+        for product_id, quantity in quantities.items():
+            for exhibition_id, delta, reason in (
+                (transfer.from_exhibition_id, -quantity, MovementReason.TRANSFER_OUT),
+                (transfer.to_exhibition_id, quantity, MovementReason.TRANSFER_IN)
+            ):
+                movements.append(StockMovement(
+                    exhibition_id=exhibition_id,
+                    product_id=product_id,
+                    quantity_delta=delta,
+                    reason=reason,
+                    reference_id=transfer_id,
+                    created_by=current_user.id,
+                    created_at=now
+                ).model_dump())
+        await db.stock_movements.insert_many(movements, session=session)
+
+    await run_transaction(move)
+    price_book.invalidate(transfer.to_exhibition_id)
+    await publish_low_stock("exhibition", transfer.from_exhibition_id, list(quantities))
+
+    return {
+        "success": True,
+        "transfer_id": transfer_id,
+        "from_exhibition_id": transfer.from_exhibition_id,
+        "to_exhibition_id": transfer.to_exhibition_id,
+        "transferred_products": len(quantities),
+        "transferred_quantity": sum(quantities.values())
+    }
+
+@router.get("/inventory/movements")
+async def get_stock_movements(
+    request: Request,
+    exhibition_id: str,
+    product_id: Optional[str] = None,
+    limit: int = 100,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITIONS, roles=STOCK_ROLES))
+):
+    query = {"exhibition_id": exhibition_id}
+    if product_id:
+        query["product_id"] = product_id
+    movements = await db.stock_movements.find(query, STOCK_MOVEMENT_PROJECTION).sort("created_at", -1).limit(limit).to_list(limit)
+    return fast_response(request, movements)
+
+@router.get("/inventory/exhibition/{exhibition_id}/levels")
+async def get_exhibition_stock_levels(
+    request: Request,
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require())
+):
+    """Remaining quantity per product, derived from snapshot plus later movements"""
+    levels = await derive_stock_levels(exhibition_id)
+    return fast_response(request, [
+        {"product_id": product_id, "remaining_quantity": quantity}
+        for product_id, quantity in levels.items()
+    ])
+
+@router.post("/inventory/exhibition/{exhibition_id}/snapshot")
+async def snapshot_exhibition_stock(
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require(Permission.EXHIBITIONS, roles=STOCK_ROLES))
+):
+    snapshot = await compact_stock_snapshot(exhibition_id)
+    return {"success": True, "as_of": snapshot["as_of"], "products": len(snapshot["levels"])}
+
+# Low Stock Alert Routes
+@router.get("/alerts/low-stock")
+async def get_low_stock_alerts(
+    request: Request,
+    exhibition_id: Optional[str] = None,
+    limit: int = 200,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Products at or below their minimum level, warehouse or per exhibition"""
+    if exhibition_id:
+        rows = await db.inventory.find(
+            {"exhibition_id": exhibition_id, "is_low_stock": True}, LOW_STOCK_INVENTORY_PROJECTION
+        ).limit(limit).to_list(limit)
+        return fast_response(request, [low_stock_alert("exhibition", row, exhibition_id) for row in rows])
+    rows = await db.products.find(
+        {"is_low_stock": True, "status": ProductStatus.ACTIVE}, LOW_STOCK_PRODUCT_PROJECTION
+    ).limit(limit).to_list(limit)
+    return fast_response(request, [low_stock_alert("warehouse", row) for row in rows])
+
+@router.get("/alerts/low-stock/stream")
+async def stream_low_stock_alerts(
+    request: Request,
+    current_user: CurrentUser = Depends(require(Permission.PRODUCTS, roles=STOCK_ROLES))
+):
+    """Server-sent events for stock crossing its minimum level on this worker"""
+    queue = low_stock_notifier.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield b"event: low_stock\ndata: " + orjson.dumps(alert) + b"\n\n"
+        finally:
+            low_stock_notifier.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,443 @@
+"""Checkout, sales, customers and leads"""
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pymongo import ReturnDocument
+from typing import List, Optional, Dict, Any, Awaitable
+from datetime import datetime
+import uuid
+import logging
+
+from database import db, backoffice_db, run_transaction
+from models import (
+    AuditAction, CurrentUser, EnhancedSale, EnhancedSaleCreate, LeadBatchCreate, LeadCreate,
+    LeadStatus, LeadStatusUpdate, MovementReason, Permission, Sale, SaleCreate, SaleItem,
+    SaleResponse, StockMovement, UserRole
+)
+from serialization import (
+    EXHIBITION_SALE_PROJECTION, LOW_STOCK_INVENTORY_PROJECTION, LOW_STOCK_PRODUCT_PROJECTION,
+    SALE_LIST_PROJECTION, SALE_PRODUCT_PROJECTION, fast_response
+)
+from rollups import bump_pnl_rollup, local_day, record_product_sales
+from audit import audit_log
+from security import require
+from stock import (
+    crossed_low_stock, inventory_stock_update, low_stock_alert, low_stock_notifier,
+    product_stock_update, return_variant_stock, take_variant_stock
+)
+from crm import (
+    capture_leads, convert_lead, customer_search_filter, find_lead, normalize_email,
+    normalize_phone, record_customer_purchase
+)
+from pricing import (
+    PRICE_BOOK_MISS_RELOAD_SECONDS, check_discount, find_variant, list_price, price_book
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+async def after_sale(sale_number: str, what: str, write: Awaitable):
+    """Run a write derived from a recorded sale (rollups, CRM, audit).
+
+    The sale and its stock movement are already committed, so a failure here
+    is logged rather than turned into an error for a checkout that happened.
+    """
+    try:
+        await write
+    except Exception:
+        logger.exception("Sale %s recorded but its %s update failed", sale_number, what)
+
+# POS Sale Routes
+@router.post("/sales", response_model=SaleResponse)
+async def create_sale(
+    sale_data: SaleCreate,
+    current_user: CurrentUser = Depends(require(Permission.POS))
+):
+    if not sale_data.items:
+        raise HTTPException(status_code=400, detail="Sale must contain at least one item")
+    
+    # Generate sale number
+    sale_number = f"SALE-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+    
+    # Process sale items
+    sale_items = []
+    low_stock_alerts = []
+    subtotal = 0.0
+    
+    for item_data in sale_data.items:
+        product = await db.products.find_one({"id": item_data["product_id"]}, SALE_PRODUCT_PROJECTION)
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product {item_data['product_id']} not found")
+        
+        # Check stock
+        if product["stock_quantity"] < item_data["quantity"]:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for product {product['name']}")
+        
+        unit_price = product["price"]
+        total_price = unit_price * item_data["quantity"]
+        subtotal += total_price
+        
+        sale_item = SaleItem(
+            product_id=item_data["product_id"],
+            product_name=product["name"],
+            quantity=item_data["quantity"],
+            unit_price=unit_price,
+            total_price=total_price,
+            variation_selection=item_data.get("variation_selection", {})
+        )
+        sale_items.append(sale_item)
+        
+        # Update product stock
+        updated = await db.products.find_one_and_update(
+            {"id": item_data["product_id"]},
+            product_stock_update(-item_data["quantity"]),
+            projection=LOW_STOCK_PRODUCT_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if updated and crossed_low_stock(updated["stock_quantity"], updated["min_stock_level"], item_data["quantity"]):
+            low_stock_alerts.append(low_stock_alert("warehouse", updated))
+    
+    # Calculate totals
+    discount_amount = sale_data.discount_amount
+    after_discount = subtotal - discount_amount
+    tax_amount = after_discount * 0.05  # 5% tax
+    total_amount = after_discount + tax_amount
+    
+    # Calculate change
+    change_given = max(0, sale_data.payment_received - total_amount)
+    
+    # Create sale
+    sale = Sale(
+        sale_number=sale_number,
+        cashier_id=current_user.id,
+        cashier_name=current_user.full_name,
+        items=[item.dict() for item in sale_items],
+        subtotal=subtotal,
+        tax_amount=tax_amount,
+        discount_amount=discount_amount,
+        total_amount=total_amount,
+        payment_method=sale_data.payment_method,
+        payment_received=sale_data.payment_received,
+        change_given=change_given
+    )
+    
+    await db.sales.insert_one(sale.dict())
+    await after_sale(sale_number, "product sales", record_product_sales(None, sale_items, sale.created_at))
+    low_stock_notifier.publish(low_stock_alerts)
+    
+    return SaleResponse(**sale.dict())
+
+@router.get("/sales", response_model=List[SaleResponse])
+async def get_sales(
+    request: Request,
+    current_user: CurrentUser = Depends(require(Permission.POS)),
+    skip: int = 0,
+    limit: int = 50
+):
+    if current_user.role == UserRole.ADMIN:
+        sales = await db.sales.find({}, SALE_LIST_PROJECTION).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
+    else:
+        # Cashiers can only see their own sales
+        sales = await db.sales.find({"cashier_id": current_user.id}, SALE_LIST_PROJECTION).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
+    
+    return fast_response(request, sales)
+
+# Enhanced Sales Route with Multi-Payment Support
+@router.post("/sales/enhanced", response_model=Dict[str, Any])
+async def create_enhanced_sale(
+    sale_data: EnhancedSaleCreate,
+    current_user: CurrentUser = Depends(require(Permission.POS))
+):
+    if not sale_data.items:
+        raise HTTPException(status_code=400, detail="Sale must contain at least one item")
+    
+    # Generate sale number
+    sale_number = f"SALE-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+    
+    # Calculate totals
+    subtotal = 0
+    sale_items = []
+    price_overrides = []
+    
+    # Lines are priced from the in-memory price book; an unknown product
+    # forces one reload in case it was created since the book was built
+    book = await price_book.get(sale_data.exhibition_id)
+    if any(item_data["product_id"] not in book for item_data in sale_data.items):
+        book = await price_book.get(sale_data.exhibition_id, max_age=PRICE_BOOK_MISS_RELOAD_SECONDS)
+    
+    for item_data in sale_data.items:
+        product_id = item_data["product_id"]
+        quantity = item_data["quantity"]
+        selection = item_data.get("variation_selection") or {}
+        
+        entry = book.get(product_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"Product not found: {product_id}")
+        product_name = entry["name"]
+        variant = find_variant(entry, item_data.get("variant_id"), selection)
+        list_unit_price = list_price(entry, selection, variant)
+        price = item_data.get("price", list_unit_price)
+        check_discount(entry, list_unit_price, price, current_user.role)
+        if price != list_unit_price:
+            price_overrides.append({"product_id": product_id, "list_price": list_unit_price, "price": price, "quantity": quantity})
+        
+        item_total = price * quantity
+        subtotal += item_total
+        
+        sale_items.append(SaleItem(
+            product_id=product_id,
+            product_name=product_name,
+            quantity=quantity,
+            variant_id=variant["id"] if variant else None,
+            unit_price=price,
+            total_price=item_total,
+            variation_selection=selection
+        ))
+    
+    # Calculate tax and total
+    tax_amount = subtotal * 0.05  # 5% tax
+    total_amount = subtotal + tax_amount
+    
+    # Calculate payments and change
+    total_paid = sum(payment.amount for payment in sale_data.payments)
+    change_given = max(0, total_paid - total_amount)
+    
+    # Variant SKUs carry their own stock, taken before the sale is recorded
+    variant_lines = [(item.variant_id, item.quantity) for item in sale_items if item.variant_id]
+    if variant_lines:
+        short = await take_variant_stock(variant_lines)
+        if short:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for variant {short}")
+    
+    # Create sale record
+    sale = EnhancedSale(
+        exhibition_id=sale_data.exhibition_id,
+        sale_number=sale_number,
+        cashier_id=current_user.id,
+        cashier_name=current_user.full_name,
+        customer_name=sale_data.customer_name,
+        customer_phone=sale_data.customer_phone,
+        customer_email=sale_data.customer_email,
+        customer_phone_normalized=normalize_phone(sale_data.customer_phone),
+        items=sale_items,
+        subtotal=subtotal,
+        tax_amount=tax_amount,
+        total_amount=total_amount,
+        payments=sale_data.payments,
+        change_given=change_given
+    )
+    low_stock_alerts = []
+    
+    async def record(session):
+        # The sale, its exhibition stock and the movement ledger commit together;
+        # the transaction may be retried, so nothing is carried over between tries
+        low_stock_alerts.clear()
+        await db.enhanced_sales.insert_one(sale.model_dump(), session=session)
+        movements = []
+        for item_data in sale_data.items:
+            updated = await db.inventory.find_one_and_update(
+                {
+                    "exhibition_id": sale_data.exhibition_id,
+                    "product_id": item_data["product_id"]
+                },
+                inventory_stock_update(-item_data["quantity"], sold_delta=item_data["quantity"]),
+                projection=LOW_STOCK_INVENTORY_PROJECTION,
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if updated:
+                if crossed_low_stock(updated["remaining_quantity"], updated["min_stock_level"], item_data["quantity"]):
+                    low_stock_alerts.append(low_stock_alert("exhibition", updated, sale_data.exhibition_id))
+                movements.append(StockMovement(
+                    exhibition_id=sale_data.exhibition_id,
+                    product_id=item_data["product_id"],
+                    quantity_delta=-item_data["quantity"],
+                    reason=MovementReason.SALE,
+                    reference_id=sale.id,
+                    created_by=current_user.id
+                ).model_dump())
+        if movements:
+            await db.stock_movements.insert_many(movements, session=session)
+    
+    # Taken variant stock goes back if the sale is not recorded
+    try:
+        await run_transaction(record)
+    except Exception:
+        await return_variant_stock(variant_lines)
+        raise
+    
+    await after_sale(sale_number, "product sales", record_product_sales(sale_data.exhibition_id, sale_items, sale.created_at))
+    await after_sale(sale_number, "P&L rollup", bump_pnl_rollup(sale_data.exhibition_id, local_day(sale.created_at), revenue=subtotal, sales=1))
+    await after_sale(sale_number, "lead", convert_lead(sale_data.exhibition_id, sale_data.customer_phone, sale_data.customer_email, sale.id))
+    await after_sale(sale_number, "customer", record_customer_purchase(sale))
+    await after_sale(sale_number, "audit", audit_log.record(
+        AuditAction.SALE_CREATED, current_user, target_id=sale.id,
+        details={"exhibition_id": sale.exhibition_id, "sale_number": sale_number, "total_amount": total_amount}
+    ))
+    if price_overrides:
+        await after_sale(sale_number, "audit", audit_log.record(
+            AuditAction.PRICE_OVERRIDE, current_user, target_id=sale.id,
+            details={"exhibition_id": sale.exhibition_id, "items": price_overrides}
+        ))
+    low_stock_notifier.publish(low_stock_alerts)
+    
+    return {
+        "success": True,
+        "sale_number": sale_number,
+        "total_amount": total_amount,
+        "change_given": change_given,
+        "id": sale.id
+    }
+# Sales by Exhibition Routes
+@router.get("/sales/exhibition/{exhibition_id}")
+async def get_exhibition_sales(
+    request: Request,
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require())
+):
+    # Get enhanced sales for the exhibition (without the items arrays)
+    sales = await backoffice_db.enhanced_sales.find({"exhibition_id": exhibition_id}, EXHIBITION_SALE_PROJECTION).to_list(1000)
+    
+    if not sales:
+        # Return sample sales data for demo
+        sample_sales = [
+            {
+                "id": "1",
+                "sale_number": "SALE-20240929-ABC123",
+                "exhibition_id": exhibition_id,
+                "customer_name": "Ahmed Hassan",
+                "total_amount": 235.0,
+                "payment_method": "cash",
+                "created_at": datetime.utcnow().isoformat()
+            }
+        ]
+        return fast_response(request, sample_sales)
+    
+    # Fill defaults for legacy documents; datetimes are encoded by orjson
+    for sale in sales:
+        sale.setdefault("id", "")
+        sale.setdefault("sale_number", "")
+        sale.setdefault("exhibition_id", "")
+        sale.setdefault("customer_name", "")
+        sale.setdefault("customer_phone", "")
+        sale.setdefault("total_amount", 0.0)
+        sale.setdefault("change_given", 0.0)
+        if not sale.get("created_at"):
+            sale["created_at"] = datetime.utcnow()
+    
+    return fast_response(request, sales)
+
+# Customer Routes
+CUSTOMER_PROJECTION = {"_id": 0, "name_lower": 0}
+CUSTOMER_TYPEAHEAD_PROJECTION = {"_id": 0, "id": 1, "name": 1, "phone": 1, "email": 1, "last_purchase_at": 1}
+CUSTOMER_HISTORY_PROJECTION = {
+    "_id": 0, "id": 1, "sale_number": 1, "exhibition_id": 1, "items": 1,
+    "total_amount": 1, "payments": 1, "created_at": 1
+}
+
+@router.get("/customers/search")
+async def search_customers(
+    request: Request,
+    q: str,
+    limit: int = 10,
+    current_user: CurrentUser = Depends(require(Permission.POS))
+):
+    """POS typeahead on phone or name prefix"""
+    if not q.strip():
+        return fast_response(request, [])
+    limit = min(limit, 50)
+    cursor = db.customers.find(customer_search_filter(q), CUSTOMER_TYPEAHEAD_PROJECTION)
+    customers = await cursor.sort("last_purchase_at", -1).limit(limit).to_list(limit)
+    return fast_response(request, customers)
+
+@router.get("/customers/history")
+async def get_customer_history(
+    request: Request,
+    phone: str,
+    limit: int = 50,
+    current_user: CurrentUser = Depends(require(Permission.POS))
+):
+    """Profile and purchases of a customer by phone, newest first"""
+    phone_normalized = normalize_phone(phone)
+    if not phone_normalized:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+    customer = await db.customers.find_one({"phone_normalized": phone_normalized}, CUSTOMER_PROJECTION)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    cursor = db.enhanced_sales.find({"customer_phone_normalized": phone_normalized}, CUSTOMER_HISTORY_PROJECTION)
+    sales = await cursor.sort("created_at", -1).limit(limit).to_list(limit)
+    customer["average_order_value"] = (
+        round(customer["lifetime_value"] / customer["purchase_count"], 2) if customer.get("purchase_count") else 0.0
+    )
+    return fast_response(request, {"customer": customer, "sales": sales})
+
+# Leads Routes
+LEAD_PROJECTION = {"_id": 0, "phone_normalized": 0, "email_normalized": 0}
+
+@router.post("/leads")
+async def create_lead(
+    lead: LeadCreate,
+    current_user: CurrentUser = Depends(require(Permission.LEADS))
+):
+    """Capture one lead; a repeat visitor updates the existing lead"""
+    summary = await capture_leads([lead], current_user.id)
+    if summary["errors"]:
+        raise HTTPException(status_code=400, detail=summary["errors"][0]["error"])
+    saved = await find_lead(lead.exhibition_id, normalize_phone(lead.phone), normalize_email(lead.email), LEAD_PROJECTION)
+    response = {**saved, "duplicate": summary["duplicates"] > 0}
+    if summary["conflicts"]:
+        # Phone and email belong to different leads: this one kept its email
+        response["email_lead_id"] = summary["conflicts"][0]["email_lead_id"]
+    return response
+
+@router.post("/leads/batch")
+async def create_leads_batch(
+    batch: LeadBatchCreate,
+    current_user: CurrentUser = Depends(require(Permission.LEADS))
+):
+    """Capture many leads with one unordered bulk upsert"""
+    return await capture_leads(batch.leads, current_user.id)
+
+@router.get("/leads/exhibition/{exhibition_id}")
+async def get_exhibition_leads(
+    request: Request,
+    exhibition_id: str,
+    status: Optional[LeadStatus] = None,
+    limit: int = 500,
+    current_user: CurrentUser = Depends(require(Permission.LEADS))
+):
+    query: Dict[str, Any] = {"exhibition_id": exhibition_id}
+    if status:
+        query["status"] = status
+    leads = await db.leads.find(query, LEAD_PROJECTION).sort("updated_at", -1).limit(limit).to_list(limit)
+    return fast_response(request, leads)
+
+@router.get("/leads/exhibition/{exhibition_id}/stats")
+async def get_exhibition_lead_stats(
+    exhibition_id: str,
+    current_user: CurrentUser = Depends(require(Permission.LEADS))
+):
+    stats = await db.lead_stats.find_one({"exhibition_id": exhibition_id}, {"_id": 0}) or {}
+    leads = stats.get("leads", 0)
+    converted = stats.get("converted", 0)
+    return {
+        "exhibition_id": exhibition_id,
+        "leads": leads,
+        "captures": stats.get("captures", 0),
+        "converted": converted,
+        "conversion_rate": round(converted / leads * 100, 2) if leads else 0.0
+    }
+
+@router.put("/leads/{lead_id}/status")
+async def update_lead_status(
+    lead_id: str,
+    update: LeadStatusUpdate,
+    current_user: CurrentUser = Depends(require(Permission.LEADS))
+):
+    result = await db.leads.update_one(
+        {"id": lead_id},
+        {"$set": {"status": update.status, "updated_at": datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    return {"success": True}
@@ -0,0 +1,165 @@
+"""User management and the audit trail"""
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+
+from database import db
+from models import AuditAction, CurrentUser, Permission, User, UserCreate, UserResponse
+from serialization import EXISTS_PROJECTION, USER_PROJECTION, fast_response
+from rollups import to_utc_naive
+from audit import audit_log
+from security import (
+    REVOKED_ALL_VERSIONS, SUPER_ADMIN_ONLY, bump_token_version, get_password_hash, require,
+    token_revocations
+)
+
+router = APIRouter(prefix="/api")
+
+# User Management Routes (Super Admin only)
+@router.get("/users", response_model=List[UserResponse])
+async def get_all_users(current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))):
+    users = await db.users.find({}, USER_PROJECTION).to_list(100)
+    valid_users = []
+    
+    for user in users:
+        # Skip users with invalid data
+        if not user.get('username') or user.get('role') not in ['super_admin', 'admin', 'cashier', 'inventory']:
+            continue
+            
+        # Clean up user data for response
+        user_data = {
+            'id': user.get('id', str(user.get('_id', ''))),
+            'username': user.get('username'),
+            'full_name': user.get('full_name'),
+            'role': user.get('role'),
+            'phone': user.get('phone'),
+            'permissions': user.get('permissions', []),
+            'created_at': user.get('created_at'),
+            'is_active': user.get('is_active', True)
+        }
+        valid_users.append(UserResponse(**user_data))
+    
+    return valid_users
+
+@router.post("/users", response_model=UserResponse)
+async def create_user_with_permissions(
+    user_data: UserCreate,
+    current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))
+):
+    # Check if user already exists
+    existing_user = await db.users.find_one({"username": user_data.username}, EXISTS_PROJECTION)
+    if existing_user:
+        raise HTTPException(status_code=400, detail="Username already exists")
+    
+    # Hash password
+    password_hash = get_password_hash(user_data.password)
+    
+    # Create user
+    user = User(
+        username=user_data.username,
+        full_name=user_data.full_name,
+        role=user_data.role,
+        phone=user_data.phone,
+        permissions=user_data.permissions,
+        password_hash=password_hash
+    )
+    
+    await db.users.insert_one(user.model_dump())
+    await audit_log.record(
+        AuditAction.USER_CREATED, current_user, target_id=user.id,
+        details={"username": user.username, "role": user.role, "permissions": user.permissions}
+    )
+    return UserResponse(**user.model_dump())
+
+@router.put("/users/{user_id}/permissions")
+async def update_user_permissions(
+    user_id: str,
+    permissions: List[Permission],
+    current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))
+):
+    result = await db.users.update_one(
+        {"id": user_id},
+        {"$set": {"permissions": permissions, "updated_at": datetime.utcnow()}}
+    )
+    
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await bump_token_version(user_id)
+    await audit_log.record(
+        AuditAction.PERMISSIONS_UPDATED, current_user, target_id=user_id, details={"permissions": permissions}
+    )
+    return {"success": True, "message": "Permissions updated successfully"}
+
+@router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(
+    user_id: str,
+    current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))
+):
+    user = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Clean up user data for response
+    user_data = {
+        'id': user.get('id', str(user.get('_id', ''))),
+        'username': user.get('username'),
+        'full_name': user.get('full_name'),
+        'role': user.get('role'),
+        'phone': user.get('phone'),
+        'permissions': user.get('permissions', []),
+        'created_at': user.get('created_at'),
+        'is_active': user.get('is_active', True)
+    }
+    
+    return UserResponse(**user_data)
+
+@router.delete("/users/{user_id}")
+async def delete_user(
+    user_id: str,
+    current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))
+):
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot delete yourself")
+    
+    result = await db.users.delete_one({"id": user_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await token_revocations.revoke(user_id, REVOKED_ALL_VERSIONS)
+    
+    await audit_log.record(AuditAction.USER_DELETED, current_user, target_id=user_id)
+    return {"success": True, "message": "User deleted successfully"}
+
+# Audit Routes
+@router.get("/audit")
+async def get_audit_log(
+    request: Request,
+    action: Optional[AuditAction] = None,
+    actor_id: Optional[str] = None,
+    target_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    limit: int = 100,
+    current_user: CurrentUser = Depends(require(Permission.USER_MANAGEMENT, roles=SUPER_ADMIN_ONLY))
+):
+    """Newest-first audit events; pass the last created_at as `before` for the next page"""
+    query: Dict[str, Any] = {}
+    if action:
+        query["action"] = action
+    if actor_id:
+        query["actor_id"] = actor_id
+    if target_id:
+        query["target_id"] = target_id
+    if start or end or before:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = to_utc_naive(start)
+        if end:
+            query["created_at"]["$lte"] = to_utc_naive(end)
+        if before:
+            query["created_at"]["$lt"] = to_utc_naive(before)
+    limit = min(limit, 1000)
+    events = await db.audit_log.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    return fast_response(request, events)
@@ -0,0 +1,464 @@
+"""Password hashing, tokens, permission checks and login throttling"""
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pymongo import ReturnDocument
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+from jose import JWTError, jwt
+import os
+import logging
+import hashlib
+import asyncio
+import math
+import time
+import orjson
+
+from config import (
+    ALGORITHM, AUTH_MODE, AUTH_REVOCATION_REFRESH_SECONDS, LOGIN_IP_DELAY_SECONDS,
+    LOGIN_IP_MAX_DELAY_SECONDS, LOGIN_IP_MAX_FAILURES, LOGIN_IP_MAX_WAITING, LOGIN_LOCKOUT_MAX_SECONDS,
+    LOGIN_LOCKOUT_SECONDS, LOGIN_THROTTLE_BACKEND, LOGIN_USER_MAX_FAILURES,
+    LOGIN_WINDOW_SECONDS, SECRET_KEY
+)
+from audit import client_ip
+from database import db
+from models import CurrentUser, Permission, UserRole
+from serialization import CURRENT_USER_PROJECTION
+from tracing import span, traced
+
+logger = logging.getLogger(__name__)
+
+# Simple password hashing
+def get_password_hash(password: str) -> str:
+    """Hash password using SHA-256 with configurable salt for security"""
+    salt = os.environ.get('PASSWORD_SALT')
+    if not salt:
+        raise ValueError("PASSWORD_SALT environment variable must be set for production security")
+    return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify password against hash"""
+    return get_password_hash(plain_password) == hashed_password
+
+security = HTTPBearer()
+
+# Bit i of a permission mask is the i-th Permission; new permissions go at the end
+PERMISSION_BITS = {permission: 1 << bit for bit, permission in enumerate(Permission)}
+
+def permission_mask(permissions) -> int:
+    mask = 0
+    for permission in permissions:
+        mask |= PERMISSION_BITS.get(Permission(permission), 0)
+    return mask
+
+def mask_permissions(mask: int) -> List[Permission]:
+    return [permission for permission, bit in PERMISSION_BITS.items() if mask & bit]
+
+ALL_PERMISSIONS = permission_mask(Permission)
+ROLE_BITS = {role: 1 << bit for bit, role in enumerate(UserRole)}
+
+def role_mask(*roles: UserRole) -> int:
+    mask = 0
+    for role in roles:
+        mask |= ROLE_BITS[role]
+    return mask
+
+ANY_ROLE = role_mask(*UserRole)
+ADMIN_ROLES = role_mask(UserRole.ADMIN, UserRole.SUPER_ADMIN)
+STOCK_ROLES = role_mask(UserRole.ADMIN, UserRole.SUPER_ADMIN, UserRole.INVENTORY)
+SUPER_ADMIN_ONLY = role_mask(UserRole.SUPER_ADMIN)
+
+def effective_permission_mask(role: UserRole, mask: int) -> int:
+    # Super Admin holds every permission, including ones added after their token was issued
+    return ALL_PERMISSIONS if role == UserRole.SUPER_ADMIN else mask
+
+REVOKED_ALL_VERSIONS = 2 ** 31
+
+class TokenRevocations:
+    """Minimum token version still accepted per user, mirrored from token_revocations.
+
+    Entries are only written for users whose tokens were invalidated and expire
+    with the longest-lived token, so the list stays small. This worker's own
+    revocations apply at once; other workers pick them up on the next refresh.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.min_versions: Dict[str, int] = {}
+        self.synced_until: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def accepts(self, user_id: str, version: int) -> bool:
+        return version >= self.min_versions.get(user_id, 0)
+
+    async def revoke(self, user_id: str, min_version: int):
+        self.min_versions[user_id] = max(min_version, self.min_versions.get(user_id, 0))
+        await db.token_revocations.update_one(
+            {"user_id": user_id},
+            {"$max": {"min_version": min_version}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def refresh(self):
+        query: Dict[str, Any] = {}
+        started = datetime.utcnow()
+        if self.synced_until:
+            # Overlap the window so writes racing the last refresh are not missed
+            query["updated_at"] = {"$gte": self.synced_until - timedelta(seconds=self.refresh_seconds)}
+        async for entry in db.token_revocations.find(query, {"_id": 0, "user_id": 1, "min_version": 1}):
+            self.min_versions[entry["user_id"]] = max(entry["min_version"], self.min_versions.get(entry["user_id"], 0))
+        self.synced_until = started
+
+    def start(self):
+        self.task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Token revocation refresh failed")
+
+token_revocations = TokenRevocations(AUTH_REVOCATION_REFRESH_SECONDS)
+
+class SlidingWindowCounter:
+    """Approximate sliding-window counts: the current fixed window plus the
+    previous one weighted by how much of it still overlaps the sliding window"""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.counts: Dict[str, List[float]] = {}  # key -> [window index, current, previous]
+
+    def _roll(self, key: str, now: float) -> List[float]:
+        index = int(now // self.window_seconds)
+        entry = self.counts.get(key)
+        if entry is None or entry[0] < index - 1:
+            entry = self.counts[key] = [index, 0, 0]
+        elif entry[0] == index - 1:
+            entry[:] = [index, 0, entry[1]]
+        return entry
+
+    def estimate(self, key: str, now: float) -> float:
+        if key not in self.counts:
+            return 0.0
+        index, current, previous = self._roll(key, now)
+        overlap = 1 - (now % self.window_seconds) / self.window_seconds
+        return current + previous * overlap
+
+    def add(self, key: str, now: float, amount: float = 1) -> float:
+        self._roll(key, now)[1] += amount
+        return self.estimate(key, now)
+
+    def reset(self, key: str):
+        self.counts.pop(key, None)
+
+    def prune(self, now: float):
+        oldest = int(now // self.window_seconds) - 1
+        for key in [key for key, entry in self.counts.items() if entry[0] < oldest]:
+            del self.counts[key]
+
+class LoginThrottle:
+    """Brute-force guard for /auth/login keyed by username and by client IP.
+
+    Too many failures inside the sliding window lock the key out; each further
+    lockout doubles (up to the maximum) until a successful login, or a quiet
+    maximum-lockout period, resets it. A locked username is refused by
+    retry_after(), a dictionary lookup made before any database read or
+    password hashing. A locked client IP is only slowed down by ip_delay():
+    one address can stand for a whole venue behind NAT, so it never causes a
+    refusal of valid credentials.
+    With the mongo backend failures are counted in login_failures and lockouts
+    published to login_lockouts, which every worker mirrors in memory.
+    """
+
+    def __init__(self, window_seconds: float, shared: bool):
+        self.window_seconds = window_seconds
+        self.shared = shared
+        self.failures = SlidingWindowCounter(window_seconds)
+        self.lockouts: Dict[str, List[float]] = {}  # key -> [locked until, lockout level]
+        self.waiting: Dict[str, int] = {}  # client IP -> attempts sitting out their delay
+        self.operations = 0
+        self.synced_until: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def keys(username: str, ip: Optional[str]) -> List[tuple]:
+        keys = [("user:" + username.strip().lower(), LOGIN_USER_MAX_FAILURES)]
+        if ip:
+            keys.append(("ip:" + ip, LOGIN_IP_MAX_FAILURES))
+        return keys
+
+    def retry_after(self, username: str) -> float:
+        """Seconds until this username may try again; 0 when it is allowed now"""
+        key = self.keys(username, None)[0][0]
+        lockout = self.lockouts.get(key)
+        now = time.time()
+        return lockout[0] - now if lockout and lockout[0] > now else 0.0
+
+    def ip_delay(self, ip: Optional[str]) -> float:
+        """Seconds to hold an attempt from a locked-out client IP before checking it"""
+        lockout = self.lockouts.get("ip:" + ip) if ip else None
+        if not lockout or lockout[0] <= time.time():
+            return 0.0
+        return min(LOGIN_IP_DELAY_SECONDS * 2 ** (lockout[1] - 1), LOGIN_IP_MAX_DELAY_SECONDS)
+
+    def hold(self, ip: str) -> bool:
+        """Take one of the address's waiting places; False when they are all taken"""
+        if self.waiting.get(ip, 0) >= LOGIN_IP_MAX_WAITING:
+            return False
+        self.waiting[ip] = self.waiting.get(ip, 0) + 1
+        return True
+
+    def unhold(self, ip: str):
+        if self.waiting[ip] <= 1:
+            del self.waiting[ip]
+        else:
+            self.waiting[ip] -= 1
+
+    async def record_failure(self, username: str, ip: Optional[str]) -> List[str]:
+        """Count a failed attempt; returns the keys it locked out"""
+        now = time.time()
+        locked = []
+        for key, limit in self.keys(username, ip):
+            if self.shared:
+                count = await self._shared_failure(key, now)
+            else:
+                count = self.failures.add(key, now)
+            if count >= limit:
+                locked.append(key)
+                await self._lock(key, now)
+        self._maybe_prune(now)
+        return locked
+
+    async def record_success(self, username: str, ip: Optional[str]):
+        key = self.keys(username, ip)[0][0]
+        self.failures.reset(key)
+        self.lockouts.pop(key, None)
+        if self.shared:
+            await db.login_failures.delete_many({"key": key})
+            await db.login_lockouts.delete_one({"key": key})
+
+    async def _lock(self, key: str, now: float):
+        until, level = self.lockouts.get(key, [0.0, 0])
+        if now - until > LOGIN_LOCKOUT_MAX_SECONDS:
+            level = 0  # Quiet long enough: start over at the base lockout
+        level += 1
+        until = now + min(LOGIN_LOCKOUT_SECONDS * 2 ** (level - 1), LOGIN_LOCKOUT_MAX_SECONDS)
+        self.lockouts[key] = [until, level]
+        self.failures.reset(key)
+        if self.shared:
+            await db.login_failures.delete_many({"key": key})
+            await db.login_lockouts.update_one(
+                {"key": key},
+                {"$set": {
+                    "until": until, "level": level, "updated_at": datetime.utcnow(),
+                    "expires_at": datetime.utcnow() + timedelta(seconds=until - now + LOGIN_LOCKOUT_MAX_SECONDS)
+                }},
+                upsert=True
+            )
+
+    async def _shared_failure(self, key: str, now: float) -> float:
+        index = int(now // self.window_seconds)
+        window = await db.login_failures.find_one_and_update(
+            {"key": key, "window": index},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(seconds=2 * self.window_seconds)}},
+            projection={"_id": 0, "count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = await db.login_failures.find_one({"key": key, "window": index - 1}, {"_id": 0, "count": 1})
+        overlap = 1 - (now % self.window_seconds) / self.window_seconds
+        return window["count"] + (previous["count"] if previous else 0) * overlap
+
+    def _maybe_prune(self, now: float):
+        self.operations += 1
+        if self.operations % 1000:
+            return
+        self.failures.prune(now)
+        horizon = now - LOGIN_LOCKOUT_MAX_SECONDS
+        for key in [key for key, (until, _) in self.lockouts.items() if until < horizon]:
+            del self.lockouts[key]
+
+    async def refresh(self):
+        started = datetime.utcnow()
+        query: Dict[str, Any] = {}
+        if self.synced_until:
+            query["updated_at"] = {"$gte": self.synced_until - timedelta(seconds=AUTH_REVOCATION_REFRESH_SECONDS)}
+        async for lockout in db.login_lockouts.find(query, {"_id": 0, "key": 1, "until": 1, "level": 1}):
+            current = self.lockouts.get(lockout["key"])
+            if current is None or lockout["until"] > current[0]:
+                self.lockouts[lockout["key"]] = [lockout["until"], lockout["level"]]
+        self.synced_until = started
+
+    def start(self):
+        if self.shared:
+            self.task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(AUTH_REVOCATION_REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Login lockout refresh failed")
+
+login_throttle = LoginThrottle(LOGIN_WINDOW_SECONDS, shared=LOGIN_THROTTLE_BACKEND == "mongo")
+
+class LoginPacingMiddleware:
+    """ASGI middleware that makes login attempts from a slowed-down client IP
+    sit out their delay before admission control, so the wait never holds one
+    of the login class's slots. Only LOGIN_IP_MAX_WAITING attempts per address
+    wait at once; the rest are turned away with a 429 and Retry-After."""
+
+    def __init__(self, app, throttle: LoginThrottle, path: str = "/api/auth/login"):
+        self.app = app
+        self.throttle = throttle
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        ip = client_ip(Request(scope))
+        delay = self.throttle.ip_delay(ip)
+        if not delay:
+            return await self.app(scope, receive, send)
+        if not self.throttle.hold(ip):
+            return await self.reject(delay, send)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.throttle.unhold(ip)
+        await self.app(scope, receive, send)
+
+    async def reject(self, delay: float, send):
+        body = orjson.dumps({"detail": "Too many login attempts from your address, try again shortly"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(delay)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+def user_token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything get_current_user needs to authorize without reading the user"""
+    return {
+        "sub": user["username"],
+        "uid": user["id"],
+        "name": user["full_name"],
+        "role": user["role"],
+        "perms": permission_mask(user.get("permissions", [])),
+        "ver": user.get("token_version", 0)
+    }
+
+async def bump_token_version(user_id: str) -> Optional[int]:
+    """Invalidate a user's outstanding tokens; they sign in again to pick up changes"""
+    user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"token_version": 1}},
+        projection={"_id": 0, "token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        return None
+    await token_revocations.revoke(user_id, user["token_version"])
+    return user["token_version"]
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    with span("auth.jwt_encode"):
+        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+@traced("auth.get_current_user")
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        with span("auth.jwt_decode"):
+            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+    
+    if AUTH_MODE == "stateless" and "uid" in payload:
+        if not token_revocations.accepts(payload["uid"], payload.get("ver", 0)):
+            raise credentials_exception
+        try:
+            role = UserRole(payload["role"])
+            mask = effective_permission_mask(role, payload.get("perms", 0))
+            return CurrentUser(
+                id=payload["uid"],
+                username=username,
+                full_name=payload["name"],
+                role=role,
+                permissions=mask_permissions(mask),
+                permission_mask=mask
+            )
+        except (KeyError, ValueError):
+            raise credentials_exception
+    
+    # Tokens issued before the claims existed (or lookup mode) read the user
+    user = await db.users.find_one({"username": username}, CURRENT_USER_PROJECTION)
+    if user is None:
+        raise credentials_exception
+    current_user = CurrentUser(**user)
+    current_user.permission_mask = effective_permission_mask(current_user.role, permission_mask(current_user.permissions))
+    return current_user
+
+class Policy:
+    """A route's requirement compiled to masks: one of `roles` and all of `permissions`"""
+    __slots__ = ("roles", "permissions", "detail")
+
+    def __init__(self, roles: int, permissions: int, detail: str):
+        self.roles = roles
+        self.permissions = permissions
+        self.detail = detail
+
+    def allows(self, user: CurrentUser) -> bool:
+        return bool(ROLE_BITS[user.role] & self.roles) and user.permission_mask & self.permissions == self.permissions
+
+def require(*permissions: Permission, roles: int = ANY_ROLE):
+    """Dependency authorizing the current user against a policy built once, at import"""
+    if roles == SUPER_ADMIN_ONLY:
+        detail = "Super Admin access required"
+    elif permissions:
+        detail = f"Permission required: {', '.join(permission.value for permission in permissions)}"
+    else:
+        detail = "Access denied for your role"
+    policy = Policy(roles, permission_mask(permissions), detail)
+
+    @traced("auth.authorize")
+    async def authorize(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+        if not policy.allows(current_user):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=policy.detail)
+        return current_user
+
+    authorize.policy = policy
+    return authorize
@@ -0,0 +1,93 @@
+"""Response encoding and the per-route field projections"""
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from typing import Dict, Any
+from functools import lru_cache
+from datetime import datetime
+import hashlib
+import orjson
+
+from models import (
+    CategoryResponse, CurrentUser, ExhibitionResponse, InventoryResponse, ProductResponse,
+    SaleResponse, UserResponse
+)
+from tracing import span
+
+# Response serialization
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def fields_of(model) -> Dict[str, int]:
+    """Mongo projection selecting only the fields declared on a response model"""
+    projection = {name: 1 for name in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+@lru_cache(maxsize=None)
+def _msgpack():
+    """Imported on the first MessagePack request; None when it is not installed"""
+    try:
+        import msgpack
+    except ImportError:  # MessagePack responses are optional
+        return None
+    return msgpack
+
+def fast_response(request: Request, content: Any) -> Response:
+    """Encode already-shaped documents directly, skipping response_model validation.
+
+    Documents must come from a projected read so they only carry response fields.
+    Clients sending `Accept: application/msgpack` get MessagePack when it is installed.
+    """
+    if MSGPACK_MEDIA_TYPE in request.headers.get("accept", "") and _msgpack() is not None:
+        with span("serialize.msgpack"):
+            return Response(
+                content=_msgpack().packb(content, default=_msgpack_default),
+                media_type=MSGPACK_MEDIA_TYPE
+            )
+    with span("serialize.orjson"):
+        return ORJSONResponse(content)
+
+class TracedJSONResponse(JSONResponse):
+    """The app's default JSON response, with its encoding timed in sampled traces"""
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize.json"):
+            return super().render(content)
+
+# Field projections: each route reads only the fields it returns or decides on
+EXISTS_PROJECTION = {"_id": 1}
+CURRENT_USER_PROJECTION = {name: flag for name, flag in fields_of(CurrentUser).items() if name != "permission_mask"}
+USER_PROFILE_PROJECTION = fields_of(UserResponse)
+USER_PROJECTION = {**USER_PROFILE_PROJECTION, "_id": 1}
+LOGIN_USER_PROJECTION = {**fields_of(UserResponse), "password_hash": 1, "token_version": 1}
+PRODUCT_PROJECTION = fields_of(ProductResponse)
+SALE_PRODUCT_PROJECTION = {"_id": 0, "name": 1, "price": 1, "stock_quantity": 1}
+SALE_LIST_PROJECTION = fields_of(SaleResponse)
+RECENT_SALE_PROJECTION = {"_id": 0, "items": 0}
+CATEGORY_PROJECTION = fields_of(CategoryResponse)
+EXHIBITION_PROJECTION = {**fields_of(ExhibitionResponse), "_id": 1}
+INVENTORY_LIST_PROJECTION = fields_of(InventoryResponse)
+PRICE_BOOK_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "price": 1, "variations.name": 1, "variations.value": 1, "variations.price_adjustment": 1}
+PRICE_BOOK_VARIANT_PROJECTION = {"_id": 0, "id": 1, "product_id": 1, "attributes_key": 1, "price_adjustment": 1}
+VARIANT_PROJECTION = {"_id": 0, "attributes_key": 0}
+VARIANT_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "category": 1, "sku": 1}
+PRICE_BOOK_INVENTORY_PROJECTION = {"_id": 0, "product_id": 1, "product_name": 1, "product_price": 1}
+ALLOCATION_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "price": 1, "stock_quantity": 1}
+TRANSFER_INVENTORY_PROJECTION = {"_id": 0, "product_id": 1, "product_name": 1, "product_price": 1, "remaining_quantity": 1}
+LOW_STOCK_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "stock_quantity": 1, "min_stock_level": 1}
+LOW_STOCK_INVENTORY_PROJECTION = {
+    "_id": 0, "product_id": 1, "product_name": 1, "remaining_quantity": 1, "min_stock_level": 1
+}
+STOCK_MOVEMENT_PROJECTION = {"_id": 0}
+EXHIBITION_SALE_PROJECTION = {
+    "_id": 0, "id": 1, "sale_number": 1, "exhibition_id": 1, "customer_name": 1,
+    "customer_phone": 1, "total_amount": 1, "change_given": 1, "created_at": 1
+}
+
+def content_hash(value: Any) -> str:
+    return hashlib.sha256(orjson.dumps(value, option=orjson.OPT_SORT_KEYS)).hexdigest()
@@ -0,0 +1,216 @@
+"""Stock movements, low stock flags and product variants"""
+
+from pymongo import UpdateOne
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+import uuid
+import os
+import re
+import asyncio
+
+from database import db
+from models import ProductVariant, ProductVariantCreate
+from serialization import LOW_STOCK_INVENTORY_PROJECTION, LOW_STOCK_PRODUCT_PROJECTION
+
+def merge_quantities(lines) -> Dict[str, int]:
+    """Collapse repeated product lines into one quantity per product"""
+    quantities: Dict[str, int] = {}
+    for line in lines:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+    return quantities
+
+# Low stock flags are recomputed inside the same update pipeline that moves the
+# stock, so "what's running out" is an indexed read of is_low_stock=True
+EXHIBITION_MIN_STOCK_LEVEL = int(os.environ.get('EXHIBITION_MIN_STOCK_LEVEL', '5'))
+PRODUCT_LOW_STOCK_STAGE = {"$set": {"is_low_stock": {"$lte": ["$stock_quantity", "$min_stock_level"]}}}
+INVENTORY_LOW_STOCK_STAGE = {"$set": {"is_low_stock": {"$lte": ["$remaining_quantity", "$min_stock_level"]}}}
+
+def product_stock_update(delta: int) -> List[Dict[str, Any]]:
+    return [
+        {"$set": {"stock_quantity": {"$add": ["$stock_quantity", delta]}}},
+        PRODUCT_LOW_STOCK_STAGE
+    ]
+
+def inventory_stock_update(remaining_delta: int, sold_delta: int = 0, allocated_delta: int = 0) -> List[Dict[str, Any]]:
+    changes = {"remaining_quantity": {"$add": ["$remaining_quantity", remaining_delta]}}
+    if sold_delta:
+        changes["sold_quantity"] = {"$add": ["$sold_quantity", sold_delta]}
+    if allocated_delta:
+        changes["allocated_quantity"] = {"$add": ["$allocated_quantity", allocated_delta]}
+    return [{"$set": changes}, INVENTORY_LOW_STOCK_STAGE]
+
+def inventory_upsert(exhibition_id: str, product_id: str, product_name: str, product_price: float,
+                     quantity: int, now: datetime) -> UpdateOne:
+    """Add allocated stock to an exhibition, creating its inventory row if needed"""
+    return UpdateOne(
+        {"exhibition_id": exhibition_id, "product_id": product_id},
+        [
+            {"$set": {
+                "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                "product_name": {"$literal": product_name},
+                "product_price": product_price,
+                "min_stock_level": {"$ifNull": ["$min_stock_level", EXHIBITION_MIN_STOCK_LEVEL]},
+                "allocated_quantity": {"$add": [{"$ifNull": ["$allocated_quantity", 0]}, quantity]},
+                "sold_quantity": {"$ifNull": ["$sold_quantity", 0]},
+                "remaining_quantity": {"$add": [{"$ifNull": ["$remaining_quantity", 0]}, quantity]},
+                "created_at": {"$ifNull": ["$created_at", now]}
+            }},
+            INVENTORY_LOW_STOCK_STAGE
+        ],
+        upsert=True
+    )
+
+def variant_key(attributes: Dict[str, str]) -> str:
+    """Canonical, order-independent key of a variant's attribute values"""
+    return "|".join(f"{name.strip().lower()}={value.strip().lower()}" for name, value in sorted(attributes.items()))
+
+def default_variant_sku(product_sku: str, attributes: Dict[str, str]) -> str:
+    values = [re.sub(r"[^A-Za-z0-9]+", "", value).upper() for _, value in sorted(attributes.items())]
+    return "-".join([product_sku, *values])
+
+def variant_upsert(product: Dict[str, Any], variant: ProductVariantCreate, now: datetime) -> UpdateOne:
+    """Create the variant if its attribute combination is new; existing stock is never reset"""
+    document = ProductVariant(
+        product_id=product["id"],
+        product_name=product["name"],
+        category=product["category"],
+        sku=variant.sku or default_variant_sku(product["sku"], variant.attributes),
+        barcode=variant.barcode,
+        attributes=variant.attributes,
+        attributes_key=variant_key(variant.attributes),
+        price_adjustment=variant.price_adjustment,
+        stock_quantity=variant.stock_quantity,
+        created_at=now,
+        updated_at=now
+    ).model_dump()
+    return UpdateOne(
+        {"product_id": document["product_id"], "attributes_key": document["attributes_key"]},
+        {"$setOnInsert": document},
+        upsert=True
+    )
+
+async def take_variant_stock(lines: List[tuple]) -> Optional[str]:
+    """Atomically decrement each (variant_id, quantity); all or nothing.
+
+    Returns the id of the first variant without enough stock after undoing
+    the decrements already applied, or None when every line was taken.
+    """
+    taken = []
+    for variant_id, quantity in lines:
+        result = await db.product_variants.update_one(
+            {"id": variant_id, "stock_quantity": {"$gte": quantity}},
+            {"$inc": {"stock_quantity": -quantity}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count == 0:
+            await return_variant_stock(taken)
+            return variant_id
+        taken.append((variant_id, quantity))
+    return None
+
+async def return_variant_stock(lines: List[tuple]):
+    """Undo take_variant_stock for (variant_id, quantity) lines"""
+    if not lines:
+        return
+    await db.product_variants.bulk_write([
+        UpdateOne({"id": variant_id}, {"$inc": {"stock_quantity": quantity}, "$set": {"updated_at": datetime.utcnow()}})
+        for variant_id, quantity in lines
+    ], ordered=False)
+
+class LowStockNotifier:
+    """Fans low stock alerts out to connected dashboards (per worker process)"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: set = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, alerts: List[Dict[str, Any]]):
+        for queue in list(self.subscribers):
+            for alert in alerts:
+                try:
+                    queue.put_nowait(alert)
+                except asyncio.QueueFull:
+                    break  # Slow consumer; it will re-read the alert list on reconnect
+
+low_stock_notifier = LowStockNotifier()
+
+def low_stock_alert(scope: str, item: Dict[str, Any], exhibition_id: Optional[str] = None) -> Dict[str, Any]:
+    if scope == "warehouse":
+        return {
+            "scope": scope, "exhibition_id": None, "product_id": item["id"], "product_name": item["name"],
+            "quantity": item["stock_quantity"], "min_stock_level": item["min_stock_level"]
+        }
+    return {
+        "scope": scope, "exhibition_id": exhibition_id, "product_id": item["product_id"],
+        "product_name": item["product_name"], "quantity": item["remaining_quantity"],
+        "min_stock_level": item["min_stock_level"]
+    }
+
+def crossed_low_stock(quantity: int, min_stock_level: int, decrement: int) -> bool:
+    """True when a decrement just moved stock from above to at/below the threshold"""
+    return quantity <= min_stock_level < quantity + decrement
+
+async def publish_low_stock(scope: str, exhibition_id: Optional[str], product_ids: List[str]):
+    """Re-read the touched rows that are now low (used after bulk admin moves)"""
+    if not low_stock_notifier.subscribers:
+        return
+    if scope == "warehouse":
+        rows = await db.products.find(
+            {"id": {"$in": product_ids}, "is_low_stock": True}, LOW_STOCK_PRODUCT_PROJECTION
+        ).to_list(None)
+    else:
+        rows = await db.inventory.find(
+            {"exhibition_id": exhibition_id, "product_id": {"$in": product_ids}, "is_low_stock": True},
+            LOW_STOCK_INVENTORY_PROJECTION
+        ).to_list(None)
+    low_stock_notifier.publish([low_stock_alert(scope, row, exhibition_id) for row in rows])
+
+# Stock levels are the last snapshot plus the movements recorded after it.
+# Snapshots only fold in movements older than this, so in-flight transactions
+# that stamped created_at slightly earlier can't be skipped.
+SNAPSHOT_SETTLE_SECONDS = 60
+
+async def movement_totals(exhibition_id: str, after: Optional[datetime], until: Optional[datetime] = None) -> Dict[str, int]:
+    created_at: Dict[str, datetime] = {}
+    if after:
+        created_at["$gt"] = after
+    if until:
+        created_at["$lte"] = until
+    match: Dict[str, Any] = {"exhibition_id": exhibition_id}
+    if created_at:
+        match["created_at"] = created_at
+    totals = await db.stock_movements.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$product_id", "delta": {"$sum": "$quantity_delta"}}}
+    ]).to_list(None)
+    return {total["_id"]: total["delta"] for total in totals}
+
+async def derive_stock_levels(exhibition_id: str) -> Dict[str, int]:
+    snapshot = await db.stock_snapshots.find_one({"exhibition_id": exhibition_id}, {"_id": 0, "as_of": 1, "levels": 1})
+    levels = dict(snapshot["levels"]) if snapshot else {}
+    for product_id, delta in (await movement_totals(exhibition_id, snapshot["as_of"] if snapshot else None)).items():
+        levels[product_id] = levels.get(product_id, 0) + delta
+    return levels
+
+async def compact_stock_snapshot(exhibition_id: str) -> Dict[str, Any]:
+    """Fold settled movements into the exhibition's snapshot"""
+    snapshot = await db.stock_snapshots.find_one({"exhibition_id": exhibition_id}, {"_id": 0, "as_of": 1, "levels": 1})
+    as_of = datetime.utcnow() - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)
+    levels = dict(snapshot["levels"]) if snapshot else {}
+    if snapshot and snapshot["as_of"] >= as_of:
+        return snapshot
+    for product_id, delta in (await movement_totals(exhibition_id, snapshot["as_of"] if snapshot else None, as_of)).items():
+        levels[product_id] = levels.get(product_id, 0) + delta
+    await db.stock_snapshots.update_one(
+        {"exhibition_id": exhibition_id},
+        {"$set": {"as_of": as_of, "levels": levels}},
+        upsert=True
+    )
+    return {"as_of": as_of, "levels": levels}
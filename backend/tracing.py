@@ -0,0 +1,290 @@
+"""Request tracing: OpenTelemetry-shaped spans for requests, auth, Mongo commands
+and serialization, exported as OTLP/JSON to a file and/or a collector"""
+
+from pymongo import monitoring
+from typing import List, Optional, Dict, Any
+from collections import deque
+from contextvars import ContextVar
+import os
+import time
+import random
+import asyncio
+import logging
+import functools
+import urllib.request
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Off by default. When on, TRACE_SAMPLE_RATE of requests are traced unless the
+# caller's traceparent already decided; unsampled requests only pay for the coin flip.
+TRACING = os.environ.get('TRACING', 'off') == 'on'
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.05'))
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'badshah-hakimi-pos')
+# Each export batch is one OTLP/JSON line; the endpoint is an OTLP/HTTP
+# collector's /v1/traces, and either may be left empty
+TRACE_EXPORT_PATH = os.environ.get('TRACE_EXPORT_PATH', 'traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', '')
+TRACE_FLUSH_SECONDS = float(os.environ.get('TRACE_FLUSH_SECONDS', '2'))
+TRACE_QUEUE_SIZE = int(os.environ.get('TRACE_QUEUE_SIZE', '20000'))
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        exporter.add(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            otlp["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return otlp
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class SpanScope:
+    """Context manager running its block as a child of the current span"""
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self.token)
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        self.span.finish()
+        return False
+
+class NoSpan:
+    """Stands in for a span outside sampled requests, so untraced code pays ~nothing"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NO_SPAN = NoSpan()
+
+def span(name: str, **attributes):
+    parent = current_span.get()
+    if parent is None:
+        return NO_SPAN
+    return SpanScope(Span(parent.trace_id, parent.span_id, name, KIND_INTERNAL, attributes))
+
+def traced(name: str):
+    """Run an async function (e.g. a FastAPI dependency) inside a span; the
+    signature is preserved so FastAPI still resolves its parameters"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """One client span per Mongo command issued inside a sampled request.
+
+    Motor runs pymongo on executor threads with a copy of the caller's context,
+    so the request's current span is visible when a command starts.
+    """
+
+    def __init__(self):
+        self.open: Dict[tuple, Span] = {}
+
+    def started(self, event):
+        parent = current_span.get()
+        if parent is None:
+            return
+        attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name}
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        self.open[(event.request_id, event.connection_id)] = Span(
+            parent.trace_id, parent.span_id, f"mongo.{event.command_name}", KIND_CLIENT, attributes
+        )
+
+    def succeeded(self, event):
+        command_span = self.open.pop((event.request_id, event.connection_id), None)
+        if command_span is not None:
+            command_span.finish()
+
+    def failed(self, event):
+        command_span = self.open.pop((event.request_id, event.connection_id), None)
+        if command_span is not None:
+            command_span.error = str(event.failure.get("errmsg", event.failure))
+            command_span.finish()
+
+mongo_tracer = MongoCommandTracer()
+
+class SpanExporter:
+    """Buffers finished spans and writes them out in batches off the event loop.
+
+    Spans arrive from the loop and from Motor's threads; a full buffer drops
+    new spans (counted) rather than growing without bound.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.spans: deque = deque()
+        self.dropped = 0
+        self.exported = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, finished: Span):
+        if len(self.spans) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.spans.append(finished)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(TRACE_FLUSH_SECONDS)
+            await self.flush()
+
+    async def flush(self):
+        batch: List[Span] = []
+        while self.spans:
+            batch.append(self.spans.popleft())
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self.export, batch)
+            self.exported += len(batch)
+        except Exception as error:
+            logger.warning("Dropped %d spans, export failed: %s", len(batch), error)
+
+    def export(self, batch: List[Span]):
+        payload = orjson.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [item.to_otlp() for item in batch]}]
+        }]})
+        if TRACE_EXPORT_PATH:
+            with open(TRACE_EXPORT_PATH, "ab") as out:
+                out.write(payload + b"\n")
+        if TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT, data=payload, headers={"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+
+exporter = SpanExporter(TRACE_QUEUE_SIZE)
+
+def parse_traceparent(value: bytes) -> Optional[tuple]:
+    """W3C traceparent -> (trace_id, parent span_id, sampled)"""
+    parts = value.decode("latin-1").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3][:2], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+class TracingMiddleware:
+    """Opens the server span for sampled HTTP requests; everything awaited
+    beneath it (dependencies, Mongo commands, serialization) becomes a child"""
+
+    def __init__(self, app, sample_rate: float):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value)
+                break
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = None, None, random.random() < self.sample_rate
+        if not sampled:
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        server_span = Span(
+            trace_id or random.getrandbits(128).to_bytes(16, "big").hex(), parent_id,
+            f"{method} {scope['path']}", KIND_SERVER, {"http.method": method, "http.target": scope["path"]}
+        )
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                server_span.attributes["http.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    server_span.error = f"HTTP {message['status']}"
+            await send(message)
+
+        token = current_span.set(server_span)
+        try:
+            await self.app(scope, receive, send_traced)
+        except Exception as error:
+            server_span.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                # Name by template so spans of one route group together
+                server_span.name = f"{method} {route.path}"
+                server_span.attributes["http.route"] = route.path
+            server_span.finish()
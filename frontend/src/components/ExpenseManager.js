@@ -3,12 +3,22 @@ import { AuthContext } from '../App';
 import axios from 'axios';
 import './styles.css';
 
+// Calendar day on this device's clock, which is the venue's; toISOString() would give the UTC day
+const localDate = (date = new Date()) => {
+  const month = String(date.getMonth() + 1).padStart(2, '0');
+  const day = String(date.getDate()).padStart(2, '0');
+  return `${date.getFullYear()}-${month}-${day}`;
+};
+
 const ExpenseManager = () => {
   const { API } = useContext(AuthContext);
   const [expenses, setExpenses] = useState([]);
   const [loading, setLoading] = useState(false);
   const [activeTab, setActiveTab] = useState('daily');
-  const [selectedDate, setSelectedDate] = useState(new Date().toISOString().split('T')[0]);
+  const [selectedDate, setSelectedDate] = useState(localDate());
+  const [exhibitions, setExhibitions] = useState([]);
+  const [selectedExhibition, setSelectedExhibition] = useState('');
+  const storageKey = `expenses_${selectedDate}_${selectedExhibition}`;
   
   // Expense categories with default amounts
   const expenseCategories = [
@@ -24,7 +34,7 @@ const ExpenseManager = () => {
 
   // Daily expense amounts for current date
   const [dailyExpenses, setDailyExpenses] = useState(() => {
-    const savedExpenses = localStorage.getItem(`expenses_${selectedDate}`);
+    const savedExpenses = localStorage.getItem(storageKey);
     if (savedExpenses) {
       return JSON.parse(savedExpenses);
     }
@@ -44,12 +54,29 @@ const ExpenseManager = () => {
   // Quick amount buttons
   const quickAmounts = [25, 50, 75, 100, 150, 200, 300, 500];
 
+  useEffect(() => {
+    fetchExhibitions();
+  }, []);
+
   useEffect(() => {
     loadDailyExpenses();
-  }, [selectedDate]);
+  }, [selectedDate, selectedExhibition]);
+
+  const fetchExhibitions = async () => {
+    try {
+      const response = await axios.get(`${API}/exhibitions`);
+      const activeExhibitions = response.data.filter(e => e.status === 'active');
+      setExhibitions(activeExhibitions);
+      if (activeExhibitions.length > 0) {
+        setSelectedExhibition(activeExhibitions[0].id);
+      }
+    } catch (error) {
+      console.error('Error fetching exhibitions:', error);
+    }
+  };
 
   const loadDailyExpenses = () => {
-    const savedExpenses = localStorage.getItem(`expenses_${selectedDate}`);
+    const savedExpenses = localStorage.getItem(storageKey);
     if (savedExpenses) {
       setDailyExpenses(JSON.parse(savedExpenses));
     } else {
@@ -67,7 +94,7 @@ const ExpenseManager = () => {
   };
 
   const saveDailyExpenses = (newExpenses) => {
-    localStorage.setItem(`expenses_${selectedDate}`, JSON.stringify(newExpenses));
+    localStorage.setItem(storageKey, JSON.stringify(newExpenses));
     setDailyExpenses(newExpenses);
   };
 
@@ -105,15 +132,19 @@ const ExpenseManager = () => {
       alert('Please enter an amount greater than 0');
       return;
     }
+    if (!selectedExhibition) {
+      alert('Please select an exhibition');
+      return;
+    }
 
     try {
-      // Here you would typically save to backend
-      // await axios.post(`${API}/expenses`, {
-      //   category: category.name,
-      //   amount: expense.amount,
-      //   note: expense.note,
-      //   date: selectedDate
-      // });
+      await axios.post(`${API}/expenses`, {
+        exhibition_id: selectedExhibition,
+        category: category.name,
+        amount: expense.amount,
+        note: expense.note,
+        date: selectedDate
+      });
 
       const updatedExpenses = {
         ...dailyExpenses,
@@ -157,10 +188,10 @@ const ExpenseManager = () => {
 
   const getExpenseHistory = () => {
     const history = [];
-    const keys = Object.keys(localStorage).filter(key => key.startsWith('expenses_'));
+    const keys = Object.keys(localStorage).filter(key => key.startsWith('expenses_') && key.endsWith(`_${selectedExhibition}`));
     
     keys.forEach(key => {
-      const date = key.replace('expenses_', '');
+      const date = key.slice('expenses_'.length, 'expenses_'.length + 10);
       const expenses = JSON.parse(localStorage.getItem(key) || '{}');
       const total = Object.values(expenses).reduce((sum, exp) => sum + (exp.amount || 0), 0);
       const loggedTotal = Object.values(expenses).filter(exp => exp.logged).reduce((sum, exp) => sum + (exp.amount || 0), 0);
@@ -182,6 +213,18 @@ const ExpenseManager = () => {
         </div>
         
         <div className="flex items-center space-x-4">
+          <select
+            value={selectedExhibition}
+            onChange={(e) => setSelectedExhibition(e.target.value)}
+            className="form-select"
+          >
+            <option value="">Select Exhibition</option>
+            {exhibitions.map(exhibition => (
+              <option key={exhibition.id} value={exhibition.id}>
+                {exhibition.name}
+              </option>
+            ))}
+          </select>
           <input
             type="date"
             value={selectedDate}
@@ -255,7 +298,7 @@ const ExpenseManager = () => {
         <div className="space-y-6">
           <div className="text-center mb-6">
             <h2 className="text-xl font-semibold text-gray-800 mb-2">
-              Expenses for {new Date(selectedDate).toLocaleDateString('en-US', { 
+              Expenses for {new Date(`${selectedDate}T00:00`).toLocaleDateString('en-US', { 
                 weekday: 'long', 
                 year: 'numeric', 
                 month: 'long', 
@@ -367,7 +410,7 @@ const ExpenseManager = () => {
                   <div className="flex items-center justify-between mb-4">
                     <div>
                       <h3 className="font-semibold text-gray-800">
-                        {new Date(day.date).toLocaleDateString('en-US', { 
+                        {new Date(`${day.date}T00:00`).toLocaleDateString('en-US', { 
                           weekday: 'long', 
                           year: 'numeric', 
                           month: 'long', 
@@ -0,0 +1,77 @@
+"""Shared fixtures: the FastAPI app running against an in-memory Mongo per test"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pos_test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("PASSWORD_SALT", "test-salt")
+os.environ.setdefault("SUPER_ADMIN_PASSWORD", "test-password")
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+import server
+from routers import inventory, pos
+from pricing import price_book
+from security import login_throttle
+
+SUPER_ADMIN = "Murtaza Taher"
+SUPER_ADMIN_PASSWORD = os.environ["SUPER_ADMIN_PASSWORD"]
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """A fresh in-memory database behind both connection pools"""
+    client = AsyncMongoMockClient()
+    name = f"pos_test_{uuid.uuid4().hex[:8]}"
+    database.db.use(client, name)
+    database.backoffice_db.use(client, name)
+
+    async def run_transaction(callback):
+        # mongomock has no sessions: run the callback without one and put every
+        # collection back if it raises, as a replica set would on abort
+        delegate = client[name].delegate
+        saved = {collection: list(delegate[collection].find()) for collection in delegate.list_collection_names()}
+        try:
+            return await callback(None)
+        except BaseException:
+            for collection in delegate.list_collection_names():
+                delegate[collection].delete_many({})
+                if saved.get(collection):
+                    delegate[collection].insert_many(saved[collection])
+            raise
+
+    for module in (database, inventory, pos):
+        monkeypatch.setattr(module, "run_transaction", run_transaction)
+    yield client[name]
+    database.db.close()
+    database.backoffice_db.close()
+
+@pytest.fixture
+def client(mongo):
+    login_throttle.failures.counts.clear()
+    login_throttle.lockouts.clear()
+    login_throttle.waiting.clear()
+    # Per-process caches must not carry one test's catalog into the next
+    price_book.invalidate()
+    price_book.booths.clear()
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+def login(client: TestClient, username: str = SUPER_ADMIN, password: str = SUPER_ADMIN_PASSWORD,
+          headers=None) -> dict:
+    response = client.post("/api/auth/login", json={"username": username, "password": password}, headers=headers)
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture
+def admin(client) -> dict:
+    return login(client)
@@ -0,0 +1,65 @@
+"""Admission control: route classes, the checkout reserve and fast rejections"""
+
+import asyncio
+
+import httpx
+
+import security
+import server
+from admission import (
+    BACKOFFICE, CHECKOUT, LOGIN, STANDARD, AdmissionController, RouteClass, admission, route_class
+)
+from security import login_throttle
+from tests.conftest import SUPER_ADMIN, SUPER_ADMIN_PASSWORD
+
+def test_route_classes():
+    assert route_class("POST", "/api/sales/enhanced") == CHECKOUT
+    assert route_class("POST", "/api/sales") == CHECKOUT
+    assert route_class("POST", "/api/auth/login") == LOGIN
+    assert route_class("GET", "/api/products") == STANDARD
+    assert route_class("GET", "/api/analytics/dashboard") == BACKOFFICE
+    assert route_class("GET", "/api/health") is None
+    assert route_class("GET", "/docs") is None
+
+def test_login_does_not_share_checkout_capacity():
+    login, checkout = admission.classes[LOGIN], admission.classes[CHECKOUT]
+    assert not login.reserved
+    assert login.limit < checkout.limit
+
+def test_reserved_slots_only_go_to_checkout():
+    async def scenario():
+        controller = AdmissionController(4, 2, [
+            RouteClass(CHECKOUT, 4, 4, 0.05, reserved=True, shed=False),
+            RouteClass(STANDARD, 4, 0, 0.05),
+        ])
+        checkout, standard = controller.classes[CHECKOUT], controller.classes[STANDARD]
+        assert await controller.admit(standard)
+        assert await controller.admit(standard)
+        # Two slots left, both held back for checkout
+        assert not await controller.admit(standard)
+        assert await controller.admit(checkout)
+        assert await controller.admit(checkout)
+        assert controller.running == 4
+
+    asyncio.run(scenario())
+
+def test_throttled_login_waits_without_a_login_slot(client, monkeypatch):
+    monkeypatch.setattr(security, "LOGIN_IP_MAX_FAILURES", 3)
+    monkeypatch.setattr(security, "LOGIN_IP_DELAY_SECONDS", 0.2)
+    for i in range(3):
+        client.post("/api/auth/login", json={"username": f"guess{i}", "password": "wrong"})
+    assert login_throttle.ip_delay("testclient") > 0
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app, client=("testclient", 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://pos") as http:
+            attempt = asyncio.create_task(http.post(
+                "/api/auth/login", json={"username": SUPER_ADMIN, "password": SUPER_ADMIN_PASSWORD}
+            ))
+            await asyncio.sleep(0.05)
+            waiting = login_throttle.waiting.get("testclient"), admission.classes[LOGIN].running
+            return waiting, (await attempt).status_code
+
+    (held, running), status = client.portal.call(scenario)
+    assert held == 1 and running == 0
+    assert status == 200
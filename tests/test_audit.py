@@ -0,0 +1,98 @@
+"""Audit events are batched off the request path and none are lost on shutdown"""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import audit
+import server
+from audit import AuditLog
+from models import AuditAction
+from tests.conftest import SUPER_ADMIN, login
+
+def count(mongo, query=None):
+    return asyncio.run(mongo.audit_log.count_documents(query or {}))
+
+def watch_batches(log):
+    sizes = []
+    write = log._write
+
+    async def recording(batch):
+        if batch:
+            sizes.append(len(batch))
+        await write(batch)
+
+    log._write = recording
+    return sizes
+
+def test_events_are_written_in_batches(mongo):
+    async def scenario():
+        log = AuditLog(queue_size=100, batch_size=3, flush_seconds=60)
+        sizes = watch_batches(log)
+        log.start()
+        for _ in range(7):
+            await log.record(AuditAction.LOGIN, actor_name="cashier")
+        for _ in range(100):
+            if await mongo.audit_log.count_documents({}) >= 6:
+                break
+            await asyncio.sleep(0.01)
+        # Two full batches are out; the partial one waits for its deadline
+        await asyncio.sleep(0.05)
+        written = await mongo.audit_log.count_documents({})
+        await log.stop()
+        return sizes, written
+
+    sizes, written = asyncio.run(scenario())
+    assert written == 6
+    assert sizes == [3, 3, 1]
+    assert count(mongo) == 7
+
+def test_partial_batch_is_flushed_after_the_interval(mongo):
+    async def scenario():
+        log = AuditLog(queue_size=100, batch_size=500, flush_seconds=0.05)
+        sizes = watch_batches(log)
+        log.start()
+        await log.record(AuditAction.LOGIN, actor_name="a")
+        await log.record(AuditAction.LOGIN, actor_name="b")
+        await asyncio.sleep(0.2)
+        written = await mongo.audit_log.count_documents({})
+        await log.stop()
+        return sizes, written
+
+    assert asyncio.run(scenario()) == ([2], 2)
+
+def test_full_buffer_writes_inline_rather_than_dropping(mongo, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_ENQUEUE_TIMEOUT_SECONDS", 0.01)
+
+    async def scenario():
+        log = AuditLog(queue_size=2, batch_size=500, flush_seconds=60)
+        for name in ("a", "b", "c"):
+            await log.record(AuditAction.LOGIN, actor_name=name)
+        inline = await mongo.audit_log.distinct("actor_name")
+        await log.stop()
+        return inline
+
+    assert asyncio.run(scenario()) == ["c"]
+    assert count(mongo) == 3
+
+def test_retried_batch_does_not_duplicate_events(mongo):
+    async def scenario():
+        log = AuditLog(queue_size=10, batch_size=10, flush_seconds=60)
+        batch = [{"id": "event-1", "action": "login"}, {"id": "event-2", "action": "login"}]
+        await mongo.audit_log.create_index("id", unique=True)
+        await log._write([dict(event) for event in batch])
+        await log._write([dict(event) for event in batch])
+
+    asyncio.run(scenario())
+    assert count(mongo) == 2
+
+def test_shutdown_flushes_buffered_events(mongo, monkeypatch):
+    # A flush interval longer than the test: only shutdown can write these
+    monkeypatch.setattr(audit.audit_log, "flush_seconds", 60)
+    with TestClient(server.app) as client:
+        login(client)
+        for _ in range(3):
+            client.post("/api/auth/login", json={"username": SUPER_ADMIN, "password": "wrong"})
+        assert count(mongo) == 0
+    assert count(mongo, {"action": AuditAction.LOGIN_FAILED.value}) == 3
+    assert count(mongo, {"action": AuditAction.LOGIN.value}) == 1
@@ -0,0 +1,148 @@
+"""Route x role authorization matrix.
+
+EXPECTED is the access table every /api route is held to. Each route's
+compiled policy must match it, and every combination it denies must come
+back 403 over HTTP before the handler runs.
+"""
+
+import re
+
+import pytest
+from fastapi.routing import APIRoute
+
+import server
+from models import CurrentUser, Permission, UserRole
+from security import ALL_PERMISSIONS, create_access_token, effective_permission_mask, permission_mask
+
+SA, A, C, I = UserRole.SUPER_ADMIN, UserRole.ADMIN, UserRole.CASHIER, UserRole.INVENTORY
+ANY = {SA, A, C, I}
+ADMINS = {SA, A}
+STOCK = {SA, A, I}
+SUPER = {SA}
+PUBLIC = None
+
+# (method, path): (roles allowed, permission required)
+EXPECTED = {
+    ("GET", "/api/health"): PUBLIC,
+    ("GET", "/api/metrics/single-flight"): (ADMINS, None),
+    ("GET", "/api/metrics/admission"): (ADMINS, None),
+    ("GET", "/api/metrics/loop"): (ADMINS, None),
+    ("POST", "/api/auth/register"): PUBLIC,
+    ("POST", "/api/auth/login"): PUBLIC,
+    ("GET", "/api/auth/me"): (ANY, None),
+    ("POST", "/api/products"): (STOCK, Permission.PRODUCTS),
+    ("POST", "/api/products/import"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/products/export"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/products"): PUBLIC,
+    ("GET", "/api/products/{product_id}"): PUBLIC,
+    ("POST", "/api/products/{product_id}/variants"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/products/{product_id}/variants"): PUBLIC,
+    ("GET", "/api/variants/in-stock"): PUBLIC,
+    ("PUT", "/api/variants/{variant_id}/stock"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/categories"): PUBLIC,
+    ("POST", "/api/categories"): (ADMINS, Permission.CATEGORIES),
+    ("POST", "/api/sales"): (ANY, Permission.POS),
+    ("GET", "/api/sales"): (ANY, Permission.POS),
+    ("POST", "/api/sales/enhanced"): (ANY, Permission.POS),
+    ("GET", "/api/sales/exhibition/{exhibition_id}"): (ANY, None),
+    ("GET", "/api/customers/search"): (ANY, Permission.POS),
+    ("GET", "/api/customers/history"): (ANY, Permission.POS),
+    ("POST", "/api/leads"): (ANY, Permission.LEADS),
+    ("POST", "/api/leads/batch"): (ANY, Permission.LEADS),
+    ("GET", "/api/leads/exhibition/{exhibition_id}"): (ANY, Permission.LEADS),
+    ("GET", "/api/leads/exhibition/{exhibition_id}/stats"): (ANY, Permission.LEADS),
+    ("PUT", "/api/leads/{lead_id}/status"): (ANY, Permission.LEADS),
+    ("GET", "/api/exhibitions"): (ANY, None),
+    ("POST", "/api/exhibitions"): (ADMINS, Permission.EXHIBITIONS),
+    ("GET", "/api/inventory/exhibition/{exhibition_id}"): (ANY, None),
+    ("POST", "/api/inventory/exhibition/{exhibition_id}/allocate"): (STOCK, Permission.EXHIBITIONS),
+    ("POST", "/api/inventory/transfers"): (STOCK, Permission.EXHIBITIONS),
+    ("GET", "/api/inventory/movements"): (STOCK, Permission.EXHIBITIONS),
+    ("GET", "/api/inventory/exhibition/{exhibition_id}/levels"): (ANY, None),
+    ("POST", "/api/inventory/exhibition/{exhibition_id}/snapshot"): (STOCK, Permission.EXHIBITIONS),
+    ("GET", "/api/alerts/low-stock"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/alerts/low-stock/stream"): (STOCK, Permission.PRODUCTS),
+    ("GET", "/api/analytics/dashboard"): (ADMINS, Permission.DASHBOARD),
+    ("GET", "/api/analytics/sales/timeseries"): (ADMINS, Permission.DASHBOARD),
+    ("GET", "/api/analytics/top-products"): (ADMINS, Permission.DASHBOARD),
+    ("POST", "/api/analytics/top-products/verify"): (ADMINS, Permission.DASHBOARD),
+    ("POST", "/api/expenses"): (ANY, Permission.EXPENSES),
+    ("POST", "/api/expenses/bulk"): (ANY, Permission.EXPENSES),
+    ("GET", "/api/expenses"): (ANY, Permission.EXPENSES),
+    ("GET", "/api/expenses/pnl"): (ADMINS, Permission.EXPENSES),
+    ("GET", "/api/expenses/pnl/{exhibition_id}/closure"): (ANY, Permission.EXHIBITION_CLOSURE),
+    ("POST", "/api/expenses/pnl/rebuild"): (ADMINS, Permission.EXPENSES),
+    ("POST", "/api/reports"): (ADMINS, Permission.REPORTS),
+    ("GET", "/api/reports"): (ADMINS, Permission.REPORTS),
+    ("GET", "/api/reports/{job_id}"): (ADMINS, Permission.REPORTS),
+    ("GET", "/api/reports/{job_id}/download"): (ADMINS, Permission.REPORTS),
+    ("GET", "/api/users"): (SUPER, Permission.USER_MANAGEMENT),
+    ("POST", "/api/users"): (SUPER, Permission.USER_MANAGEMENT),
+    ("PUT", "/api/users/{user_id}/permissions"): (SUPER, Permission.USER_MANAGEMENT),
+    ("GET", "/api/users/{user_id}"): (SUPER, Permission.USER_MANAGEMENT),
+    ("DELETE", "/api/users/{user_id}"): (SUPER, Permission.USER_MANAGEMENT),
+    ("GET", "/api/audit"): (SUPER, Permission.USER_MANAGEMENT),
+}
+
+def route_policy(dependant):
+    for dependency in dependant.dependencies:
+        policy = getattr(dependency.call, "policy", None) or route_policy(dependency)
+        if policy is not None:
+            return policy
+    return None
+
+def api_routes():
+    for route in server.app.routes:
+        if isinstance(route, APIRoute) and route.path.startswith("/api/"):
+            for method in route.methods:
+                yield (method, route.path), route
+
+ROUTES = dict(api_routes())
+PROTECTED = sorted(key for key, expected in EXPECTED.items() if expected is not PUBLIC)
+
+def token(role: UserRole, mask: int) -> dict:
+    claims = {"sub": f"{role.value}-user", "uid": f"{role.value}-id", "name": role.value,
+              "role": role.value, "perms": mask, "ver": 0}
+    return {"Authorization": f"Bearer {create_access_token(claims)}"}
+
+def allowed(role: UserRole, mask: int, expected) -> bool:
+    roles, permission = expected
+    if role not in roles:
+        return False
+    # Super Admin holds every permission whatever the token says
+    return permission is None or role == SA or bool(mask & permission_mask([permission]))
+
+def test_every_route_is_in_the_matrix():
+    assert set(ROUTES) == set(EXPECTED)
+
+@pytest.mark.parametrize("key", sorted(EXPECTED))
+def test_compiled_policy_matches_the_matrix(key):
+    policy = route_policy(ROUTES[key].dependant)
+    expected = EXPECTED[key]
+    if expected is PUBLIC:
+        assert policy is None
+        return
+    roles, permission = expected
+    for role in UserRole:
+        for mask in (0, ALL_PERMISSIONS):
+            user = CurrentUser(id="u", username="u", full_name="u", role=role,
+                               permission_mask=effective_permission_mask(role, mask))
+            assert policy.allows(user) == allowed(role, mask, expected), (key, role, mask)
+
+@pytest.mark.parametrize("key", PROTECTED)
+def test_denied_combinations_get_403(client, key):
+    method, path = key
+    url = re.sub(r"\{[^}]+\}", "x1", path)
+    denied = [(role, mask) for role in UserRole for mask in (0, ALL_PERMISSIONS)
+              if not allowed(role, mask, EXPECTED[key])]
+    for role, mask in denied:
+        response = client.request(method, url, headers=token(role, mask))
+        assert response.status_code == 403, (key, role, mask, response.text)
+    assert client.request(method, url).status_code in (401, 403)
+
+def test_allowed_roles_get_through(client):
+    for role in UserRole:
+        response = client.get("/api/exhibitions", headers=token(role, 0))
+        assert response.status_code == 200, (role, response.text)
+    assert client.get("/api/sales", headers=token(C, permission_mask([Permission.POS]))).status_code == 200
+    assert client.get("/api/sales", headers=token(C, 0)).status_code == 403
@@ -0,0 +1,108 @@
+"""Checkout regressions: empty carts and partial failures must not leave a
+recorded sale out of step with stock"""
+
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+def create_product(client, headers, stock=10, price=100.0):
+    response = client.post("/api/products", headers=headers, json={
+        "name": "Oud Royale", "description": "50ml", "category": "perfume",
+        "price": price, "sku": "OUD-50", "stock_quantity": stock
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def count(mongo, collection, query=None):
+    return asyncio.run(mongo[collection].count_documents(query or {}))
+
+def test_legacy_sale_rejects_empty_cart(client, admin, mongo):
+    response = client.post("/api/sales", headers=admin, json={
+        "items": [], "payment_method": "cash", "payment_received": 0
+    })
+    assert response.status_code == 400
+    assert count(mongo, "sales") == 0
+
+def test_enhanced_sale_rejects_empty_cart(client, admin, mongo):
+    response = client.post("/api/sales/enhanced", headers=admin, json={
+        "exhibition_id": "expo-1", "items": [], "payments": []
+    })
+    assert response.status_code == 400
+    assert count(mongo, "enhanced_sales") == 0
+
+def test_legacy_sale_records_product_sales(client, admin, mongo):
+    product = create_product(client, admin)
+    response = client.post("/api/sales", headers=admin, json={
+        "items": [{"product_id": product["id"], "quantity": 2}],
+        "payment_method": "cash", "payment_received": 500
+    })
+    assert response.status_code == 200, response.text
+    assert count(mongo, "product_sales", {"product_id": product["id"], "quantity": 2}) == 1
+
+def seed_exhibition_stock(mongo, product, quantity=10):
+    asyncio.run(mongo.inventory.insert_one({
+        "id": "inv-1", "exhibition_id": "expo-1", "product_id": product["id"],
+        "product_name": product["name"], "product_price": product["price"],
+        "allocated_quantity": quantity, "sold_quantity": 0, "remaining_quantity": quantity,
+        "min_stock_level": 2
+    }))
+
+def remaining(mongo, product):
+    return asyncio.run(mongo.inventory.find_one({"product_id": product["id"]}))["remaining_quantity"]
+
+def test_enhanced_sale_takes_stock_when_derived_writes_fail(client, admin, mongo, monkeypatch):
+    from routers import pos
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("rollup store unavailable")
+
+    monkeypatch.setattr(pos, "bump_pnl_rollup", broken)
+    monkeypatch.setattr(pos, "record_customer_purchase", broken)
+    product = create_product(client, admin)
+    seed_exhibition_stock(mongo, product)
+    response = client.post("/api/sales/enhanced", headers=admin, json={
+        "exhibition_id": "expo-1", "customer_phone": "+971 50 000 0000",
+        "items": [{"product_id": product["id"], "quantity": 3}],
+        "payments": [{"type": "cash", "amount": 315}]
+    })
+    assert response.status_code == 200, response.text
+    assert count(mongo, "enhanced_sales") == 1
+    assert remaining(mongo, product) == 7
+    assert count(mongo, "stock_movements", {"reference_id": response.json()["id"]}) == 1
+
+def test_variant_stock_returned_when_sale_insert_fails(client, admin, mongo):
+    product = create_product(client, admin)
+    response = client.post(f"/api/products/{product['id']}/variants", headers=admin, json=[
+        {"attributes": {"Size": "100ml"}, "stock_quantity": 5}
+    ])
+    assert response.status_code == 200, response.text
+    variant = client.get(f"/api/products/{product['id']}/variants", headers=admin).json()[0]
+    # Any insert for this exhibition now fails with a duplicate key error
+    asyncio.run(mongo.enhanced_sales.create_index("exhibition_id", unique=True))
+    asyncio.run(mongo.enhanced_sales.insert_one({"id": "earlier", "exhibition_id": "expo-1"}))
+
+    with pytest.raises(DuplicateKeyError):
+        client.post("/api/sales/enhanced", headers=admin, json={
+            "exhibition_id": "expo-1",
+            "items": [{"product_id": product["id"], "variant_id": variant["id"], "quantity": 2}],
+            "payments": [{"type": "cash", "amount": 210}]
+        })
+    stored = asyncio.run(mongo.product_variants.find_one({"id": variant["id"]}))
+    assert stored["stock_quantity"] == 5
+
+def test_sale_and_stock_roll_back_together_when_the_ledger_write_fails(client, admin, mongo):
+    product = create_product(client, admin)
+    seed_exhibition_stock(mongo, product)
+    # Any movement for this exhibition now fails with a duplicate key error
+    asyncio.run(mongo.stock_movements.create_index("exhibition_id", unique=True))
+    asyncio.run(mongo.stock_movements.insert_one({"id": "earlier", "exhibition_id": "expo-1"}))
+
+    with pytest.raises(BulkWriteError):
+        client.post("/api/sales/enhanced", headers=admin, json={
+            "exhibition_id": "expo-1",
+            "items": [{"product_id": product["id"], "quantity": 3}],
+            "payments": [{"type": "cash", "amount": 315}]
+        })
+    assert count(mongo, "enhanced_sales") == 0
+    assert remaining(mongo, product) == 10
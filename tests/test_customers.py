@@ -0,0 +1,76 @@
+"""Customer profiles folded from enhanced sales, found by phone or name prefix"""
+
+import asyncio
+
+from crm import customer_search_filter
+
+def create_product(client, headers, price=100.0):
+    response = client.post("/api/products", headers=headers, json={
+        "name": "Oud Royale", "description": "50ml", "category": "perfume",
+        "price": price, "sku": "OUD-50", "stock_quantity": 100
+    })
+    assert response.status_code == 200, response.text
+    product = response.json()
+    return product
+
+def seed_exhibition_stock(mongo, product):
+    asyncio.run(mongo.inventory.insert_one({
+        "id": "inv-1", "exhibition_id": "expo-1", "product_id": product["id"],
+        "product_name": product["name"], "product_price": product["price"],
+        "allocated_quantity": 50, "sold_quantity": 0, "remaining_quantity": 50, "min_stock_level": 2
+    }))
+
+def sell(client, headers, product, quantity, **customer):
+    response = client.post("/api/sales/enhanced", headers=headers, json={
+        "exhibition_id": "expo-1", "items": [{"product_id": product["id"], "quantity": quantity}],
+        "payments": [{"type": "cash", "amount": 105 * quantity}], **customer
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_sales_fold_into_one_profile_per_phone(client, admin, mongo):
+    product = create_product(client, admin)
+    seed_exhibition_stock(mongo, product)
+    first = sell(client, admin, product, 1, customer_phone="+971 50 123 4567", customer_name="Aisha Khan")
+    second = sell(client, admin, product, 2, customer_phone="00971501234567", customer_email=" Aisha@Example.com ")
+    sell(client, admin, product, 1)
+
+    customers = asyncio.run(mongo.customers.find({}, {"_id": 0}).to_list(None))
+    assert len(customers) == 1
+    customer, = customers
+    assert customer["phone_normalized"] == "+971501234567"
+    assert customer["name"] == "Aisha Khan" and customer["email"] == "aisha@example.com"
+    assert customer["purchase_count"] == 2
+    assert customer["lifetime_value"] == first["total_amount"] + second["total_amount"]
+
+    history = client.get("/api/customers/history", headers=admin, params={"phone": "+971-50-123-4567"}).json()
+    assert [sale["id"] for sale in history["sales"]] == [second["id"], first["id"]]
+    assert history["customer"]["average_order_value"] == round(customer["lifetime_value"] / 2, 2)
+    assert "name_lower" not in history["customer"]
+
+def test_history_needs_a_known_phone(client, admin):
+    assert client.get("/api/customers/history", headers=admin, params={"phone": "n/a"}).status_code == 400
+    assert client.get("/api/customers/history", headers=admin, params={"phone": "+971500000000"}).status_code == 404
+
+def test_search_by_phone_or_name_prefix(client, admin, mongo):
+    product = create_product(client, admin)
+    seed_exhibition_stock(mongo, product)
+    sell(client, admin, product, 1, customer_phone="+971 50 123 4567", customer_name="Aisha Khan")
+    sell(client, admin, product, 1, customer_phone="0501112222", customer_name="Omar Saleh")
+
+    def search(q):
+        response = client.get("/api/customers/search", headers=admin, params={"q": q})
+        assert response.status_code == 200, response.text
+        return [customer["name"] for customer in response.json()]
+
+    assert search("+971 50 12") == ["Aisha Khan"]
+    assert search("97150") == ["Aisha Khan"]
+    assert search("050111") == ["Omar Saleh"]
+    assert search("aIsHa") == ["Aisha Khan"]
+    assert search("Khan") == []
+    assert search("   ") == []
+
+def test_search_filter_is_anchored_and_escaped():
+    assert customer_search_filter("a.b")["name_lower"] == {"$regex": r"^a\.b"}
+    patterns = customer_search_filter("+971 50")["phone_normalized"]["$in"]
+    assert [pattern.pattern for pattern in patterns] == ["^97150", r"^\+97150"]
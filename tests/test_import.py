@@ -0,0 +1,43 @@
+"""Bulk product import: bad rows are reported per row, never abort the stream"""
+
+import orjson
+
+def summary(response):
+    lines = [orjson.loads(line) for line in response.content.splitlines() if line]
+    assert lines and lines[-1]["type"] == "summary", response.content
+    return lines[-1]
+
+def test_jsonl_rows_that_are_not_objects_are_row_errors(client, admin):
+    upload = b"\n".join([
+        b"[1, 2]",
+        b"5",
+        b'"x"',
+        b"{not json",
+        orjson.dumps({"name": "Amber", "description": "30ml", "category": "perfume", "price": 80, "sku": "AMB-30"}),
+    ]) + b"\n"
+    response = client.post("/api/products/import", headers=admin,
+                           files={"file": ("products.jsonl", upload, "application/x-ndjson")})
+    assert response.status_code == 200
+    result = summary(response)
+    assert result["inserted"] == 1
+    assert result["failed"] == 4
+    assert [error["row"] for error in result["errors"]] == [1, 2, 3, 4]
+
+def test_csv_that_is_not_utf8_is_rejected_before_streaming(client, admin):
+    upload = "name,description,category,price,sku\nCafé Noir,50ml,perfume,90,CAF-50\n".encode("latin-1")
+    response = client.post("/api/products/import", headers=admin,
+                           files={"file": ("products.csv", upload, "text/csv")})
+    assert response.status_code == 400
+    assert "UTF-8" in response.json()["detail"]
+
+def test_csv_import_reports_invalid_rows(client, admin):
+    upload = (
+        "name,description,category,price,sku\n"
+        "Café Noir,50ml,perfume,90,CAF-50\n"
+        "Broken,50ml,perfume,not-a-price,BRK-50\n"
+    ).encode("utf-8")
+    response = client.post("/api/products/import", headers=admin,
+                           files={"file": ("products.csv", upload, "text/csv")})
+    result = summary(response)
+    assert result["inserted"] == 1
+    assert [error["row"] for error in result["errors"]] == [2]
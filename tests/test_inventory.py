@@ -0,0 +1,122 @@
+"""Stock allocation into exhibitions: all lines move together or none do"""
+
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+def create_exhibition(client, headers, name="Dubai Shopping Festival"):
+    response = client.post("/api/exhibitions", headers=headers, json={
+        "name": name, "location": "Dubai Mall",
+        "start_date": "2026-11-01T09:00:00", "end_date": "2026-11-30T22:00:00"
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def create_product(client, headers, sku, stock):
+    response = client.post("/api/products", headers=headers, json={
+        "name": f"Perfume {sku}", "description": "50ml", "category": "perfume",
+        "price": 100.0, "sku": sku, "stock_quantity": stock
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def warehouse(mongo, product_id):
+    return asyncio.run(mongo.products.find_one({"id": product_id}))["stock_quantity"]
+
+def inventory(mongo, exhibition_id):
+    rows = asyncio.run(mongo.inventory.find({"exhibition_id": exhibition_id}).to_list(None))
+    return {row["product_id"]: row["remaining_quantity"] for row in rows}
+
+def allocate(client, headers, exhibition_id, lines):
+    return client.post(f"/api/inventory/exhibition/{exhibition_id}/allocate", headers=headers, json={
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in lines]
+    })
+
+def test_allocation_moves_stock_and_records_movements(client, admin, mongo):
+    expo = create_exhibition(client, admin)
+    oud, musk = create_product(client, admin, "OUD", 20), create_product(client, admin, "MUSK", 8)
+    # Repeated lines for one product are merged
+    response = allocate(client, admin, expo, [(oud, 5), (musk, 3), (oud, 2)])
+    assert response.status_code == 200, response.text
+    assert response.json()["allocated_quantity"] == 10
+    assert (warehouse(mongo, oud), warehouse(mongo, musk)) == (13, 5)
+    assert inventory(mongo, expo) == {oud: 7, musk: 3}
+    levels = client.get(f"/api/inventory/exhibition/{expo}/levels", headers=admin).json()
+    assert {row["product_id"]: row["remaining_quantity"] for row in levels} == {oud: 7, musk: 3}
+
+    allocate(client, admin, expo, [(oud, 1)])
+    assert inventory(mongo, expo)[oud] == 8
+    movements = client.get("/api/inventory/movements", headers=admin, params={"exhibition_id": expo}).json()
+    assert sorted(movement["quantity_delta"] for movement in movements) == [1, 3, 7]
+
+def test_short_line_refuses_the_whole_allocation(client, admin, mongo):
+    expo = create_exhibition(client, admin)
+    oud, musk = create_product(client, admin, "OUD", 20), create_product(client, admin, "MUSK", 2)
+    response = allocate(client, admin, expo, [(oud, 5), (musk, 3)])
+    assert response.status_code == 400
+    assert "Perfume MUSK" in response.json()["detail"]
+    assert (warehouse(mongo, oud), warehouse(mongo, musk)) == (20, 2)
+    assert inventory(mongo, expo) == {}
+
+def test_unknown_product_or_exhibition_is_not_found(client, admin):
+    expo = create_exhibition(client, admin)
+    assert allocate(client, admin, expo, [("missing", 1)]).status_code == 404
+    assert allocate(client, admin, "missing", [("missing", 1)]).status_code == 404
+
+def test_failure_after_the_warehouse_decrement_rolls_it_back(client, admin, mongo):
+    expo = create_exhibition(client, admin)
+    oud = create_product(client, admin, "OUD", 20)
+    # The exhibition side of the move now fails with a duplicate key error
+    asyncio.run(mongo.stock_movements.create_index("reason", unique=True))
+    asyncio.run(mongo.stock_movements.insert_one({"id": "earlier", "reason": "allocation"}))
+    with pytest.raises(BulkWriteError):
+        allocate(client, admin, expo, [(oud, 5)])
+    assert warehouse(mongo, oud) == 20
+    assert inventory(mongo, expo) == {}
+
+def transfer(client, headers, source, destination, lines):
+    return client.post("/api/inventory/transfers", headers=headers, json={
+        "from_exhibition_id": source, "to_exhibition_id": destination,
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in lines]
+    })
+
+def test_transfer_moves_stock_between_exhibitions(client, admin, mongo):
+    dubai, sharjah = create_exhibition(client, admin), create_exhibition(client, admin, "Sharjah Expo")
+    oud = create_product(client, admin, "OUD", 20)
+    allocate(client, admin, dubai, [(oud, 10)])
+    response = transfer(client, admin, dubai, sharjah, [(oud, 4)])
+    assert response.status_code == 200, response.text
+    assert response.json()["transferred_quantity"] == 4
+    assert inventory(mongo, dubai) == {oud: 6}
+    assert inventory(mongo, sharjah) == {oud: 4}
+    assert warehouse(mongo, oud) == 10
+
+    transfer_id = response.json()["transfer_id"]
+    for expo, delta in ((dubai, -4), (sharjah, 4)):
+        movements = client.get("/api/inventory/movements", headers=admin, params={"exhibition_id": expo}).json()
+        assert [m["quantity_delta"] for m in movements if m["reference_id"] == transfer_id] == [delta]
+        levels = client.get(f"/api/inventory/exhibition/{expo}/levels", headers=admin).json()
+        assert levels == [{"product_id": oud, "remaining_quantity": inventory(mongo, expo)[oud]}]
+
+def test_transfer_refusals_leave_both_sides_untouched(client, admin, mongo):
+    dubai, sharjah = create_exhibition(client, admin), create_exhibition(client, admin, "Sharjah Expo")
+    oud, musk = create_product(client, admin, "OUD", 20), create_product(client, admin, "MUSK", 20)
+    allocate(client, admin, dubai, [(oud, 3)])
+    assert transfer(client, admin, dubai, dubai, [(oud, 1)]).status_code == 400
+    assert transfer(client, admin, dubai, sharjah, [(oud, 4)]).status_code == 400
+    assert transfer(client, admin, dubai, sharjah, [(oud, 1), (musk, 1)]).status_code == 404
+    assert transfer(client, admin, dubai, "missing", [(oud, 1)]).status_code == 404
+    assert inventory(mongo, dubai) == {oud: 3}
+    assert inventory(mongo, sharjah) == {}
+
+def test_failed_transfer_restores_the_source(client, admin, mongo):
+    dubai, sharjah = create_exhibition(client, admin), create_exhibition(client, admin, "Sharjah Expo")
+    oud = create_product(client, admin, "OUD", 20)
+    allocate(client, admin, dubai, [(oud, 10)])
+    asyncio.run(mongo.stock_movements.create_index("reason", unique=True))
+    asyncio.run(mongo.stock_movements.insert_one({"id": "earlier", "reason": "transfer_in"}))
+    with pytest.raises(BulkWriteError):
+        transfer(client, admin, dubai, sharjah, [(oud, 4)])
+    assert inventory(mongo, dubai) == {oud: 10}
+    assert inventory(mongo, sharjah) == {}
@@ -0,0 +1,69 @@
+"""Leads: capture, dedupe by normalized phone or email, conversion by a sale"""
+
+import asyncio
+
+from tests.test_checkout import create_product, seed_exhibition_stock
+
+def capture(client, headers, **lead):
+    response = client.post("/api/leads", headers=headers, json={"exhibition_id": "expo-1", "name": "Visitor", **lead})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def stats(client, headers):
+    return client.get("/api/leads/exhibition/expo-1/stats", headers=headers).json()
+
+def test_repeat_capture_updates_the_same_lead(client, admin):
+    first = capture(client, admin, phone="+971 50 123 4567", interest="oud")
+    again = capture(client, admin, phone="00971501234567", email="Guest@Example.com")
+    assert again["id"] == first["id"]
+    assert again["duplicate"] is True
+    assert again["capture_count"] == 2
+    assert again["email"] == "Guest@Example.com"
+    by_email = capture(client, admin, email=" guest@example.com ")
+    assert by_email["id"] == first["id"]
+    assert stats(client, admin) | {"conversion_rate": 0} == {
+        "exhibition_id": "expo-1", "leads": 1, "captures": 3, "converted": 0, "conversion_rate": 0
+    }
+
+def test_lead_needs_a_phone_or_an_email(client, admin):
+    response = client.post("/api/leads", headers=admin, json={"exhibition_id": "expo-1", "name": "Visitor"})
+    assert response.status_code == 400
+
+def test_batch_reports_new_duplicates_and_errors(client, admin):
+    capture(client, admin, phone="+971500000001")
+    response = client.post("/api/leads/batch", headers=admin, json={"leads": [
+        {"exhibition_id": "expo-1", "name": "A", "phone": "+971 500 000 001"},
+        {"exhibition_id": "expo-1", "name": "B", "email": "b@example.com"},
+        {"exhibition_id": "expo-1", "name": "C"},
+    ]})
+    summary = response.json()
+    assert (summary["captured"], summary["new"], summary["duplicates"]) == (2, 1, 1)
+    assert [error["row"] for error in summary["errors"]] == [2]
+
+def test_phone_and_email_of_different_leads_resolve_to_the_phone(client, admin, mongo):
+    by_phone = capture(client, admin, phone="+971500000001")
+    by_email = capture(client, admin, email="guest@example.com")
+    clash = capture(client, admin, phone="+971500000001", email="guest@example.com", interest="musk")
+    assert clash["id"] == by_phone["id"]
+    assert clash["email_lead_id"] == by_email["id"]
+    assert clash["interest"] == "musk"
+    # The email stays with the lead that had it
+    assert "email" not in clash
+    leads = asyncio.run(mongo.leads.find({}, {"_id": 0, "id": 1, "capture_count": 1}).to_list(None))
+    assert sorted(lead["capture_count"] for lead in leads) == [1, 2]
+
+def test_sale_converts_its_lead_once(client, admin, mongo):
+    lead = capture(client, admin, phone="+971500000001")
+    product = create_product(client, admin)
+    seed_exhibition_stock(mongo, product)
+    for _ in range(2):
+        response = client.post("/api/sales/enhanced", headers=admin, json={
+            "exhibition_id": "expo-1", "customer_phone": "+971 50 000 0001",
+            "items": [{"product_id": product["id"], "quantity": 1}],
+            "payments": [{"type": "cash", "amount": 105}]
+        })
+        assert response.status_code == 200, response.text
+    stored = asyncio.run(mongo.leads.find_one({"id": lead["id"]}))
+    assert stored["converted"] is True and stored["status"] == "converted"
+    assert stats(client, admin)["converted"] == 1
+    assert stats(client, admin)["conversion_rate"] == 100.0
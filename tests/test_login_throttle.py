@@ -0,0 +1,146 @@
+"""Login throttling: lockouts by username, slowdowns (never refusals) by client IP"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import audit
+import security
+import server
+from security import login_throttle
+from tests.conftest import SUPER_ADMIN, SUPER_ADMIN_PASSWORD, login
+
+@pytest.fixture
+def strict_ip_limit(monkeypatch):
+    monkeypatch.setattr(security, "LOGIN_IP_MAX_FAILURES", 3)
+    monkeypatch.setattr(security, "LOGIN_IP_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(security, "LOGIN_IP_MAX_DELAY_SECONDS", 0.1)
+
+@pytest.fixture
+def behind_proxy(monkeypatch):
+    monkeypatch.setattr(audit, "TRUSTED_PROXY_HOPS", 1)
+
+def fail_login(client, username, headers=None):
+    response = client.post("/api/auth/login", json={"username": username, "password": "wrong"}, headers=headers)
+    assert response.status_code in (401, 429)
+    return response
+
+def create_users(client, headers, count):
+    for i in range(count):
+        response = client.post("/api/users", headers=headers, json={
+            "username": f"cashier{i}", "email": f"cashier{i}@example.com", "full_name": f"Cashier {i}",
+            "password": "till-pass", "role": "cashier"
+        })
+        assert response.status_code == 200, response.text
+    return [f"cashier{i}" for i in range(count)]
+
+def test_username_lockout_refuses_even_valid_credentials(client):
+    for _ in range(security.LOGIN_USER_MAX_FAILURES):
+        fail_login(client, SUPER_ADMIN)
+    response = client.post("/api/auth/login", json={"username": SUPER_ADMIN, "password": SUPER_ADMIN_PASSWORD})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_locked_ip_slows_but_never_refuses_valid_credentials(client, strict_ip_limit):
+    for i in range(5):
+        fail_login(client, f"guess{i}")
+    assert login_throttle.ip_delay("testclient") > 0
+    started = time.perf_counter()
+    login(client)
+    assert time.perf_counter() - started >= 0.05
+
+def test_attempts_past_the_waiting_places_get_retry_after(client, strict_ip_limit, monkeypatch):
+    monkeypatch.setattr(security, "LOGIN_IP_MAX_WAITING", 1)
+    for i in range(5):
+        fail_login(client, f"guess{i}")
+    assert login_throttle.hold("testclient")
+    try:
+        response = client.post("/api/auth/login", json={"username": SUPER_ADMIN, "password": SUPER_ADMIN_PASSWORD})
+    finally:
+        login_throttle.unhold("testclient")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert not login_throttle.waiting
+    login(client)
+
+def test_forwarded_for_keys_the_ip_bucket_by_real_client(client, strict_ip_limit, behind_proxy):
+    attacker = {"X-Forwarded-For": "10.0.0.1, 203.0.113.7"}
+    for i in range(5):
+        fail_login(client, f"guess{i}", headers=attacker)
+    assert login_throttle.ip_delay("203.0.113.7") > 0
+    # The spoofable left-hand entry and the proxy's own address are not penalised
+    assert login_throttle.ip_delay("10.0.0.1") == 0
+    assert login_throttle.ip_delay("testclient") == 0
+    login(client, headers={"X-Forwarded-For": "198.51.100.20"})
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(client):
+    for i in range(3):
+        fail_login(client, f"guess{i}", headers={"X-Forwarded-For": "203.0.113.7"})
+    assert "ip:203.0.113.7" not in login_throttle.failures.counts
+    assert "ip:testclient" in login_throttle.failures.counts
+
+def p99(samples):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+async def legitimate_logins(http, usernames, rounds):
+    latencies = []
+
+    async def user_session(i, username):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            response = await http.post("/api/auth/login", json={"username": username, "password": "till-pass"},
+                                       headers={"X-Forwarded-For": f"198.51.100.{i + 1}"})
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+
+    await asyncio.gather(*(user_session(i, username) for i, username in enumerate(usernames)))
+    return latencies
+
+async def brute_force(http, stop: asyncio.Event, concurrency: int, spray: bool = False):
+    attempts = 0
+
+    async def attacker(i):
+        nonlocal attempts
+        while not stop.is_set():
+            # One account locks almost at once; a spray of usernames never does
+            username = f"user-{attempts}" if spray else SUPER_ADMIN
+            await http.post("/api/auth/login", json={"username": username, "password": f"guess-{attempts}"},
+                            headers={"X-Forwarded-For": f"203.0.113.{i % 4 + 1}"})
+            attempts += 1
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(attacker(i) for i in range(concurrency)))
+    return attempts
+
+def measure_under_attack(client, usernames, spray: bool, warmup: float):
+    async def measure():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pos") as http:
+            baseline = await legitimate_logins(http, usernames, rounds=25)
+            stop = asyncio.Event()
+            attack = asyncio.create_task(brute_force(http, stop, concurrency=32, spray=spray))
+            await asyncio.sleep(warmup)
+            under_attack = await legitimate_logins(http, usernames, rounds=25)
+            stop.set()
+            attempts = await attack
+        return baseline, under_attack, attempts
+
+    # Run on the app's own loop, where its background tasks live
+    baseline, under_attack, attempts = client.portal.call(measure)
+    # The attack kept going for the whole measurement, not just its first moments
+    assert attempts > len(under_attack) // 2
+    assert p99(under_attack) <= max(2 * p99(baseline), p99(baseline) + 0.05), (p99(baseline), p99(under_attack))
+
+def test_brute_force_does_not_move_legitimate_p99(client, admin, behind_proxy):
+    measure_under_attack(client, create_users(client, admin, 8), spray=False, warmup=0.05)
+
+def test_username_spray_does_not_move_legitimate_p99(client, admin, behind_proxy, monkeypatch):
+    # Distinct usernames never lock an account, so every attempt lands on the
+    # slowed-down IP path; the delays are shortened to keep the test quick
+    monkeypatch.setattr(security, "LOGIN_IP_DELAY_SECONDS", 0.1)
+    monkeypatch.setattr(security, "LOGIN_IP_MAX_DELAY_SECONDS", 0.4)
+    measure_under_attack(client, create_users(client, admin, 8), spray=True, warmup=0.5)
+    assert all(login_throttle.ip_delay(f"203.0.113.{i}") > 0 for i in range(1, 5))
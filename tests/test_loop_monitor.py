@@ -0,0 +1,70 @@
+"""Loop monitor: lag samples, and stalls blamed on the frame that blocked the loop"""
+
+import asyncio
+import os
+import time
+import traceback
+
+from loop_monitor import BACKEND_DIR, LOOP_TOP_OFFENDERS, LoopMonitor, blame_frame
+
+def blocking_call(seconds):
+    time.sleep(seconds)  # A sync driver call or CPU-bound work on the loop thread
+
+def stack(*frames):
+    return traceback.StackSummary.from_list([(filename, line, name, "") for filename, line, name in frames])
+
+def test_stall_is_detected_and_blamed():
+    async def scenario():
+        monitor = LoopMonitor(threshold=0.05, heartbeat=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_call(0.25)
+        await asyncio.sleep(0.05)
+        during = monitor.metrics()
+        await monitor.stop()
+        return monitor, during
+
+    monitor, metrics = asyncio.run(scenario())
+    assert metrics["enabled"] and not monitor.metrics()["enabled"]
+    assert metrics["stalls"] == 1
+    assert metrics["lag_ms"]["max"] >= 200
+    assert metrics["lag_ms"]["p50"] < 50
+    offender, = metrics["offenders"]
+    assert offender["frame"].endswith(" blocking_call")
+    assert offender["count"] == 1 and offender["max_ms"] >= 200
+    assert any("time.sleep(seconds)" in line for line in offender["stack"])
+
+def test_short_waits_are_not_stalls():
+    async def scenario():
+        monitor = LoopMonitor(threshold=0.2, heartbeat=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        blocking_call(0.03)
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return monitor.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["stalls"] == 0 and metrics["offenders"] == []
+    assert metrics["lag_ms"]["max"] >= 20
+
+def test_blame_prefers_our_own_code():
+    ours = os.path.join(BACKEND_DIR, "routers", "analytics.py")
+    blamed = blame_frame(stack(("asyncio/events.py", 80, "_run"), (ours, 120, "dashboard_stats"),
+                               ("pymongo/network.py", 300, "receive_message")))
+    assert (blamed.name, blamed.lineno) == ("dashboard_stats", 120)
+    assert blame_frame(stack(("asyncio/events.py", 80, "_run"), ("json/encoder.py", 10, "encode"))).name == "encode"
+
+def test_offender_table_stays_bounded():
+    monitor = LoopMonitor(threshold=0.1, heartbeat=0.05)
+    for line in range(LOOP_TOP_OFFENDERS * 10):
+        monitor.record_stall(0.1 + line / 1000, stack((os.path.join(BACKEND_DIR, "pricing.py"), line, "load")))
+    assert len(monitor.offenders) <= LOOP_TOP_OFFENDERS * 5
+    top = monitor.metrics()["offenders"]
+    assert len(top) == LOOP_TOP_OFFENDERS
+    assert top[0]["frame"] == f"pricing.py:{LOOP_TOP_OFFENDERS * 10 - 1} load"
+
+def test_metrics_route(client, admin):
+    response = client.get("/api/metrics/loop", headers=admin)
+    assert response.status_code == 200
+    assert set(response.json()) == {"enabled", "threshold_ms", "lag_ms", "stalls", "offenders"}
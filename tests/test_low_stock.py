@@ -0,0 +1,114 @@
+"""Low stock flags kept on every stock write, and alerts pushed only on the crossing"""
+
+import asyncio
+
+from routers.inventory import stream_low_stock_alerts
+from stock import LowStockNotifier, crossed_low_stock, low_stock_notifier
+
+def create_product(client, headers, stock, min_stock_level):
+    response = client.post("/api/products", headers=headers, json={
+        "name": "Oud Royale", "description": "50ml", "category": "perfume", "price": 100.0,
+        "sku": "OUD-50", "stock_quantity": stock, "min_stock_level": min_stock_level
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def seed_exhibition_stock(mongo, product, quantity, min_stock_level):
+    asyncio.run(mongo.inventory.insert_one({
+        "id": "inv-1", "exhibition_id": "expo-1", "product_id": product["id"],
+        "product_name": product["name"], "product_price": product["price"],
+        "allocated_quantity": quantity, "sold_quantity": 0, "remaining_quantity": quantity,
+        "min_stock_level": min_stock_level, "is_low_stock": False
+    }))
+
+def sell(client, headers, product, quantity):
+    response = client.post("/api/sales/enhanced", headers=headers, json={
+        "exhibition_id": "expo-1", "items": [{"product_id": product["id"], "quantity": quantity}],
+        "payments": [{"type": "cash", "amount": 105 * quantity}]
+    })
+    assert response.status_code == 200, response.text
+
+def drain(queue):
+    alerts = []
+    while not queue.empty():
+        alerts.append(queue.get_nowait())
+    return alerts
+
+def test_crossing_is_detected_once():
+    assert crossed_low_stock(quantity=5, min_stock_level=5, decrement=1)
+    assert crossed_low_stock(quantity=0, min_stock_level=5, decrement=8)
+    assert not crossed_low_stock(quantity=6, min_stock_level=5, decrement=1)
+    assert not crossed_low_stock(quantity=4, min_stock_level=5, decrement=1)
+
+def test_sale_flags_exhibition_stock_and_alerts_on_the_crossing(client, admin, mongo):
+    product = create_product(client, admin, stock=50, min_stock_level=10)
+    seed_exhibition_stock(mongo, product, quantity=10, min_stock_level=5)
+    queue = low_stock_notifier.subscribe()
+    try:
+        sell(client, admin, product, 4)
+        assert drain(queue) == []
+        sell(client, admin, product, 2)
+        alerts = drain(queue)
+        sell(client, admin, product, 1)
+        assert drain(queue) == []
+    finally:
+        low_stock_notifier.unsubscribe(queue)
+
+    assert alerts == [{
+        "scope": "exhibition", "exhibition_id": "expo-1", "product_id": product["id"],
+        "product_name": "Oud Royale", "quantity": 4, "min_stock_level": 5
+    }]
+    listed = client.get("/api/alerts/low-stock", headers=admin, params={"exhibition_id": "expo-1"}).json()
+    assert [(alert["product_id"], alert["quantity"]) for alert in listed] == [(product["id"], 3)]
+
+def test_allocation_flags_the_warehouse(client, admin, mongo):
+    product = create_product(client, admin, stock=14, min_stock_level=10)
+    assert client.get("/api/alerts/low-stock", headers=admin).json() == []
+    exhibition = client.post("/api/exhibitions", headers=admin, json={
+        "name": "Dubai Shopping Festival", "location": "Dubai Mall",
+        "start_date": "2026-11-01T09:00:00", "end_date": "2026-11-30T22:00:00"
+    }).json()["id"]
+    queue = low_stock_notifier.subscribe()
+    try:
+        response = client.post(f"/api/inventory/exhibition/{exhibition}/allocate", headers=admin, json={
+            "items": [{"product_id": product["id"], "quantity": 6}]
+        })
+        assert response.status_code == 200, response.text
+        alerts = drain(queue)
+    finally:
+        low_stock_notifier.unsubscribe(queue)
+    assert [(alert["scope"], alert["quantity"]) for alert in alerts] == [("warehouse", 8)]
+    listed = client.get("/api/alerts/low-stock", headers=admin).json()
+    assert [alert["product_id"] for alert in listed] == [product["id"]]
+
+def test_slow_subscriber_does_not_block_publish():
+    notifier = LowStockNotifier(queue_size=1)
+    slow, fast = notifier.subscribe(), notifier.subscribe()
+    notifier.publish([{"product_id": "a"}])
+    assert fast.get_nowait() == {"product_id": "a"}
+    notifier.publish([{"product_id": "b"}, {"product_id": "c"}])
+    assert [slow.get_nowait()] == [{"product_id": "a"}] and slow.empty()
+    notifier.unsubscribe(slow)
+    notifier.publish([{"product_id": "d"}])
+    assert slow.empty()
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+def test_stream_sends_published_alerts_as_events():
+    async def scenario():
+        response = await stream_low_stock_alerts(ConnectedRequest(), current_user=None)
+        events = response.body_iterator
+        first = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0)
+        assert len(low_stock_notifier.subscribers) == 1
+        low_stock_notifier.publish([{"product_id": "a"}])
+        chunk = await asyncio.wait_for(first, timeout=1)
+        await events.aclose()
+        return response.headers["content-type"], chunk
+
+    content_type, chunk = asyncio.run(scenario())
+    assert content_type.startswith("text/event-stream")
+    assert chunk == b'event: low_stock\ndata: {"product_id":"a"}\n\n'
+    assert not low_stock_notifier.subscribers
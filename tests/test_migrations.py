@@ -0,0 +1,91 @@
+"""Migration ledger: leases, takeover of a dead worker's claim, waiting for a live one"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import migrations
+
+@pytest.fixture
+def ledger(mongo, monkeypatch):
+    ran = []
+
+    def step(name):
+        async def migrate():
+            await asyncio.sleep(0)
+            ran.append(name)
+        return migrate
+
+    monkeypatch.setattr(migrations, "migrations", lambda: [(name, step(name)) for name in ("0001_a", "0002_b")])
+    monkeypatch.setattr(migrations, "MIGRATION_POLL_SECONDS", 0.01)
+    return ran
+
+def entry(mongo, name):
+    return asyncio.run(mongo.migrations.find_one({"_id": name}))
+
+def hold(mongo, name, lease_until):
+    asyncio.run(mongo.migrations.insert_one({
+        "_id": name, "status": "running", "owner": "other-worker",
+        "started_at": datetime.utcnow() - timedelta(minutes=5), "lease_until": lease_until
+    }))
+
+def test_applies_pending_migrations_once(mongo, ledger):
+    assert asyncio.run(migrations.run_migrations()) == ["0001_a", "0002_b"]
+    assert asyncio.run(migrations.run_migrations()) == []
+    assert ledger == ["0001_a", "0002_b"]
+    assert entry(mongo, "0001_a")["status"] == "applied"
+
+def test_takes_over_a_claim_whose_lease_expired(mongo, ledger):
+    hold(mongo, "0001_a", datetime.utcnow() - timedelta(seconds=1))
+    assert asyncio.run(migrations.run_migrations()) == ["0001_a", "0002_b"]
+    assert entry(mongo, "0001_a")["owner"] == migrations.WORKER_ID
+
+def test_takes_over_a_claim_from_before_leases(mongo, ledger):
+    asyncio.run(mongo.migrations.insert_one({"_id": "0001_a", "status": "running", "started_at": datetime.utcnow()}))
+    assert asyncio.run(migrations.run_migrations()) == ["0001_a", "0002_b"]
+
+def test_waits_for_a_live_claim_to_finish(mongo, ledger):
+    hold(mongo, "0001_a", datetime.utcnow() + timedelta(seconds=30))
+
+    async def scenario():
+        waiting = asyncio.create_task(migrations.run_migrations())
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        await mongo.migrations.update_one({"_id": "0001_a"}, {"$set": {"status": "applied"}})
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(scenario()) == ["0002_b"]
+    assert ledger == ["0002_b"]
+
+def test_gives_up_waiting_after_the_timeout(mongo, ledger, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATION_WAIT_SECONDS", 0.05)
+    hold(mongo, "0001_a", datetime.utcnow() + timedelta(seconds=30))
+    with pytest.raises(RuntimeError, match="0001_a"):
+        asyncio.run(migrations.run_migrations())
+    assert ledger == []
+
+def test_failed_migration_releases_its_claim(mongo, monkeypatch):
+    async def broken():
+        raise ValueError("backfill failed")
+
+    monkeypatch.setattr(migrations, "migrations", lambda: [("0001_broken", broken)])
+    with pytest.raises(ValueError):
+        asyncio.run(migrations.run_migrations())
+    assert entry(mongo, "0001_broken") is None
+
+def test_stock_snapshots_start_from_existing_inventory(mongo):
+    from stock import derive_stock_levels
+
+    asyncio.run(mongo.inventory.insert_many([
+        {"exhibition_id": "expo-1", "product_id": "p1", "remaining_quantity": 12},
+        {"exhibition_id": "expo-1", "product_id": "p2", "remaining_quantity": 0},
+        {"exhibition_id": "expo-2", "product_id": "p1", "remaining_quantity": 4},
+    ]))
+    asyncio.run(migrations.seed_stock_snapshots())
+    asyncio.run(mongo.stock_movements.insert_one({
+        "exhibition_id": "expo-1", "product_id": "p1", "quantity_delta": -2,
+        "created_at": datetime.utcnow() + timedelta(seconds=1)
+    }))
+    assert asyncio.run(derive_stock_levels("expo-1")) == {"p1": 10, "p2": 0}
+    assert asyncio.run(derive_stock_levels("expo-2")) == {"p1": 4}
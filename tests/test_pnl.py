@@ -0,0 +1,36 @@
+"""P&L: venue-local day ranges bound sales by created_at before anything else"""
+
+import asyncio
+from datetime import datetime
+
+from routers.analytics import pnl_pipeline
+from rollups import bump_pnl_rollup, local_day_start
+
+def test_local_days_bound_created_at_in_the_first_match():
+    first = pnl_pipeline(None, "2026-03-01", "2026-03-02")[0]
+    # Asia/Dubai is UTC+4: 1 March starts at 20:00 UTC on 28 February
+    assert first == {"$match": {"created_at": {
+        "$gte": datetime(2026, 2, 28, 20, 0), "$lt": datetime(2026, 3, 2, 20, 0)
+    }}}
+    assert local_day_start("2026-03-02", days_after=1) == datetime(2026, 3, 2, 20, 0)
+
+def test_range_keeps_exactly_the_sales_of_its_local_days(mongo):
+    asyncio.run(mongo.enhanced_sales.insert_many([
+        {"exhibition_id": "expo-1", "created_at": moment, "total_amount": 105.0, "tax_amount": 5.0}
+        for moment in (datetime(2026, 2, 28, 19, 59), datetime(2026, 2, 28, 20, 0), datetime(2026, 3, 2, 19, 59),
+                       datetime(2026, 3, 2, 20, 0))
+    ]))
+    # $unionWith and $dateToString timezones are beyond the in-memory Mongo;
+    # the leading $match is what the range governs
+    rows = asyncio.run(mongo.enhanced_sales.aggregate(pnl_pipeline("expo-1", "2026-03-01", "2026-03-02")[:1]).to_list(None))
+    assert sorted(row["created_at"] for row in rows) == [datetime(2026, 2, 28, 20, 0), datetime(2026, 3, 2, 19, 59)]
+
+def test_malformed_days_are_rejected(client, admin):
+    response = client.get("/api/expenses/pnl", headers=admin, params={"start": "March"})
+    assert response.status_code == 400
+
+def test_bumps_stamp_the_day_for_a_running_rebuild(mongo):
+    before = datetime.utcnow().replace(microsecond=0)
+    asyncio.run(bump_pnl_rollup("expo-1", "2026-03-01", revenue=100.0, sales=1))
+    row = asyncio.run(mongo.pnl_daily.find_one({"exhibition_id": "expo-1", "day": "2026-03-01"}))
+    assert row["revenue"] == 100.0 and row["updated_at"] >= before
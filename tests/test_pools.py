@@ -0,0 +1,63 @@
+"""Checkout and back-office work read through separate connection pools"""
+
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+
+class UnavailableClient:
+    """A back-office pool that is exhausted or down: any use of it fails"""
+
+    def __getitem__(self, name):
+        return self
+
+    def __getattr__(self, name):
+        raise RuntimeError("back-office pool used")
+
+    def close(self):
+        pass
+
+def create_product(client, headers):
+    response = client.post("/api/products", headers=headers, json={
+        "name": "Oud Royale", "description": "50ml", "category": "perfume",
+        "price": 100.0, "sku": "OUD-50", "stock_quantity": 10
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_checkout_never_touches_the_back_office_pool(client, admin, mongo, caplog):
+    product = create_product(client, admin)
+    asyncio.run(mongo.inventory.insert_one({
+        "id": "inv-1", "exhibition_id": "expo-1", "product_id": product["id"],
+        "product_name": product["name"], "product_price": product["price"],
+        "allocated_quantity": 5, "sold_quantity": 0, "remaining_quantity": 5, "min_stock_level": 1
+    }))
+    database.backoffice_db.use(UnavailableClient())
+
+    response = client.post("/api/sales/enhanced", headers=admin, json={
+        "exhibition_id": "expo-1", "customer_phone": "+971501234567",
+        "items": [{"product_id": product["id"], "quantity": 1}],
+        "payments": [{"type": "cash", "amount": 105}]
+    })
+    assert response.status_code == 200, response.text
+    # Derived writes (rollups, customer profile, audit) swallow errors: none were logged
+    assert not [record for record in caplog.records if "update failed" in record.getMessage()]
+    assert client.get("/api/products", headers=admin).status_code == 200
+    with pytest.raises(RuntimeError, match="back-office pool"):
+        client.get("/api/sales/exhibition/expo-1", headers=admin)
+
+def test_back_office_reads_use_their_own_pool(client, admin, mongo):
+    create_product(client, admin)
+    # A back-office pool pointed at another server sees only what that server holds
+    other = AsyncMongoMockClient()[mongo.name]
+    database.backoffice_db.use(other.client, mongo.name)
+    asyncio.run(other.enhanced_sales.insert_one({
+        "id": "sale-1", "sale_number": "EXH-1", "exhibition_id": "expo-1", "total_amount": 315.0
+    }))
+
+    sales = client.get("/api/sales/exhibition/expo-1", headers=admin).json()
+    assert [sale["id"] for sale in sales] == ["sale-1"]
+    exported = client.get("/api/products/export", headers=admin, params={"format": "jsonl"})
+    assert exported.status_code == 200 and exported.text == ""
@@ -0,0 +1,99 @@
+"""Price book: one shared catalog snapshot, per-booth prices, background refresh"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from models import UserRole
+from pricing import MAX_DISCOUNT_PERCENT, PriceBook, check_discount
+
+async def seed(mongo):
+    await mongo.products.insert_many([
+        {"id": "oud", "name": "Oud", "price": 100.0, "variations": [{"name": "Size", "value": "L", "price_adjustment": 20.0}]},
+        {"id": "musk", "name": "Musk", "price": 50.0, "variations": []},
+    ])
+    await mongo.inventory.insert_one({"exhibition_id": "dubai", "product_id": "oud", "product_name": "Oud (Dubai)", "product_price": 90.0})
+
+def count_catalog_loads(book, monkeypatch):
+    loads = []
+    original = book.catalog.load
+
+    async def counted():
+        loads.append(1)
+        return await original()
+
+    monkeypatch.setattr(book.catalog, "load", counted)
+    return loads
+
+def test_catalog_is_loaded_once_for_all_exhibitions(mongo, monkeypatch):
+    async def scenario():
+        await seed(mongo)
+        book = PriceBook(60)
+        loads = count_catalog_loads(book, monkeypatch)
+        dubai = await book.get("dubai")
+        riyadh = await book.get("riyadh")
+        assert len(loads) == 1
+        # Booth price and name override the catalog; variation adjustments carry over
+        assert dubai.get("oud")["price"] == 90.0
+        assert dubai.get("oud")["name"] == "Oud (Dubai)"
+        assert dubai.get("oud")["adjustments"] == {("Size", "L"): 20.0}
+        assert riyadh.get("oud")["price"] == 100.0
+        assert "musk" in dubai and "missing" not in dubai
+
+    asyncio.run(scenario())
+
+def test_expired_catalog_is_served_stale_while_it_reloads(mongo, monkeypatch):
+    async def scenario():
+        await seed(mongo)
+        book = PriceBook(0.05)
+        loads = count_catalog_loads(book, monkeypatch)
+        await book.get("dubai")
+        await mongo.products.update_one({"id": "musk"}, {"$set": {"price": 55.0}})
+        await asyncio.sleep(0.06)
+        stale = await book.get("dubai")
+        assert stale.get("musk")["price"] == 50.0
+        await book.catalog.task
+        assert len(loads) == 2
+        assert (await book.get("dubai")).get("musk")["price"] == 55.0
+
+    asyncio.run(scenario())
+
+def test_invalidated_catalog_is_reloaded_before_use(mongo):
+    async def scenario():
+        await seed(mongo)
+        book = PriceBook(60)
+        await book.get("dubai")
+        await mongo.products.update_one({"id": "musk"}, {"$set": {"price": 55.0}})
+        book.invalidate()
+        assert (await book.get("dubai")).get("musk")["price"] == 55.0
+        await mongo.inventory.update_one({"product_id": "oud"}, {"$set": {"product_price": 95.0}})
+        book.invalidate("dubai")
+        assert (await book.get("dubai")).get("oud")["price"] == 95.0
+
+    asyncio.run(scenario())
+
+def test_inventory_role_has_its_own_discount_limit(monkeypatch):
+    monkeypatch.setitem(MAX_DISCOUNT_PERCENT, UserRole.INVENTORY, 5.0)
+    entry = {"name": "Oud"}
+    check_discount(entry, 100.0, 93.0, UserRole.CASHIER)
+    with pytest.raises(HTTPException) as error:
+        check_discount(entry, 100.0, 93.0, UserRole.INVENTORY)
+    assert error.value.status_code == 403
+
+def test_booth_snapshots_are_bounded_least_recently_used_first(mongo):
+    async def scenario():
+        await seed(mongo)
+        book = PriceBook(60, max_booths=2)
+        await book.get("dubai")
+        await book.get("riyadh")
+        await book.get("dubai")
+        for i in range(50):
+            await book.get(f"made-up-{i}")
+        assert len(book.booths) == 2
+        await book.get("dubai")
+        await book.get("doha")
+        assert list(book.booths) == ["dubai", "doha"]
+        assert (await book.get("dubai")).get("oud")["price"] == 90.0
+
+    asyncio.run(scenario())
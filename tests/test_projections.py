@@ -0,0 +1,88 @@
+"""Bytes moved from Mongo per request, with each route's projection against
+the whole documents the routes used to read"""
+
+import asyncio
+from datetime import datetime
+
+import bson
+import mongomock.collection
+import pytest
+
+import security
+from tests.conftest import login
+
+@pytest.fixture
+def reads(monkeypatch):
+    """(collection, filter, projection, limit) of every find/find_one the app makes"""
+    recorded = []
+    find, find_one = mongomock.collection.Collection.find, mongomock.collection.Collection.find_one
+
+    def spy_find(self, filter=None, projection=None, *args, **kwargs):
+        recorded.append((self, filter, kwargs.get("projection", projection), 0))
+        return find(self, filter, projection, *args, **kwargs)
+
+    def spy_find_one(self, filter=None, *args, **kwargs):
+        recorded.append((self, filter, kwargs.get("projection", args[0] if args else None), 1))
+        return find_one(self, filter, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", spy_find)
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one", spy_find_one)
+    return recorded
+
+def bytes_moved(reads, collection: str, projected: bool) -> int:
+    total = 0
+    for coll, query, projection, limit in list(reads):
+        if coll.name != collection:
+            continue
+        cursor = coll.find(query, projection if projected else None)
+        total += sum(len(bson.encode(doc)) for doc in (cursor.limit(limit) if limit else cursor))
+    return total
+
+def seed(mongo):
+    now = datetime.utcnow()
+    products = [{
+        "id": f"p{i}", "name": f"Perfume {i}", "description": "Eau de parfum " * 20, "category": "perfume",
+        "price": 100.0, "cost_price": 40.0, "barcode": f"62900{i:05d}", "sku": f"SKU-{i}",
+        "images": ["data:image/jpeg;base64," + "A" * 20000],
+        "variations": [{"name": "Size", "value": f"{size}ml", "price_adjustment": size / 10, "stock_quantity": 5}
+                       for size in (30, 50, 100)],
+        "stock_quantity": 40, "min_stock_level": 10, "is_low_stock": False, "status": "active",
+        "tags": ["oud"], "created_by": "seed", "created_at": now, "updated_at": now
+    } for i in range(50)]
+    sales = [{
+        "id": f"s{i}", "sale_number": f"SALE-{i}", "exhibition_id": "expo-1", "cashier_id": "c", "cashier_name": "C",
+        "customer_name": "Guest", "customer_phone": "+971500000000",
+        "items": [{"product_id": f"p{j}", "product_name": f"Perfume {j}", "quantity": 1, "unit_price": 100.0,
+                   "total_price": 100.0, "variation_selection": {"Size": "50ml"}} for j in range(12)],
+        "subtotal": 1200.0, "tax_amount": 60.0, "total_amount": 1260.0, "change_given": 0.0,
+        "payments": [{"type": "card", "amount": 1260.0}], "created_at": now
+    } for i in range(200)]
+    asyncio.run(mongo.products.insert_many(products))
+    asyncio.run(mongo.enhanced_sales.insert_many(sales))
+
+def test_product_list_leaves_images_and_variations_in_mongo(client, admin, mongo, reads):
+    seed(mongo)
+    reads.clear()
+    response = client.get("/api/products")
+    assert response.status_code == 200 and len(response.json()) == 50
+    after, before = bytes_moved(reads, "products", True), bytes_moved(reads, "products", False)
+    assert after < before / 10, (after, before)
+
+def test_exhibition_sales_leave_line_items_in_mongo(client, admin, mongo, reads):
+    seed(mongo)
+    reads.clear()
+    response = client.get("/api/sales/exhibition/expo-1", headers=admin)
+    assert response.status_code == 200 and len(response.json()) == 200
+    after, before = bytes_moved(reads, "enhanced_sales", True), bytes_moved(reads, "enhanced_sales", False)
+    assert after < before / 5, (after, before)
+
+def test_lookup_auth_reads_only_authorization_fields(client, mongo, reads, monkeypatch):
+    monkeypatch.setattr(security, "AUTH_MODE", "lookup")
+    headers = login(client)
+    reads.clear()
+    assert client.get("/api/exhibitions", headers=headers).status_code == 200
+    user_reads = [read for read in reads if read[0].name == "users"]
+    assert user_reads and all(read[2] for read in user_reads)
+    after, before = bytes_moved(reads, "users", True), bytes_moved(reads, "users", False)
+    assert after < before, (after, before)
+    assert not any("password_hash" in read[2] for read in user_reads)
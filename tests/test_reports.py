@@ -0,0 +1,80 @@
+"""Background report jobs: a full queue must not leave a job behind, and a
+job whose worker died is neither served as cached nor left unrun"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from routers.analytics import report_workers
+
+REPORT = {"report_type": "season_pnl", "exhibition_id": "expo-1"}
+
+@pytest.fixture
+def full_queue(client, monkeypatch):
+    queue = asyncio.Queue(maxsize=1)
+    queue.put_nowait("earlier-job")
+    monkeypatch.setattr(report_workers, "queue", queue)
+    return queue
+
+def jobs(mongo):
+    return asyncio.run(mongo.report_jobs.count_documents({}))
+
+def test_full_queue_rejects_before_creating_a_job(client, admin, mongo, full_queue):
+    response = client.post("/api/reports", headers=admin, json=REPORT)
+    assert response.status_code == 503
+    assert jobs(mongo) == 0
+
+def test_queue_filling_after_insert_removes_the_job(client, admin, mongo, full_queue, monkeypatch):
+    # The queue fills between the capacity check and the submit
+    monkeypatch.setattr(report_workers, "check_capacity", lambda: None)
+    response = client.post("/api/reports", headers=admin, json=REPORT)
+    assert response.status_code == 503
+    assert jobs(mongo) == 0
+
+    full_queue.get_nowait()
+    response = client.post("/api/reports", headers=admin, json=REPORT)
+    assert response.status_code == 200
+    assert response.json()["cached"] is False
+
+def orphan(mongo, client, admin, status="running", minutes_silent=10):
+    """A job for REPORT whose worker stopped renewing its heartbeat"""
+    response = client.post("/api/reports", headers=admin, json=REPORT)
+    assert response.status_code == 200
+    job_id = response.json()["id"]
+    asyncio.run(mongo.report_jobs.update_one({"id": job_id}, {"$set": {
+        "status": status, "heartbeat_at": datetime.utcnow() - timedelta(minutes=minutes_silent)
+    }}))
+    return job_id
+
+@pytest.fixture
+def idle_workers(client, monkeypatch):
+    # Jobs stay where a test puts them: nothing drains the queue
+    monkeypatch.setattr(report_workers, "queue", asyncio.Queue(maxsize=10))
+
+def test_live_job_is_served_as_cached(client, admin, mongo, idle_workers):
+    first = client.post("/api/reports", headers=admin, json=REPORT).json()
+    second = client.post("/api/reports", headers=admin, json=REPORT).json()
+    assert second["cached"] is True and second["id"] == first["id"]
+
+def test_orphaned_job_is_not_served_as_cached(client, admin, mongo, idle_workers):
+    job_id = orphan(mongo, client, admin)
+    response = client.post("/api/reports", headers=admin, json=REPORT)
+    assert response.json()["cached"] is False
+    assert response.json()["id"] != job_id
+
+def test_sweep_takes_over_orphaned_jobs(client, admin, mongo, idle_workers):
+    job_id = orphan(mongo, client, admin, status="running")
+    assert client.portal.call(report_workers.sweep) == 1
+    job = asyncio.run(mongo.report_jobs.find_one({"id": job_id}))
+    assert job["status"] == "queued"
+    assert job["heartbeat_at"] > datetime.utcnow() - timedelta(seconds=5)
+    assert job_id in report_workers.held
+    assert client.portal.call(report_workers.sweep) == 0
+
+def test_heartbeat_keeps_held_jobs_fresh(client, admin, mongo, idle_workers):
+    job_id = orphan(mongo, client, admin, status="queued", minutes_silent=1)
+    report_workers.held.add(job_id)
+    client.portal.call(report_workers.heartbeat)
+    job = asyncio.run(mongo.report_jobs.find_one({"id": job_id}))
+    assert job["heartbeat_at"] > datetime.utcnow() - timedelta(seconds=5)
@@ -0,0 +1,48 @@
+"""Deployment profiles: a node imports and serves only its routers"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import routers
+from routers import PROFILES, selected_routers
+
+BACKEND_DIR = os.path.dirname(routers.__file__).rsplit(os.sep, 1)[0]
+
+def test_profile_selects_its_routers(monkeypatch):
+    monkeypatch.delenv("SERVER_ROUTERS", raising=False)
+    monkeypatch.delenv("SERVER_PROFILE", raising=False)
+    assert selected_routers() == PROFILES["full"]
+    monkeypatch.setenv("SERVER_PROFILE", "checkout")
+    assert selected_routers() == ["auth", "catalog", "pos", "inventory"]
+    monkeypatch.setenv("SERVER_ROUTERS", " auth, pos ,")
+    assert selected_routers() == ["auth", "pos"]
+
+def test_unknown_names_are_refused(monkeypatch):
+    monkeypatch.setenv("SERVER_ROUTERS", "auth,reports")
+    with pytest.raises(ValueError, match="reports"):
+        selected_routers()
+    monkeypatch.delenv("SERVER_ROUTERS")
+    monkeypatch.setenv("SERVER_PROFILE", "kiosk")
+    with pytest.raises(ValueError, match="kiosk"):
+        selected_routers()
+
+def test_checkout_node_never_imports_back_office_routers():
+    script = (
+        "import json, sys, server\n"
+        "print(json.dumps({'modules': sorted(m for m in sys.modules if m.startswith('routers.')),"
+        " 'paths': sorted({route.path for route in server.app.routes})}))"
+    )
+    env = {**os.environ, "SERVER_PROFILE": "checkout"}
+    env.pop("SERVER_ROUTERS", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    assert loaded["modules"] == ["routers.auth", "routers.catalog", "routers.inventory", "routers.pos"]
+    assert "/api/sales/enhanced" in loaded["paths"]
+    assert "/api/analytics/dashboard" not in loaded["paths"]
+    assert "/api/users" not in loaded["paths"]
@@ -0,0 +1,132 @@
+"""Single-flight: identical concurrent reads share one query, and its outcome"""
+
+import asyncio
+
+import httpx
+
+import server
+from database import SingleFlight, single_flight
+from routers import catalog
+
+class SlowQuery:
+    """A query held open until released, counting how often it really runs"""
+
+    def __init__(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+def test_concurrent_identical_reads_share_one_query():
+    async def scenario():
+        flights = SingleFlight()
+        query = SlowQuery(result=[{"id": "p1"}])
+        callers = [asyncio.ensure_future(flights.do("products", ("perfume",), query)) for _ in range(10)]
+        await asyncio.sleep(0)
+        query.release.set()
+        results = await asyncio.gather(*callers)
+        return flights, query, results
+
+    flights, query, results = asyncio.run(scenario())
+    assert query.runs == 1
+    assert all(result is results[0] for result in results)
+    assert flights.metrics()["products"] == {"calls": 10, "executions": 1, "coalesced": 9, "coalescing_ratio": 0.9}
+    assert not flights.flights
+
+def test_error_reaches_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+        query = SlowQuery(error=RuntimeError("primary stepped down"))
+        callers = [asyncio.ensure_future(flights.do("dashboard", None, query)) for _ in range(5)]
+        await asyncio.sleep(0)
+        query.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+        # The failure is not remembered: the next read queries again
+        retry = SlowQuery(result="fresh")
+        retry.release.set()
+        return query, outcomes, await flights.do("dashboard", None, retry), retry
+
+    query, outcomes, fresh, retry = asyncio.run(scenario())
+    assert query.runs == 1 and retry.runs == 1
+    assert all(isinstance(outcome, RuntimeError) and str(outcome) == "primary stepped down" for outcome in outcomes)
+    assert fresh == "fresh"
+
+def test_different_keys_do_not_share():
+    async def scenario():
+        flights = SingleFlight()
+        perfume, oud = SlowQuery(result="perfume"), SlowQuery(result="oud")
+        callers = [flights.do("products", ("perfume",), perfume), flights.do("products", ("oud",), oud)]
+        tasks = [asyncio.ensure_future(caller) for caller in callers]
+        await asyncio.sleep(0)
+        perfume.release.set()
+        oud.release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == ["perfume", "oud"]
+
+def test_caller_that_goes_away_does_not_cancel_the_others():
+    async def scenario():
+        flights = SingleFlight()
+        query = SlowQuery(result="rows")
+        leaving = asyncio.ensure_future(flights.do("products", None, query))
+        staying = asyncio.ensure_future(flights.do("products", None, query))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        query.release.set()
+        return await staying, leaving.cancelled()
+
+    assert asyncio.run(scenario()) == ("rows", True)
+
+def test_concurrent_product_listings_run_one_query(client, admin, monkeypatch):
+    client.post("/api/products", headers=admin, json={
+        "name": "Oud Royale", "description": "50ml", "category": "perfume",
+        "price": 100.0, "sku": "OUD-50", "stock_quantity": 10
+    })
+    monkeypatch.setattr(single_flight, "stats", {})
+    find = catalog.db.products.find
+    finds = []
+
+    class SlowCursor:
+        def __init__(self, cursor):
+            self.cursor = cursor
+
+        def skip(self, count):
+            return SlowCursor(self.cursor.skip(count))
+
+        def limit(self, count):
+            return SlowCursor(self.cursor.limit(count))
+
+        async def to_list(self, length):
+            # Held open until every request has joined the flight (or gave up trying)
+            for _ in range(1000):
+                if single_flight.stats["products"][0] >= 8:
+                    break
+                await asyncio.sleep(0.01)
+            return await self.cursor.to_list(length)
+
+    class Products:
+        def find(self, *args, **kwargs):
+            finds.append(args)
+            return SlowCursor(find(*args, **kwargs))
+
+    monkeypatch.setattr(catalog, "db", type("Db", (), {"products": Products()})())
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pos") as http:
+            return await asyncio.gather(*[
+                http.get("/api/products", headers=admin, params={"category": "perfume"}) for _ in range(8)
+            ])
+
+    responses = client.portal.call(scenario)
+    assert {response.status_code for response in responses} == {200}
+    assert all(response.content == responses[0].content for response in responses)
+    assert len(finds) == 1
+    assert single_flight.metrics()["products"]["coalesced"] == 7
@@ -0,0 +1,163 @@
+"""Tracing: traceparent propagation and sampling, span nesting and overhead"""
+
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import httpx
+from fastapi import Depends, FastAPI
+
+import tracing
+from tracing import (
+    KIND_CLIENT, KIND_SERVER, STATUS_ERROR, MongoCommandTracer, Span, TracingMiddleware,
+    current_span, parse_traceparent, span, traced
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+@traced("auth.get_current_user")
+async def current_user():
+    return "cashier"
+
+def traced_app(sample_rate):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str, user: str = Depends(current_user)):
+        with span("serialize", items=1):
+            return {"id": item_id, "user": user}
+
+    @app.get("/broken")
+    async def broken():
+        raise RuntimeError("primary stepped down")
+
+    return TracingMiddleware(app, sample_rate)
+
+def call(app, path, headers=None, times=1):
+    async def run():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pos") as http:
+            return [await http.get(path, headers=headers) for _ in range(times)]
+
+    return asyncio.run(run())
+
+def collected(monkeypatch):
+    spans = deque()
+    monkeypatch.setattr(tracing.exporter, "spans", spans)
+    return spans
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01".encode()) == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00".encode()) == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(b"00-short-id-01") is None
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-zz".encode()) is None
+
+def test_sampled_traceparent_continues_the_callers_trace(monkeypatch):
+    spans = collected(monkeypatch)
+    # The caller's decision wins over a local rate of zero
+    call(traced_app(0.0), "/items/p1", {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+    by_name = {item.name: item for item in spans}
+    assert set(by_name) == {"GET /items/{item_id}", "auth.get_current_user", "serialize"}
+    server = by_name["GET /items/{item_id}"]
+    assert (server.trace_id, server.parent_id, server.kind) == (TRACE_ID, PARENT_ID, KIND_SERVER)
+    assert server.attributes["http.route"] == "/items/{item_id}"
+    assert server.attributes["http.status_code"] == 200
+    for child in (by_name["auth.get_current_user"], by_name["serialize"]):
+        assert (child.trace_id, child.parent_id) == (TRACE_ID, server.span_id)
+        assert server.start_ns <= child.start_ns <= child.end_ns <= server.end_ns
+    assert by_name["serialize"].to_otlp()["attributes"] == [{"key": "items", "value": {"intValue": "1"}}]
+
+def test_unsampled_traceparent_is_respected(monkeypatch):
+    spans = collected(monkeypatch)
+    call(traced_app(1.0), "/items/p1", {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+    assert not spans
+
+def test_local_sampling_without_a_traceparent(monkeypatch):
+    spans = collected(monkeypatch)
+    call(traced_app(0.0), "/items/p1", times=5)
+    assert not spans
+    call(traced_app(1.0), "/items/p1", times=2)
+    servers = [item for item in spans if item.kind == KIND_SERVER]
+    assert len(servers) == 2
+    assert servers[0].trace_id != servers[1].trace_id and servers[0].parent_id is None
+
+def test_server_errors_mark_the_span(monkeypatch):
+    spans = collected(monkeypatch)
+    call(traced_app(1.0), "/broken")
+    server, = spans
+    assert server.to_otlp()["status"] == {"code": STATUS_ERROR, "message": "RuntimeError: primary stepped down"}
+
+def command(name, request_id, **fields):
+    return SimpleNamespace(command_name=name, database_name="pos", request_id=request_id, connection_id=("db", 27017),
+                           command={name: "products", **fields}, failure={"errmsg": "not primary"})
+
+def test_mongo_commands_become_children_of_the_request_span(monkeypatch):
+    spans = collected(monkeypatch)
+    tracer = MongoCommandTracer()
+    request = Span(TRACE_ID, None, "GET /api/products", KIND_SERVER)
+    token = current_span.set(request)
+    try:
+        tracer.started(command("find", 1))
+        tracer.started(command("insert", 2))
+        tracer.succeeded(command("find", 1))
+        tracer.failed(command("insert", 2))
+    finally:
+        current_span.reset(token)
+    # Commands outside a sampled request are not traced
+    tracer.started(command("find", 3))
+    tracer.succeeded(command("find", 3))
+
+    find, insert = spans
+    assert not tracer.open
+    assert [(item.name, item.kind, item.trace_id, item.parent_id) for item in spans] == [
+        ("mongo.find", KIND_CLIENT, TRACE_ID, request.span_id),
+        ("mongo.insert", KIND_CLIENT, TRACE_ID, request.span_id),
+    ]
+    assert find.attributes == {"db.system": "mongodb", "db.name": "pos", "db.operation": "find",
+                               "db.mongodb.collection": "products"}
+    assert find.error is None and insert.error == "not primary"
+
+async def plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def per_request(app, rounds=500):
+    scope = {"type": "http", "method": "GET", "path": "/api/products",
+             "headers": [(b"host", b"pos"), (b"accept", b"application/json")]}
+
+    async def send(message):
+        pass
+
+    async def run():
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await app(dict(scope), None, send)
+        return (time.perf_counter() - started) / rounds
+
+    return asyncio.run(run())
+
+def test_tracing_overhead_with_sampling_on_and_off(monkeypatch):
+    collected(monkeypatch)
+    variants = {"untraced": plain_app, "unsampled": TracingMiddleware(plain_app, 0.0),
+                "sampled": TracingMiddleware(plain_app, 1.0)}
+    best = dict.fromkeys(variants, float("inf"))
+    # Interleaved, best of several rounds, so drift on a busy machine hits every variant
+    for _ in range(20):
+        for name, app in variants.items():
+            best[name] = min(best[name], per_request(app))
+    print("\nper request: " + ", ".join(f"{name} {seconds * 1e6:.1f}us" for name, seconds in best.items()))
+    # Unsampled requests pay for the header scan and coin flip only
+    assert best["unsampled"] - best["untraced"] < 10e-6
+    assert best["sampled"] - best["untraced"] < 100e-6
+
+    # Spans opened outside a sampled request cost a context lookup
+    fastest = float("inf")
+    for _ in range(20):
+        started = time.perf_counter()
+        for _ in range(5000):
+            with span("serialize"):
+                pass
+        fastest = min(fastest, (time.perf_counter() - started) / 5000)
+    assert fastest < 2e-6